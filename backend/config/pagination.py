@@ -0,0 +1,175 @@
+"""
+Pagination for the API.
+
+``DefaultPagination`` keeps DRF's page-number mode as the default (the
+frontend relies on it) and switches to keyset pagination when the client
+passes ``?pagination=cursor`` or follows a ``cursor`` link. Keyset pages
+seek on ``(ordering field, id)`` instead of using OFFSET, and never run
+COUNT(*), so deep pages cost the same as the first one.
+
+``EstimatedCountPaginator`` is for admin changelists over big tables.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field, self.descending = self.get_ordering(queryset, request, view)
+        model_field = queryset.model._meta.get_field(self.field)
+
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}pk')
+
+        position = self.decode_cursor(request, model_field)
+        if position is not None:
+            value, pk = position
+            op = 'lt' if self.descending else 'gt'
+            # The leading non-strict bound keeps the predicate sargable for
+            # an index on (field, id); the OR breaks ties on the same value.
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{op}e': value}),
+                Q(**{f'{self.field}__{op}': value}) | Q(**{f'pk__{op}': pk}),
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = None
+        if self.has_next:
+            last = rows[-1]
+            if isinstance(last, dict):
+                # A values() row: just enough of an instance for value_to_string
+                pk_name = queryset.model._meta.pk.attname
+                last = queryset.model(**{name: last[name] for name in (self.field, pk_name)})
+            self.next_position = (model_field.value_to_string(last), last.pk)
+        return rows
+
+    def get_ordering(self, queryset, request, view):
+        """(field name, descending) from ?ordering=, limited to the view's ordering_fields."""
+        default = (queryset.model._meta.ordering or ['-pk'])[0]
+        allowed = set(getattr(view, 'ordering_fields', None) or [default.lstrip('-')])
+        requested = request.query_params.get(self.ordering_query_param, '')
+        term = requested.split(',')[0].strip() or default
+        if term.lstrip('-') not in allowed:
+            term = default
+        return term.lstrip('-'), term.startswith('-')
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, request, model_field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return model_field.to_python(value), int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class DefaultPagination(PageNumberPagination):
+    """Page numbers by default, keyset pagination on request."""
+    mode_query_param = 'pagination'
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.use_keyset(request) else None
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for an unfiltered queryset's table, or
+    None when the queryset is filtered or no statistics exist."""
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Kept current by autovacuum's ANALYZE; -1 if never analyzed
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # Written by ANALYZE; the first number of a stat is the row count
+            try:
+                cursor.execute('SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            except DatabaseError:
+                return None  # never analyzed
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips COUNT(*) on an unfiltered changelist once the
+    table holds more than ``ADMIN_ESTIMATED_COUNT_THRESHOLD`` rows (0
+    turns estimates off), reporting the database's statistics instead.
+    Filtered changelists and small tables get exact counts.
+    """
+
+    @cached_property
+    def count(self):
+        threshold = settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        if threshold and hasattr(self.object_list, 'query'):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,81 @@
+"""
+JSON rendering and parsing with orjson, when it is installed.
+
+``ORJSONRenderer`` produces the same bytes as DRF's ``JSONRenderer`` for
+the API's payloads: datetimes, decimals and lazy strings still go through
+DRF's encoder, and U+2028 / U+2029 are escaped the same way. Anything
+orjson cannot do that way falls back to the stdlib path, as does
+everything when orjson is missing: indented output for the browsable
+API, ``UNICODE_JSON`` off, integers beyond 64 bits, and decimals whose
+float Python writes with an exponent (1e+16, where orjson writes 1e16)
+or refuses (NaN, Infinity).
+
+Plain ``float`` values are not checked: finding them in a large payload
+costs more than orjson saves. Where Python writes them without an
+exponent the bytes are the same; beyond that orjson writes 1e16 or
+0.00001, and ``null`` for NaN and Infinity where ``JSONRenderer``
+raises. No API payload carries floats of its own.
+"""
+import math
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # DRF's encoder formats these differently from orjson
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+def plain_float(value):
+    """Whether Python writes ``value`` without an exponent, as orjson does."""
+    return value == 0 or (math.isfinite(value) and 1e-4 <= abs(value) < 1e16)
+
+
+class ORJSONRenderer(JSONRenderer):
+    @cached_property
+    def encoder(self):
+        return self.encoder_class()
+
+    def default(self, obj):
+        value = self.encoder.default(obj)
+        # Decimals come back as floats for orjson to write
+        if isinstance(value, float) and not plain_float(value):
+            raise TypeError(f'{value!r} is left to the stdlib encoder')
+        return value
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer does, to stay a strict JavaScript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8' or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from corsheaders.defaults import default_headers
 import dj_database_url
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +50,7 @@ INSTALLED_APPS = [
     # Local apps
     'products',
     'orders',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -104,6 +107,46 @@ else:
         }
         }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Take the write lock when a transaction starts. Checkout reads stock
+    # before writing it, and SQLite fails such lock upgrades at once with
+    # "database is locked" instead of waiting when two requests overlap.
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+
+
+
+# Cache
+# Must be shared by every process: web workers and job workers bump the
+# catalog version that all of them read. The default is a directory in the
+# system temp dir, which the processes of one machine share; with several
+# machines set CACHE_BACKEND to django.core.cache.backends.redis.RedisCache
+# (and CACHE_LOCATION to redis://...). LocMemCache is per process and only
+# fits a single process.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'sneakr-cache')),
+    }
+}
+
+# Seconds a cached catalog response lives; writes invalidate it earlier
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds an order Idempotency-Key is remembered; purge_idempotency_keys
+# deletes expired ones
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+
+# Above this many rows, the unfiltered order changelist shows the database's
+# row estimate instead of running COUNT(*); 0 always counts exactly
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# Dotted path of the function that downloads image_url images for their
+# placeholder metadata: url -> bytes
+IMAGE_FETCHER = config('IMAGE_FETCHER', default='products.images.fetch_url')
+
+# Build product and order list responses straight from values() rows
+# instead of through their serializers; the output is the same
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=True, cast=bool)
 
 
 # Password validation
@@ -163,10 +206,23 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
+
 # REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'config.pagination.DefaultPagination',
     'PAGE_SIZE': 20,
+    # orjson when installed, the same bytes as DRF's JSON classes either way
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
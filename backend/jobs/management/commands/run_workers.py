@@ -0,0 +1,78 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from jobs.queue import queue_stats, requeue_stale, run_batch
+
+
+def work(batch_size, poll_interval, once, stop):
+    """Worker process loop: run batches until told to stop (or, with
+    ``once``, until nothing is ready)."""
+    last_requeue = 0
+    while not stop.is_set():
+        if time.monotonic() - last_requeue > 60:
+            requeue_stale()
+            last_requeue = time.monotonic()
+        processed = run_batch(batch_size)
+        close_old_connections()
+        if not processed:
+            if once:
+                break
+            stop.wait(poll_interval)
+    connections.close_all()
+
+
+def child(*args):
+    # The parent turns Ctrl-C and SIGTERM into a stop request
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    work(*args)
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers, or print queue depth with --stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes to start')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per query')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is ready')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in queue_stats().items():
+                self.stdout.write(f'{name}: {value:g}')
+            return
+
+        stop = multiprocessing.Event()
+        args = (options['batch_size'], options['poll_interval'], options['once'], stop)
+        if options['processes'] == 1:
+            # Finish the current batch on SIGTERM/Ctrl-C, then exit
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            signal.signal(signal.SIGINT, lambda *_: stop.set())
+            work(*args)
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=child, args=args, daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {len(workers)} workers')
+
+        # Finish the current batch on SIGTERM/Ctrl-C, then exit
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
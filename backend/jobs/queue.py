@@ -0,0 +1,135 @@
+"""
+A small job queue stored in the ``jobs_job`` table.
+
+Tasks are plain functions registered with ``@task`` in an app's
+``tasks.py``. ``enqueue`` inserts a row in the caller's transaction, so a
+job exists exactly when the data it refers to was committed. Workers
+(``manage.py run_workers``) claim ready jobs in batches with ``SELECT ...
+FOR UPDATE SKIP LOCKED``, so any number of them can poll the same table
+without handing a job out twice and without a broker service. Finished
+jobs are deleted; failing ones are retried with exponential backoff and
+kept as 'failed' once out of attempts.
+
+SQLite has no row locks; there each claim is simply serialised by the
+database write lock.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# A job still 'running' this long after it was claimed belongs to a worker
+# that died; it is queued again
+LEASE = timedelta(minutes=10)
+BACKOFF_BASE = 5        # seconds before the first retry
+BACKOFF_MAX = 60 * 60   # never wait longer than an hour between attempts
+
+registry = {}
+
+
+def task(func):
+    """Register ``func`` under '<module>.<name>' so it can be enqueued."""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    registry[func.task_name] = func
+    return func
+
+
+def enqueue(func, delay=None, max_attempts=5, **payload):
+    """Queue ``func(**payload)``; ``payload`` must be JSON serialisable."""
+    name = func if isinstance(func, str) else func.task_name
+    if name not in registry:
+        raise KeyError(f'Unknown task {name!r}')
+    run_at = timezone.now() + (delay or timedelta())
+    return Job.objects.create(name=name, payload=payload, run_at=run_at, max_attempts=max_attempts)
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    # Jitter so jobs that failed together don't all retry together
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(batch_size):
+    """Mark up to ``batch_size`` ready jobs as running and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=now)
+            .order_by('run_at', 'id')[:batch_size]
+        )
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status='running', locked_at=now, attempts=F('attempts') + 1
+            )
+    for job in jobs:
+        job.status, job.locked_at, job.attempts = 'running', now, job.attempts + 1
+    return jobs
+
+
+def run_job(job):
+    """Run one claimed job; returns True if it succeeded."""
+    try:
+        func = registry[job.name]
+        with transaction.atomic():
+            func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed, attempt %s of %s', job.pk, job.name, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status='failed', locked_at=None, last_error=error)
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', locked_at=None, last_error=error,
+                run_at=timezone.now() + backoff(job.attempts),
+            )
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def run_batch(batch_size=10):
+    """Claim and run one batch; returns the number of jobs processed."""
+    jobs = claim(batch_size)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def requeue_stale():
+    """Queue again jobs whose worker died while running them; returns how
+    many. Those out of attempts fail instead: a job that keeps killing its
+    worker (out of memory, say) would otherwise be retried forever."""
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - LEASE)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_at=None, last_error='Worker died while running the job',
+    )
+    if failed:
+        logger.warning('%s stale job(s) out of attempts marked failed', failed)
+    return stale.update(status='queued', locked_at=None, run_at=now)
+
+
+def queue_stats():
+    """Job counts by status, plus how many are ready and how long the oldest has waited."""
+    counts = dict(Job.objects.order_by().values_list('status').annotate(count=Count('pk')))
+    now = timezone.now()
+    ready = Job.objects.filter(status='queued', run_at__lte=now).aggregate(
+        count=Count('pk'), oldest=Min('run_at')
+    )
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'failed': counts.get('failed', 0),
+        'ready': ready['count'],
+        'oldest_ready_seconds': (now - ready['oldest']).total_seconds() if ready['oldest'] else 0,
+    }
@@ -0,0 +1,146 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from products.models import Brand, Product, ProductSize
+from .models import Job
+from .queue import claim, enqueue, queue_stats, requeue_stale, run_batch, task
+
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_once_and_is_deleted(self):
+        enqueue(record, value=1)
+        enqueue(record, value=2)
+        self.assertEqual(run_batch(), 2)
+        self.assertEqual(calls, [1, 2])
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(run_batch(), 0)
+
+    def test_unknown_task_rejected(self):
+        with self.assertRaises(KeyError):
+            enqueue('nowhere.task')
+
+    def test_claim_respects_batch_size_and_run_at(self):
+        for value in range(5):
+            enqueue(record, value=value)
+        enqueue(record, delay=timedelta(hours=1), value='later')
+        self.assertEqual(len(claim(3)), 3)
+        self.assertEqual(len(claim(3)), 2)
+        self.assertEqual(claim(3), [])
+
+    def test_failure_backs_off_then_gives_up(self):
+        job = enqueue(explode, max_attempts=2)
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_batch()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        # Not ready again until the backoff has passed
+        self.assertEqual(run_batch(), 0)
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_batch()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(run_batch(), 0)
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue(record, value=1)
+        claim(1)
+        self.assertEqual(requeue_stale(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        run_batch()
+        self.assertEqual(calls, [1])
+
+    def test_stale_job_out_of_attempts_fails(self):
+        enqueue(record, value=1)
+        claim(1)
+        Job.objects.update(attempts=F('max_attempts'), locked_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(requeue_stale(), 0)
+        job = Job.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Worker died', job.last_error)
+        self.assertEqual(run_batch(), 0)
+
+    def test_stats(self):
+        enqueue(record, value=1)
+        enqueue(record, delay=timedelta(hours=1), value=2)
+        stats = queue_stats()
+        self.assertEqual((stats['queued'], stats['ready'], stats['running'], stats['failed']), (2, 1, 0, 0))
+        out = StringIO()
+        call_command('run_workers', stats=True, stdout=out)
+        self.assertIn('ready: 1', out.getvalue())
+
+    def test_run_workers_once(self):
+        for value in range(25):
+            enqueue(record, value=value)
+        call_command('run_workers', processes=1, once=True, batch_size=10)
+        self.assertEqual(sorted(calls), list(range(25)))
+
+
+class OrderJobTests(TestCase):
+    def test_order_placed_job_refreshes_stock_totals(self):
+        product = Product.objects.create(
+            name='Air Max 90', brand=Brand.objects.get_or_create(name='Nike')[0], price=1000000, category='men',
+            description_uz='Tavsif', description_ru='Описание',
+        )
+        ProductSize.objects.create(product=product, size=40, stock=3)
+        ProductSize.objects.create(product=product, size=41, stock=4)
+        response = self.client.post(reverse('order-list'), {
+            'customer_name': 'Test Customer',
+            'customer_phone': '+998901234567',
+            'total_amount': 1000000,
+            'items': [{'product_id': product.pk, 'size': 40, 'quantity': 1, 'price': 1000000}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.payload), ('orders.tasks.order_placed', {'order_id': response.data['id']}))
+
+        with self.assertLogs('orders.tasks', 'INFO') as logs:
+            run_batch()
+        self.assertIn(f"Order #{response.data['id']} placed", logs.output[0])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 6)
+
+    def test_cancel_queues_stock_refresh(self):
+        product = Product.objects.create(
+            name='Air Max 90', brand=Brand.objects.get_or_create(name='Nike')[0], price=1000000, category='men',
+            description_uz='Tavsif', description_ru='Описание',
+        )
+        ProductSize.objects.create(product=product, size=40, stock=1)
+        order_id = self.client.post(reverse('order-list'), {
+            'customer_name': 'Test Customer',
+            'customer_phone': '+998901234567',
+            'total_amount': 1000000,
+            'items': [{'product_id': product.pk, 'size': 40, 'quantity': 1, 'price': 1000000}],
+        }, content_type='application/json').data['id']
+        with self.assertLogs('orders.tasks', 'INFO'):
+            run_batch()
+        self.client.post(reverse('order-update-status', args=[order_id]), {'status': 'cancelled'})
+        run_batch()
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 1)
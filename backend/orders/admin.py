@@ -1,19 +1,34 @@
-from django.contrib import admin
-from django.utils.html import format_html
-from django.db.models import Sum, Count
+from django.contrib import admin, messages
+from django.utils.html import format_html, format_html_join
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from config.pagination import EstimatedCountPaginator
 from .models import Order, OrderItem
+from .stock import set_order_status
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ['product', 'price', 'subtotal_display']
-    fields = ['product', 'size', 'quantity', 'price', 'subtotal_display']
+    readonly_fields = ['product_name', 'price', 'subtotal_display']
+    fields = ['product_name', 'size', 'quantity', 'price', 'subtotal_display']
     can_delete = False
     
+    def get_readonly_fields(self, request, obj=None):
+        # Lines of an order holding stock only change through checkout;
+        # editing them here would leave the reservation behind
+        if obj is not None and obj.stock_reserved:
+            return [*self.readonly_fields, 'size', 'quantity']
+        return self.readonly_fields
+    
+    def has_add_permission(self, request, obj=None):
+        if obj is not None and obj.stock_reserved:
+            return False
+        return super().has_add_permission(request, obj)
+    
     def subtotal_display(self, obj):
         if obj.id:
-            return format_html('<strong>{:,.0f}</strong> UZS', float(obj.get_subtotal()))
+            return format_html('<strong>{}</strong> UZS', f'{float(obj.get_subtotal()):,.0f}')
         return '-'
     subtotal_display.short_description = 'Subtotal'
 
@@ -37,6 +52,10 @@ class OrderAdmin(admin.ModelAdmin):
     ]
     date_hierarchy = 'created_at'
     list_per_page = 25
+    # No second COUNT(*) for the unfiltered total, and an estimate instead
+    # of the first one once the table is large
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     save_on_top = True
     
     fieldsets = (
@@ -65,6 +84,17 @@ class OrderAdmin(admin.ModelAdmin):
         'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled'
     ]
     
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Line and pair counts for the whole page in the changelist query.
+        # Subqueries rather than a join: set_order_status locks this
+        # queryset with SELECT ... FOR UPDATE, which GROUP BY rules out
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        return qs.annotate(
+            items_total=Coalesce(Subquery(items.annotate(count=Count('pk')).values('count')), 0),
+            quantity_total=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+        )
+    
     def status_badge(self, obj):
         colors = {
             'pending': '#fbbf24',     # yellow
@@ -82,9 +112,10 @@ class OrderAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def items_count(self, obj):
-        count = obj.items.count()
+        count = obj.items_total if hasattr(obj, 'items_total') else obj.items.count()
         return format_html('<strong>{}</strong> items', count)
     items_count.short_description = 'Items'
+    items_count.admin_order_field = 'items_total'
     
     def total_amount_display(self, obj):
         amount = f'{float(obj.total_amount):,.0f}'
@@ -96,9 +127,10 @@ class OrderAdmin(admin.ModelAdmin):
     total_amount_display.admin_order_field = 'total_amount'
     
     def total_items(self, obj):
-        total = obj.items.aggregate(
-            total_quantity=Sum('quantity')
-        )['total_quantity'] or 0
+        if hasattr(obj, 'quantity_total'):
+            total = obj.quantity_total
+        else:
+            total = obj.items.aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
         return format_html('<strong>{}</strong> items total', total)
     total_items.short_description = 'Total Quantity'
     
@@ -106,17 +138,25 @@ class OrderAdmin(admin.ModelAdmin):
         if not obj.id:
             return '-'
         
-        items_html = ''
-        for item in obj.items.all():
-            items_html += f'''
+        # One query on the lines' own columns; the product snapshot means
+        # no join to the catalog. format_html_join escapes every value.
+        items = obj.items.order_by('id').values_list('product_name', 'size', 'quantity', 'price')
+        items_html = format_html_join(
+            '',
+            '''
                 <tr>
-                    <td style="padding: 8px;">{item.product.name}</td>
-                    <td style="padding: 8px;">Size {item.size}</td>
-                    <td style="padding: 8px; text-align: center;">{item.quantity}</td>
-                    <td style="padding: 8px; text-align: right;">{float(item.price):,.0f} UZS</td>
-                    <td style="padding: 8px; text-align: right; font-weight: bold;">{float(item.get_subtotal()):,.0f} UZS</td>
+                    <td style="padding: 8px;">{}</td>
+                    <td style="padding: 8px;">Size {}</td>
+                    <td style="padding: 8px; text-align: center;">{}</td>
+                    <td style="padding: 8px; text-align: right;">{} UZS</td>
+                    <td style="padding: 8px; text-align: right; font-weight: bold;">{} UZS</td>
                 </tr>
-            '''
+            ''',
+            (
+                (name, size, quantity, f'{float(price):,.0f}', f'{float(quantity * price):,.0f}')
+                for name, size, quantity, price in items
+            )
+        )
         
         return format_html(
             '''
@@ -137,38 +177,58 @@ class OrderAdmin(admin.ModelAdmin):
                     <tfoot>
                         <tr style="background: #e5e7eb; font-weight: bold;">
                             <td colspan="4" style="padding: 8px; text-align: right;">TOTAL:</td>
-                            <td style="padding: 8px; text-align: right; color: #10b981;">{:,.0f} UZS</td>
+                            <td style="padding: 8px; text-align: right; color: #10b981;">{} UZS</td>
                         </tr>
                     </tfoot>
                 </table>
             </div>
             ''',
-            items_html, float(obj.total_amount)
+            items_html, f'{float(obj.total_amount):,.0f}'
         )
     order_summary.short_description = 'Order Summary'
     
     # Bulk Actions
+    def set_status(self, request, queryset, new_status):
+        # Goes through set_order_status so cancelling returns stock
+        updated, failed = set_order_status(queryset, new_status)
+        self.message_user(request, f'{updated} orders marked as {new_status}.')
+        self.report_stock_failures(request, failed)
+    
+    def report_stock_failures(self, request, failed):
+        if failed:
+            ids = ', '.join(f'#{pk}' for pk in sorted(failed))
+            self.message_user(
+                request, f'Not enough stock to re-open cancelled orders {ids}.', messages.ERROR
+            )
+    
+    def save_model(self, request, obj, form, change):
+        if not change or 'status' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        # Save the other fields under the old status, then move it with
+        # the matching stock adjustment
+        new_status = obj.status
+        obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        _, failed = set_order_status(Order.objects.filter(pk=obj.pk), new_status)
+        self.report_stock_failures(request, failed)
+        obj.refresh_from_db()
+    
     def mark_as_pending(self, request, queryset):
-        updated = queryset.update(status='pending')
-        self.message_user(request, f'{updated} orders marked as pending.')
+        self.set_status(request, queryset, 'pending')
     mark_as_pending.short_description = 'Mark as Pending'
     
     def mark_as_processing(self, request, queryset):
-        updated = queryset.update(status='processing')
-        self.message_user(request, f'{updated} orders marked as processing.')
+        self.set_status(request, queryset, 'processing')
     mark_as_processing.short_description = 'Mark as Processing'
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='shipped')
-        self.message_user(request, f'{updated} orders marked as shipped.')
+        self.set_status(request, queryset, 'shipped')
     mark_as_shipped.short_description = 'Mark as Shipped'
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
-        self.message_user(request, f'{updated} orders marked as delivered.')
+        self.set_status(request, queryset, 'delivered')
     mark_as_delivered.short_description = 'Mark as Delivered'
     
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
-        self.message_user(request, f'{updated} orders marked as cancelled.')
+        self.set_status(request, queryset, 'cancelled')
     mark_as_cancelled.short_description = 'Mark as Cancelled'
@@ -0,0 +1,50 @@
+"""
+Async order intake for the ASGI deployment (see ``config/asgi.py``).
+
+The request body is received and the response sent on the event loop,
+so a client on a slow connection costs a coroutine rather than a worker.
+Placing the order (stock reservation, INSERTs, Idempotency-Key) must be
+one transaction, which the async ORM cannot open, so that part hops to
+Django's sync thread once via ``sync_to_async``. Payloads, status codes
+and headers match ``POST /api/orders/``.
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from products.async_views import error_response, json_response
+from .idempotency import REPLAYED_HEADER, idempotent
+from .serializers import OrderCreateSerializer
+
+
+def place_order(request):
+    serializer = OrderCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+def place_order_once(request):
+    try:
+        return idempotent(request, lambda: place_order(request))
+    except APIException as exc:
+        return Response(exc.detail, status=exc.status_code)
+
+
+@csrf_exempt
+@require_POST
+async def order_create(request):
+    request = Request(request, parsers=[JSONParser()])
+    try:
+        request.data
+    except APIException as exc:
+        return error_response(exc)
+    response = await sync_to_async(place_order_once)(request)
+    headers = {REPLAYED_HEADER: response[REPLAYED_HEADER]} if response.has_header(REPLAYED_HEADER) else None
+    return json_response(response.data, status=response.status_code, headers=headers)
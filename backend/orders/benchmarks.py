@@ -0,0 +1,86 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+These seed synthetic data straight through ``bulk_create`` and time
+callables; they are meant for a scratch database, never production.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Brand, Product, ProductSize
+from .models import Order, OrderItem
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at values we set instead of now()."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def bench_product():
+    product, _ = Product.objects.get_or_create(
+        name='Benchmark Runner', brand=Brand.objects.get_or_create(name='Bench')[0],
+        defaults={
+            'price': 1000000, 'category': 'unisex',
+            'description_uz': 'Benchmark', 'description_ru': 'Benchmark',
+        },
+    )
+    # Enough stock that reservations never reject a benchmark order
+    for size in range(39, 47):
+        ProductSize.objects.update_or_create(
+            product=product, size=size, defaults={'stock': 10 ** 9, 'is_available': True},
+        )
+    return product
+
+
+def seed_orders(total, batch_size=10000, items_per_order=0, stdout=None):
+    """Top the orders table up to ``total`` rows, one minute apart."""
+    existing = Order.objects.count()
+    product = bench_product() if items_per_order else None
+    start = timezone.now() - timedelta(minutes=total)
+    created = existing
+    with explicit_timestamps(Order):
+        while created < total:
+            count = min(batch_size, total - created)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(
+                        customer_name=f'Customer {created + n}',
+                        customer_phone='+998900000000',
+                        total_amount=1000000,
+                        created_at=start + timedelta(minutes=created + n),
+                    )
+                    for n in range(count)
+                ])
+                if items_per_order:
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product=product, size=40 + n, quantity=1, price=1000000)
+                        for order in orders
+                        for n in range(items_per_order)
+                    ])
+            created += count
+            if stdout:
+                stdout.write(f'  seeded {created}/{total} orders')
+    return created - existing
+
+
+def timed(func, repeat=5):
+    """Median wall time of ``func`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
@@ -0,0 +1,93 @@
+"""
+``Idempotency-Key`` handling for order creation.
+
+The key row is inserted in the same transaction as the order it guards.
+A retry that arrives while the first request is still running blocks on
+the unique index until that transaction finishes, then either replays
+the committed response or, if the first attempt rolled back, runs the
+request itself. Only successful creations are remembered: a request
+rejected with 4xx leaves no row behind, so fixing the cart and retrying
+with the same key works.
+
+A key reused with a different body is refused with 422.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request body.'
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotencyKeyBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed; retry shortly.'
+    default_code = 'idempotency_key_busy'
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(request, perform):
+    """
+    Return ``perform()`` (a Response), or the stored response of an earlier
+    request carrying the same Idempotency-Key.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return perform()
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({HEADER: 'Ensure this header has no more than 255 characters.'})
+    digest = request_hash(request)
+
+    # Two rounds at most: the second only follows an expired key or a
+    # conflicting attempt that rolled back before we could read it
+    for _ in range(2):
+        claimed = False
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key, request_hash=digest,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+                claimed = True
+                response = perform()
+                if response.status_code >= 400:
+                    transaction.set_rollback(True)
+                    return response
+                record.status_code = response.status_code
+                record.response = response.data
+                record.save(update_fields=['status_code', 'response'])
+            response[REPLAYED_HEADER] = 'false'
+            return response
+        except IntegrityError:
+            if claimed:
+                raise
+        stored = IdempotencyKey.objects.filter(key=key).first()
+        if stored is None:
+            continue
+        if stored.expires_at <= timezone.now():
+            IdempotencyKey.objects.filter(pk=stored.pk, expires_at__lte=timezone.now()).delete()
+            continue
+        if stored.request_hash != digest:
+            raise IdempotencyKeyReused()
+        return Response(stored.response, status=stored.status_code, headers={REPLAYED_HEADER: 'true'})
+    raise IdempotencyKeyBusy()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Copy product name, brand and image onto order lines placed before snapshots existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = (
+            OrderItem.objects.filter(product_name='', product__isnull=False)
+            .select_related('product__brand').order_by('pk')
+        )
+        last_pk = 0
+        updated = 0
+        while True:
+            # Walk the primary key so each batch is a short index range scan
+            batch = list(pending.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            for item in batch:
+                item.snapshot_product(item.product)
+            with transaction.atomic():
+                OrderItem.objects.bulk_update(
+                    batch, ['product_name', 'product_brand', 'product_image_url']
+                )
+            last_pk = batch[-1].pk
+            updated += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Snapshotted {updated} order items'))
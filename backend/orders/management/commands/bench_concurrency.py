@@ -0,0 +1,97 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+from orders.benchmarks import bench_product
+
+
+async def http_request(host, port, method, path, body=b'', trickle=0.0, timeout=60):
+    """One HTTP/1.1 request over a fresh connection; the body is sent in
+    ten pieces spread over ``trickle`` seconds, like a client on a bad
+    mobile network. Returns (status or None on failure, seconds)."""
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(host, port)
+            head = (
+                f'{method} {path} HTTP/1.1\r\nHost: {host}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'
+            )
+            writer.write(head.encode())
+            pieces = 10 if trickle and body else 1
+            step = -(-len(body) // pieces) or 1
+            for offset in range(0, len(body), step):
+                writer.write(body[offset:offset + step])
+                await writer.drain()
+                if trickle:
+                    await asyncio.sleep(trickle / pieces)
+            status_line = await reader.readline()
+            await reader.read()
+            writer.close()
+        return int(status_line.split()[1]), time.perf_counter() - started
+    except (OSError, IndexError, ValueError, TimeoutError):
+        return None, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold N slow order POSTs open against a running server and measure how '
+        'fast it still answers a probe request; run once against the WSGI '
+        'stack and once against the ASGI stack on the same instance size'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to load')
+        parser.add_argument('--path', default='/api/orders/', help='Order endpoint (/api/async/orders/ on ASGI)')
+        parser.add_argument('--probe-path', default='/api/products/?page=1')
+        parser.add_argument('--connections', type=int, nargs='+', default=[8, 32, 128])
+        parser.add_argument('--trickle', type=float, default=2.0, help='Seconds each client takes to send its body')
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        product = bench_product()
+        body = json.dumps({
+            'customer_name': 'Load Test',
+            'customer_phone': '+998900000000',
+            'total_amount': 1000000,
+            'items': [{'product_id': product.pk, 'size': 42, 'quantity': 1, 'price': '1000000.00'}],
+        }).encode()
+        url = urlsplit(options['url'])
+        target = (url.hostname, url.port or 80)
+
+        self.stdout.write(
+            f'{"conns":>6} {"created":>8} {"failed":>7} {"order p50 s":>12} {"order p99 s":>12} '
+            f'{"probes":>7} {"probe p50 ms":>13} {"probe p99 ms":>13}'
+        )
+        for connections in options['connections']:
+            orders, probes = asyncio.run(self.load(target, body, connections, options))
+            created = [seconds for status, seconds in orders if status == 201]
+            probe_ms = [seconds * 1000 for status, seconds in probes if status == 200]
+            self.stdout.write(
+                f'{connections:>6} {len(created):>8} {len(orders) - len(created):>7} '
+                f'{percentile(created, 0.5):>12.2f} {percentile(created, 0.99):>12.2f} '
+                f'{len(probes):>7} {percentile(probe_ms, 0.5):>13.1f} {percentile(probe_ms, 0.99):>13.1f}'
+            )
+
+    async def load(self, target, body, connections, options):
+        host, port = target
+        slow = asyncio.gather(*[
+            http_request(host, port, 'POST', options['path'], body, options['trickle'], options['timeout'])
+            for _ in range(connections)
+        ])
+        probes = []
+        # One probe at a time while the slow clients are connected
+        while not slow.done():
+            probes.append(await http_request(host, port, 'GET', options['probe_path'], timeout=options['timeout']))
+        return await slow, probes
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import serializers
+
+from orders.benchmarks import bench_product
+from orders.models import Order, OrderItem
+from orders.serializers import OrderCreateSerializer
+
+
+class LegacyOrderCreateSerializer(OrderCreateSerializer):
+    """Order creation as it used to be: unvalidated lines, one INSERT each, no transaction."""
+    items = serializers.ListField(write_only=True)
+    
+    def validate_items(self, items):
+        return items
+    
+    def create(self, validated_data):
+        items_data = validated_data.pop('items')
+        order = Order.objects.create(**validated_data)
+        order.created_items = [
+            OrderItem.objects.create(order=order, **item_data)
+            for item_data in items_data
+        ]
+        return order
+
+
+def run(serializer_class, data):
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    return serializer.data
+
+
+class Command(BaseCommand):
+    help = 'Measure order creation throughput for 1, 10 and 50-line orders'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200, help='Orders to create per run')
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50])
+    
+    def handle(self, *args, **options):
+        product = bench_product()
+        
+        self.stdout.write(f'{"lines":>6} {"legacy orders/s":>16} {"bulk orders/s":>14}')
+        for lines in options['lines']:
+            payload = {
+                'customer_name': 'Benchmark',
+                'customer_phone': '+998900000000',
+                'total_amount': 1000000 * lines,
+                'items': [
+                    {'product_id': product.pk, 'size': 40 + n % 6, 'quantity': 1, 'price': '1000000.00'}
+                    for n in range(lines)
+                ],
+            }
+            rates = []
+            for serializer_class in (LegacyOrderCreateSerializer, OrderCreateSerializer):
+                # Roll back so both runs start from the same table size
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    for _ in range(options['orders']):
+                        run(serializer_class, payload)
+                    elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+                rates.append(options['orders'] / elapsed)
+            self.stdout.write(f'{lines:>6} {rates[0]:>16.0f} {rates[1]:>14.0f}')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from config.pagination import KeysetPagination
+from orders.benchmarks import seed_orders, timed
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Compare page-number and keyset pagination latency on deep pages of orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000, help='Rows to seed the orders table up to')
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000, 10000, 49999])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        seeded = seed_orders(options['orders'], stdout=self.stdout)
+        total = Order.objects.count()
+        self.stdout.write(f'{total} orders ({seeded} seeded)')
+
+        factory = APIRequestFactory()
+        queryset = Order.objects.all()
+        page_size = KeysetPagination.page_size
+
+        self.stdout.write(f'{"page":>8} {"page-number ms":>16} {"keyset ms":>12}')
+        for page in options['pages']:
+            offset = (page - 1) * page_size
+            if offset >= total:
+                continue
+
+            def page_number():
+                request = Request(factory.get('/api/orders/', {'page': page}))
+                list(PageNumberPagination().paginate_queryset(queryset, request))
+
+            # The cursor a client would hold after walking to this page
+            cursor = None
+            if offset:
+                last = queryset.order_by('-created_at', '-pk')[offset - 1]
+                paginator = KeysetPagination()
+                field = Order._meta.get_field('created_at')
+                cursor = paginator.encode_cursor((field.value_to_string(last), last.pk))
+            params = {'cursor': cursor} if cursor else {'pagination': 'cursor'}
+
+            def keyset():
+                request = Request(factory.get('/api/orders/', params))
+                KeysetPagination().paginate_queryset(queryset, request)
+
+            self.stdout.write(
+                f'{page:>8} {timed(page_number, options["repeat"]):>16.2f} '
+                f'{timed(keyset, options["repeat"]):>12.2f}'
+            )
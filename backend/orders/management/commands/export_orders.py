@@ -0,0 +1,7 @@
+from config.exports import ExportCommand
+from orders.exports import OrderExport
+
+
+class Command(ExportCommand):
+    help = 'Write every order with its lines as NDJSON or CSV'
+    export_class = OrderExport
@@ -1,4 +1,5 @@
 from django.db import models
+from rest_framework.utils.encoders import JSONEncoder
 from products.models import Product
 
 
@@ -25,12 +26,23 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     notes = models.TextField(blank=True, default='')
+    # Set on orders placed through checkout, which took stock for their
+    # lines: only these give it back when cancelled and take it again when
+    # re-opened. Orders added in the admin, or placed before reservations
+    # existed, leave stock alone.
+    stock_reserved = models.BooleanField(default=False, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination seeks on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            # Admin changelist filtered by status
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name}"
@@ -38,13 +50,39 @@ class Order(models.Model):
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    # Null once the product is deleted; the snapshot below keeps the history
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.SET_NULL)
     size = models.IntegerField()
     quantity = models.IntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    # Product as it was when the order was placed, so that order reads
+    # never join the catalog
+    product_name = models.CharField(max_length=200, blank=True, default='')
+    product_brand = models.CharField(max_length=100, blank=True, default='')
+    product_image_url = models.CharField(max_length=500, blank=True, default='')
+    
     def __str__(self):
-        return f"{self.quantity}x {self.product.name} (Size {self.size})"
+        return f"{self.quantity}x {self.product_name} (Size {self.size})"
     
     def get_subtotal(self):
         return self.quantity * self.price
+    
+    def snapshot_product(self, product):
+        self.product_name = product.name
+        self.product_brand = product.brand.name
+        self.product_image_url = product.get_image_url() or ''
+
+
+class IdempotencyKey(models.Model):
+    """Stored result of an order POST, replayed for retries with the same Idempotency-Key."""
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    # DRF's encoder so that replays render exactly like the original
+    response = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return self.key
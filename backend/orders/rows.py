@@ -0,0 +1,67 @@
+"""
+OrderSerializer payloads built straight from ``values()`` rows, the
+order counterpart of products.rows: the same output for order lists
+(without ``?expand=product``), from dicts and one query for the lines of
+each page.
+"""
+from rest_framework import serializers
+
+from .models import OrderItem
+
+# Order line columns, including the product snapshot OrderItemSerializer reads
+ORDER_ITEM_SUMMARY_FIELDS = [
+    'id', 'order_id', 'product_id', 'size', 'quantity', 'price',
+    'product_name', 'product_brand', 'product_image_url',
+]
+# OrderSerializer fields read from the order row, in output order around 'items'
+ORDER_FIELDS = [
+    'id', 'customer_name', 'customer_phone', 'customer_email',
+    'shipping_address', 'shipping_city', 'shipping_postal_code',
+    'status', 'total_amount', 'notes',
+]
+# OrderSerializer's formatting of these values
+AMOUNT = serializers.DecimalField(max_digits=10, decimal_places=2)
+TIMESTAMP = serializers.DateTimeField()
+
+
+def order_rows(queryset):
+    """``queryset`` as dicts of what OrderSerializer reads."""
+    return queryset.prefetch_related(None).values(*ORDER_FIELDS, 'created_at', 'updated_at')
+
+
+def item_payloads(order_ids):
+    """Line payloads per order id, in OrderItemSerializer's shape."""
+    amount = AMOUNT.to_representation
+    items = {}
+    for item in OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values(*ORDER_ITEM_SUMMARY_FIELDS):
+        items.setdefault(item['order_id'], []).append({
+            'id': item['id'],
+            'product': {
+                'id': item['product_id'],
+                'name': item['product_name'],
+                'brand': item['product_brand'],
+                'image': item['product_image_url'],
+            },
+            'size': item['size'],
+            'quantity': item['quantity'],
+            'price': amount(item['price']),
+            # Left a Decimal, like OrderItem.get_subtotal's
+            'subtotal': item['quantity'] * item['price'],
+        })
+    return items
+
+
+def order_payloads(rows):
+    rows = list(rows)
+    items = item_payloads([row['id'] for row in rows])
+    amount = AMOUNT.to_representation
+    timestamp = TIMESTAMP.to_representation
+    payloads = []
+    for row in rows:
+        payload = {name: row[name] for name in ORDER_FIELDS}
+        payload['total_amount'] = amount(row['total_amount'])
+        payload['items'] = items.get(row['id'], [])
+        payload['created_at'] = timestamp(row['created_at'])
+        payload['updated_at'] = timestamp(row['updated_at'])
+        payloads.append(payload)
+    return payloads
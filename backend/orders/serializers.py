@@ -1,10 +1,14 @@
+from django.db import transaction
+from jobs.queue import enqueue
 from rest_framework import serializers
 from .models import Order, OrderItem
+from .stock import reserve_stock
+from products.models import Product
 from products.serializers import ProductSerializer
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = serializers.SerializerMethodField()
     product_id = serializers.IntegerField(write_only=True)
     subtotal = serializers.SerializerMethodField()
     
@@ -14,6 +18,21 @@ class OrderItemSerializer(serializers.ModelSerializer):
     
     def get_subtotal(self, obj):
         return obj.get_subtotal()
+    
+    def get_product(self, obj):
+        # From the snapshot taken at purchase; the product may have changed
+        # or be gone since
+        return {
+            'id': obj.product_id,
+            'name': obj.product_name,
+            'brand': obj.product_brand,
+            'image': obj.product_image_url,
+        }
+
+
+class ExpandedOrderItemSerializer(OrderItemSerializer):
+    """Order line with the full product (images, sizes, descriptions)."""
+    product = ProductSerializer(read_only=True)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -28,10 +47,32 @@ class OrderSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['status', 'created_at', 'updated_at']
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # ?expand=product swaps the product summary for the full payload
+        if 'product' in self.context.get('expand', ()):
+            fields['items'] = ExpandedOrderItemSerializer(many=True, read_only=True)
+        return fields
+
+
+class OrderItemCreateSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    size = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = serializers.SerializerMethodField()
+    
+    def get_subtotal(self, obj):
+        return obj.get_subtotal()
+
+
+# Product columns OrderItem.snapshot_product reads
+SNAPSHOT_FIELDS = ['id', 'name', 'brand__name', 'image_file_url', 'image_url']
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
-    items = serializers.ListField(write_only=True)
+    items = OrderItemCreateSerializer(many=True, allow_empty=False, write_only=True)
     customer_email = serializers.EmailField(required=False, allow_blank=True, default='')
     shipping_address = serializers.CharField(required=False, allow_blank=True, default='')
     shipping_city = serializers.CharField(required=False, allow_blank=True, default='')
@@ -41,22 +82,61 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = [
-            'customer_name', 'customer_phone', 'customer_email',
+            'id', 'customer_name', 'customer_phone', 'customer_email',
             'shipping_address', 'shipping_city', 'shipping_postal_code',
-            'total_amount', 'notes', 'items'
+            'status', 'total_amount', 'notes', 'items', 'created_at'
         ]
+        read_only_fields = ['status', 'created_at']
+    
+    def validate_items(self, items):
+        # One IN query for the whole cart instead of a lookup per line; it
+        # also loads what the lines snapshot
+        product_ids = {item['product_id'] for item in items}
+        self.products = Product.objects.select_related('brand').only(*SNAPSHOT_FIELDS).in_bulk(product_ids)
+        missing = sorted(product_ids - set(self.products))
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown product id(s): {', '.join(str(pk) for pk in missing)}"
+            )
+        return items
+    
+    def build_item(self, order, item_data):
+        item = OrderItem(
+            order=order,
+            product_id=item_data['product_id'],
+            size=item_data['size'],
+            quantity=item_data['quantity'],
+            price=item_data['price']
+        )
+        item.snapshot_product(self.products[item.product_id])
+        return item
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
         
-        for item_data in items_data:
-            OrderItem.objects.create(
-                order=order,
-                product_id=item_data['product_id'],
-                size=item_data['size'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
+        with transaction.atomic():
+            # Raises InsufficientStock (409) and rolls the order back if any
+            # size can't cover its quantity
+            reserve_stock(
+                (item_data['product_id'], item_data['size'], item_data['quantity'])
+                for item_data in items_data
             )
+            order = Order.objects.create(**validated_data, stock_reserved=True)
+            # Committed together with the order, so the job can't run
+            # without it or get lost after it
+            enqueue('orders.tasks.order_placed', order_id=order.pk)
+            order.created_items = OrderItem.objects.bulk_create([
+                self.build_item(order, item_data) for item_data in items_data
+            ])
         
         return order
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Echo the lines just written; no need to read them (or their
+        # products) back from the database
+        items = getattr(instance, 'created_items', None)
+        if items is None:
+            items = instance.items.all()
+        data['items'] = OrderItemCreateSerializer(items, many=True).data
+        return data
@@ -0,0 +1,173 @@
+"""
+Per-size stock reservation for orders.
+
+Placing an order takes stock from ``ProductSize.stock`` and marks it
+``stock_reserved``; cancelling such an order gives the stock back, and
+re-opening it takes the stock again. Orders without the mark (added in
+the admin, or placed before reservations) never move stock.
+
+Reservation locks the affected size rows in (product_id, size) order, so
+two checkouts touching the same sizes always queue in the same order and
+cannot deadlock, then applies a single conditional ``UPDATE ... WHERE
+stock >= quantity``. The condition is what actually prevents overselling:
+on databases without row locks (SQLite) a stale read can only make the
+UPDATE match fewer rows, which rejects the order instead of driving stock
+negative.
+"""
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from jobs.queue import enqueue
+from products.cache import invalidate_catalog
+from products.models import Product, ProductSize
+from .models import Order, OrderItem
+from .tasks import refresh_stock_totals
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'insufficient_stock'
+    
+    def __init__(self, lines):
+        self.lines = sorted(lines)
+        super().__init__()
+        # Keep the ids as numbers rather than ErrorDetail strings
+        self.detail = {
+            'error': 'Not enough stock',
+            'items': [{'product_id': product_id, 'size': size} for product_id, size in self.lines],
+        }
+
+
+def stock_totals(lines):
+    """Sum quantities per (product_id, size) from (product_id, size, quantity) tuples."""
+    totals = Counter()
+    for product_id, size, quantity in lines:
+        totals[(product_id, size)] += quantity
+    return totals
+
+
+def _sizes_q(keys, **extra):
+    return reduce(or_, [Q(product_id=product_id, size=size, **extra) for product_id, size in keys])
+
+
+def _adjust(totals, sign):
+    """One UPDATE moving every size in ``totals`` by sign * quantity; returns rows changed."""
+    delta = Case(
+        *[When(product_id=product_id, size=size, then=Value(quantity)) for (product_id, size), quantity in totals.items()],
+        default=Value(0),
+    )
+    if sign < 0:
+        condition = reduce(or_, [
+            Q(product_id=product_id, size=size, stock__gte=quantity, is_available=True)
+            for (product_id, size), quantity in totals.items()
+        ])
+        return ProductSize.objects.filter(condition).update(stock=F('stock') - delta)
+    return ProductSize.objects.filter(_sizes_q(totals)).update(stock=F('stock') + delta)
+
+
+def _touch_products(product_ids):
+    # Sizes going in or out of stock change the size filter and facets
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+        invalidate_catalog()
+
+
+def reserve_stock(lines):
+    """
+    Take stock for (product_id, size, quantity) lines or raise InsufficientStock.
+    
+    Must run inside a transaction so that a rejection also undoes the order
+    being written alongside it.
+    """
+    totals = stock_totals(lines)
+    if not totals:
+        return
+    locked = {
+        (product_id, size): (stock, is_available)
+        for product_id, size, stock, is_available in (
+            ProductSize.objects.select_for_update()
+            .filter(_sizes_q(totals))
+            .order_by('product_id', 'size')
+            .values_list('product_id', 'size', 'stock', 'is_available')
+        )
+    }
+    short = [
+        key for key, quantity in totals.items()
+        if key not in locked or not locked[key][1] or locked[key][0] < quantity
+    ]
+    if short:
+        raise InsufficientStock(short)
+    if _adjust(totals, -1) != len(totals):
+        # Only reachable without row locks: someone else got there first
+        raise InsufficientStock(totals.keys())
+    _touch_products({
+        product_id for (product_id, size), quantity in totals.items()
+        if locked[(product_id, size)][0] == quantity
+    })
+
+
+def release_stock(lines):
+    """Give back stock for (product_id, size, quantity) lines."""
+    totals = stock_totals(lines)
+    if totals:
+        _adjust(totals, +1)
+        _touch_products({product_id for product_id, size in totals})
+
+
+def order_lines(order_ids):
+    # Lines whose product was deleted have no stock to move
+    return OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False).values_list(
+        'product_id', 'size', 'quantity'
+    )
+
+
+def set_order_status(orders, new_status):
+    """
+    Move ``orders`` (a queryset) to ``new_status``, adjusting stock for
+    orders entering or leaving 'cancelled' that reserved it when placed.
+    
+    Returns (number of orders updated, {order id: short (product_id, size)
+    lines} for cancelled orders that could not be re-opened).
+    """
+    with transaction.atomic():
+        # Lock the orders so concurrent cancellations can't release twice
+        rows = (
+            Order.objects.select_for_update()
+            .filter(pk__in=orders.values('pk'))
+            .order_by('pk')
+            .values_list('pk', 'status', 'stock_reserved')
+        )
+        current = {}
+        reserved = set()
+        for pk, old, stock_reserved in rows:
+            current[pk] = old
+            if stock_reserved:
+                reserved.add(pk)
+        failed = {}
+        moved = []
+        if new_status == 'cancelled':
+            moved = list(order_lines([pk for pk in reserved if current[pk] != 'cancelled']))
+            release_stock(moved)
+        else:
+            for pk in sorted(pk for pk in reserved if current[pk] == 'cancelled'):
+                lines = list(order_lines([pk]))
+                try:
+                    with transaction.atomic():
+                        reserve_stock(lines)
+                except InsufficientStock as exc:
+                    failed[pk] = exc.lines
+                else:
+                    moved.extend(lines)
+        if moved:
+            enqueue(refresh_stock_totals, product_ids=sorted({product_id for product_id, size, quantity in moved}))
+        updated = Order.objects.filter(pk__in=set(current) - set(failed)).update(
+            status=new_status, updated_at=timezone.now()
+        )
+    return updated, failed
@@ -0,0 +1,31 @@
+"""Background work for orders, run by ``manage.py run_workers``."""
+import logging
+
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from jobs.queue import task
+from products.models import Product, ProductSize
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def order_placed(order_id):
+    """Post-checkout work kept out of the request."""
+    from .serializers import OrderCreateSerializer
+
+    order = Order.objects.prefetch_related('items').get(pk=order_id)
+    logger.info(f"Order #{order.pk} placed: {OrderCreateSerializer(order).data}")
+    refresh_stock_totals(product_ids=sorted({item.product_id for item in order.items.all()}))
+
+
+@task
+def refresh_stock_totals(product_ids):
+    """Recompute Product.stock_quantity from the per-size stock."""
+    totals = (
+        ProductSize.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(total=Sum('stock')).values('total')
+    )
+    Product.objects.filter(pk__in=product_ids).update(stock_quantity=Coalesce(Subquery(totals), 0))
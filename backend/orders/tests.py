@@ -1,3 +1,715 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from products.models import Brand, Product, ProductSize
+from products.tests import QueryPlanAssertions, make_product
+from .benchmarks import seed_orders
+from .exports import OrderExport
+from .admin import OrderAdmin
+from . import stock
+from .models import IdempotencyKey, Order, OrderItem
+
+
+def make_order(product, lines=1, **overrides):
+    data = {
+        'customer_name': 'Test Customer',
+        'customer_phone': '+998901234567',
+        'total_amount': 1000000 * lines,
+    }
+    data.update(overrides)
+    order = Order.objects.create(**data)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, size=40 + n, quantity=1, price=1000000)
+        for n in range(lines)
+    ])
+    return order
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Air Max 90', brand=Brand.objects.get_or_create(name='Nike')[0], price=1000000, category='men',
+            description_uz='Tavsif', description_ru='Описание',
+        )
+
+
+class OrderConditionalGetTests(OrderTestCase):
+    def test_retrieve_304(self):
+        order = make_order(self.product)
+        url = reverse('order-detail', args=[order.pk])
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_status_change_moves_etag(self):
+        order = make_order(self.product)
+        url = reverse('order-detail', args=[order.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('order-update-status', args=[order.pk]), {'status': 'shipped'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class OrderReadTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(index) for index in range(3)]
+        for _ in range(20):
+            order = Order.objects.create(customer_name='Test Customer', customer_phone='+998901234567', total_amount=3000000)
+            items = [
+                OrderItem(order=order, product=product, size=40, quantity=1, price=1000000)
+                for product in self.products
+            ]
+            for item in items:
+                item.snapshot_product(item.product)
+            OrderItem.objects.bulk_create(items)
+
+    def test_list_queries_do_not_grow_with_orders_or_lines(self):
+        # COUNT, orders, items; the catalog is never read
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any('products_' in query['sql'] for query in queries))
+        self.assertEqual(len(response.data['results']), 20)
+        # ... plus products, images and sizes when expanded
+        with self.assertNumQueries(6):
+            self.client.get(reverse('order-list'), {'expand': 'product'})
+
+    def test_lines_carry_a_product_summary(self):
+        item = self.client.get(reverse('order-list')).data['results'][0]['items'][0]
+        self.assertEqual(item['product'], {
+            'id': self.products[0].pk,
+            'name': 'Sneaker 0',
+            'brand': 'Nike',
+            'image': self.products[0].image_url,
+        })
+        self.assertEqual(item['subtotal'], 1000000)
+
+    def test_expand_product(self):
+        url = reverse('order-detail', args=[Order.objects.first().pk])
+        product = self.client.get(url, {'expand': 'product'}).data['items'][0]['product']
+        self.assertEqual(len(product['images']), 3)
+        self.assertEqual([size['size'] for size in product['sizes']], list(range(39, 45)))
+
+    def test_summary_payload_is_much_smaller(self):
+        compact = len(self.client.get(reverse('order-list')).content)
+        expanded = len(self.client.get(reverse('order-list'), {'expand': 'product'}).content)
+        self.assertLess(compact * 2, expanded)
+
+    def test_lines_keep_the_product_as_purchased(self):
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed')
+        self.products[0].delete()
+        url = reverse('order-detail', args=[Order.objects.first().pk])
+        item = self.client.get(url).data['items'][0]
+        self.assertEqual(item['product']['id'], None)
+        self.assertEqual(item['product']['name'], 'Sneaker 0')
+        self.assertEqual(OrderItem.objects.count(), 60)
+        self.assertIsNone(self.client.get(url, {'expand': 'product'}).data['items'][0]['product'])
+
+    def test_product_edit_moves_expanded_validators_only(self):
+        url = reverse('order-detail', args=[Order.objects.first().pk])
+        summary = self.client.get(url)
+        expanded = self.client.get(url, {'expand': 'product'})
+        # The expanded representation has its own ETag
+        self.assertNotEqual(expanded['ETag'], summary['ETag'])
+        Product.objects.filter(pk=self.products[0].pk).update(
+            name='Renamed', updated_at=timezone.now() + timedelta(seconds=5)
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=summary['ETag']).status_code, 304)
+        changed = self.client.get(url, {'expand': 'product'}, HTTP_IF_NONE_MATCH=expanded['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['Last-Modified'], expanded['Last-Modified'])
+
+    def test_backfill_snapshots(self):
+        OrderItem.objects.update(product_name='', product_brand='', product_image_url='')
+        out = StringIO()
+        call_command('backfill_order_item_snapshots', batch_size=7, stdout=out)
+        self.assertIn('Snapshotted 60 order items', out.getvalue())
+        self.assertFalse(OrderItem.objects.filter(product_name='').exists())
+        self.assertEqual(OrderItem.objects.filter(product=self.products[1]).first().product_brand, 'Nike')
+
+
+class OrderKeysetPaginationTests(OrderTestCase):
+    def test_walks_every_order_once_in_created_order(self):
+        orders = [make_order(self.product) for _ in range(45)]
+        url = reverse('order-list') + '?pagination=cursor'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        expected = sorted(orders, key=lambda order: (order.created_at, order.pk), reverse=True)
+        self.assertEqual(seen, [order.pk for order in expected])
+
+    def test_page_number_mode_is_still_the_default(self):
+        make_order(self.product)
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.data['count'], 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('order-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderFastListTests(OrderTestCase):
+    """orders.rows gives the same bytes as OrderSerializer."""
+
+    def setUp(self):
+        super().setUp()
+        for index in range(25):
+            make_order(self.product, lines=index % 3, notes='Eshik oldida \u2028 “qo\'ng\'iroq”', status='shipped')
+        gone = make_product(99)
+        make_order(gone, lines=2, total_amount='1234.50')
+        gone.delete()
+
+    def assertSameResponses(self, url, params=None):
+        responses = []
+        for fast in (True, False):
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                responses.append(self.client.get(url, params))
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[0].content, responses[1].content)
+        return responses[0]
+
+    def test_pages(self):
+        self.assertSameResponses(reverse('order-list'))
+        self.assertSameResponses(reverse('order-list'), {'page': 2})
+        self.assertSameResponses(reverse('order-list'), {'expand': 'product'})
+        with override_settings(TIME_ZONE='Asia/Tashkent'):
+            self.assertSameResponses(reverse('order-list'), {'ordering': 'total_amount'})
+
+    def test_keyset_pages(self):
+        url, params = reverse('order-list'), {'pagination': 'cursor'}
+        while url:
+            data = self.assertSameResponses(url, params).json()
+            url, params = data['next'], None
+
+    def test_query_count(self):
+        # COUNT(*), orders, their lines
+        with self.assertNumQueries(3):
+            self.client.get(reverse('order-list'))
+
+
+class OrderAdminQueryPlanTests(QueryPlanAssertions, TestCase):
+    """OrderAdmin's changelist queries stay on indexes with a large orders table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_orders(20000)
+        # Most orders end up delivered; the ones staff filter for are rare
+        Order.objects.filter(pk__in=Order.objects.order_by('pk').values('pk')[:19000]).update(status='delivered')
+        Order.objects.filter(pk__in=Order.objects.order_by('pk').values('pk')[19000:19500]).update(status='cancelled')
+        cls.admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        self.analyze()
+
+    def changelist_page(self, **params):
+        request = RequestFactory().get(reverse('admin:orders_order_changelist'), params)
+        request.user = self.admin_user
+        changelist = admin.site._registry[Order].get_changelist_instance(request)
+        return changelist.paginator.page(1).object_list
+
+    def test_changelist(self):
+        self.assertUsesIndex(self.changelist_page(), 'order_created_id_idx')
+
+    def test_status_filter(self):
+        self.assertUsesIndex(self.changelist_page(status__exact='pending'), 'order_status_created_idx')
+
+    def test_date_hierarchy(self):
+        latest = Order.objects.latest('created_at').created_at
+        self.assertUsesIndex(self.changelist_page(
+            created_at__year=latest.year, created_at__month=latest.month, created_at__day=latest.day,
+        ))
+
+    def changelist_count(self, **params):
+        request = RequestFactory().get(reverse('admin:orders_order_changelist'), params)
+        request.user = self.admin_user
+        with CaptureQueriesContext(connection) as queries:
+            count = admin.site._registry[Order].get_changelist_instance(request).result_count
+        return count, [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_large_unfiltered_changelist_estimates_count(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest(f'No row estimates on {connection.vendor}')
+        count, counts = self.changelist_count()
+        self.assertEqual(counts, [])
+        self.assertAlmostEqual(count, 20000, delta=2000)
+        # Filters still count exactly
+        count, counts = self.changelist_count(status__exact='pending')
+        self.assertEqual(count, 500)
+        self.assertEqual(len(counts), 1)
+
+    def test_estimates_off_below_threshold(self):
+        count, counts = self.changelist_count()
+        self.assertEqual(count, 20000)
+        self.assertEqual(len(counts), 1)
+
+
+class OrderAdminChangelistTests(TestCase):
+    def setUp(self):
+        products = [make_product(index) for index in range(3)]
+        for n in range(30):
+            order = Order.objects.create(customer_name='Test Customer', customer_phone='+998901234567', total_amount=3000000)
+            items = [
+                OrderItem(order=order, product=product, size=40, quantity=n % 3 + 1, price=1000000)
+                for product in products[:n % 3 + 1]
+            ]
+            for item in items:
+                item.snapshot_product(item.product)
+            OrderItem.objects.bulk_create(items)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for per_page in (5, 30):
+            with mock.patch.object(admin.site._registry[Order], 'list_per_page', per_page):
+                # session, user, row estimate, COUNT, orders with their
+                # line counts, 2 x date hierarchy
+                with self.assertNumQueries(7):
+                    response = self.client.get(reverse('admin:orders_order_changelist'))
+            self.assertEqual(len(response.context['cl'].result_list), per_page)
+
+    def test_line_and_pair_counts(self):
+        response = self.client.get(reverse('admin:orders_order_changelist'), {'o': '5'})
+        orders = response.context['cl'].result_list
+        self.assertEqual(
+            {(order.items_total, order.quantity_total) for order in orders}, {(1, 1), (2, 4), (3, 9)}
+        )
+        self.assertEqual(orders[0].items_total, 1)
+
+    def test_summary_is_one_query_and_escaped(self):
+        order = Order.objects.first()
+        order.items.update(product_name='<script>x</script>')
+        order_admin = admin.site._registry[Order]
+        with self.assertNumQueries(1):
+            summary = order_admin.order_summary(order)
+        self.assertIn('&lt;script&gt;', summary)
+        self.assertIn('<td style="padding: 8px;">Size 40</td>', summary)
+        response = self.client.get(reverse('admin:orders_order_change', args=[order.pk]))
+        self.assertContains(response, '<td style="padding: 8px;">&lt;script&gt;x&lt;/script&gt;</td>', count=3)
+        self.assertNotContains(response, '<script>x</script>')
+
+
+class OrderExportTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [make_order(self.product, lines=n % 3) for n in range(5)]
+        for days, order in enumerate(reversed(self.orders)):
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days))
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('order-export', args=['ndjson'])).status_code, 403)
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('order-export', args=['ndjson']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([record['id'] for record in records], [order.pk for order in self.orders])
+        self.assertEqual(records[1]['total_amount'], '1000000.00')
+        self.assertEqual(records[1]['items'], [{
+            'product_id': self.product.pk, 'product_name': '', 'product_brand': '',
+            'size': 40, 'quantity': 1, 'price': '1000000.00',
+        }])
+
+    def test_csv_has_a_row_per_line(self):
+        response = self.client.get(reverse('order-export', args=['csv']))
+        self.assertIn('attachment; filename="orders.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 1 + 1 + 2 + 1 + 1)
+        self.assertEqual(rows[0]['item_size'], '')
+        self.assertEqual([row['item_size'] for row in rows if row['id'] == str(self.orders[2].pk)], ['40', '41'])
+
+    def test_created_at_range(self):
+        start = (timezone.now() - timedelta(days=3)).date().isoformat()
+        response = self.client.get(
+            reverse('order-export', args=['ndjson']),
+            {'created_after': start, 'created_before': timezone.now() - timedelta(hours=1)},
+        )
+        ids = [json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(ids, [order.pk for order in self.orders[1:4]])
+        response = self.client.get(reverse('order-export', args=['csv']), {'created_after': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_lines_are_prefetched_per_chunk(self):
+        # orders, then one query for the lines of each chunk of two
+        with self.assertNumQueries(4):
+            lines = list(OrderExport(chunk_size=2).lines('ndjson'))
+        self.assertEqual(len(lines), 5)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as file:
+            call_command('export_orders', '--format', 'csv', '--output', file.name)
+            self.assertEqual(len(file.read().decode().splitlines()), 7)
+
+
+class OrderCreateTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        ProductSize.objects.bulk_create([
+            ProductSize(product=self.product, size=40 + n, stock=1000) for n in range(50)
+        ])
+
+    def payload(self, lines=1, **overrides):
+        data = {
+            'customer_name': 'Test Customer',
+            'customer_phone': '+998901234567',
+            'total_amount': 1000000 * lines,
+            'items': [
+                {'product_id': self.product.pk, 'size': 40 + n, 'quantity': 1, 'price': 1000000}
+                for n in range(lines)
+            ],
+        }
+        data.update(overrides)
+        return data
+
+    def create(self, data):
+        return self.client.post(reverse('order-list'), data, content_type='application/json')
+
+    def test_creates_order_and_lines(self):
+        response = self.create(self.payload(lines=3))
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(
+            [item['size'] for item in response.data['items']], [40, 41, 42]
+        )
+        self.assertEqual(response.data['items'][0]['subtotal'], 1000000)
+        self.assertEqual(order.items.first().product_name, self.product.name)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # product IN query, savepoint, size lock, stock UPDATE, order
+        # INSERT, job INSERT, bulk item INSERT, release
+        for lines in (1, 10, 50):
+            with self.assertNumQueries(8):
+                self.create(self.payload(lines=lines))
+
+    def test_unknown_products_rejected_up_front(self):
+        data = self.payload()
+        data['items'].append({'product_id': 999999, 'size': 40, 'quantity': 1, 'price': 1})
+        response = self.create(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', str(response.data['items']))
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart_rejected(self):
+        self.assertEqual(self.create(self.payload(items=[])).status_code, 400)
+
+    def test_failure_writing_lines_rolls_back_order(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create(self.payload(lines=2))
+        self.assertFalse(Order.objects.exists())
+
+
+def order_payload(product, size=40, quantity=1, lines=1):
+    return {
+        'customer_name': 'Test Customer',
+        'customer_phone': '+998901234567',
+        'total_amount': 1000000 * quantity * lines,
+        'items': [
+            {'product_id': product.pk, 'size': size, 'quantity': quantity, 'price': 1000000}
+            for _ in range(lines)
+        ],
+    }
+
+
+class StockReservationTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.size = ProductSize.objects.create(product=self.product, size=40, stock=2)
+
+    def create(self, **kwargs):
+        return self.client.post(
+            reverse('order-list'), order_payload(self.product, **kwargs), content_type='application/json'
+        )
+
+    def stock(self):
+        self.size.refresh_from_db()
+        return self.size.stock
+
+    def set_status(self, order, new_status):
+        return self.client.post(reverse('order-update-status', args=[order.pk]), {'status': new_status})
+
+    def test_order_takes_stock(self):
+        self.assertEqual(self.create(quantity=2).status_code, 201)
+        self.assertEqual(self.stock(), 0)
+
+    def test_oversell_rejected_and_rolled_back(self):
+        response = self.create(quantity=3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['items'], [{'product_id': self.product.pk, 'size': 40}])
+        self.assertEqual(self.stock(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_repeated_lines_are_summed(self):
+        self.assertEqual(self.create(lines=3).status_code, 409)
+        self.assertEqual(self.stock(), 2)
+
+    def test_unknown_or_unavailable_size_rejected(self):
+        self.assertEqual(self.create(size=45).status_code, 409)
+        self.size.is_available = False
+        self.size.save()
+        self.assertEqual(self.create().status_code, 409)
+
+    def test_selling_out_changes_catalog_validators(self):
+        before = Product.objects.get(pk=self.product.pk).updated_at
+        self.create(quantity=2)
+        self.assertGreater(Product.objects.get(pk=self.product.pk).updated_at, before)
+
+    def test_cancel_returns_stock_once(self):
+        order = Order.objects.get(pk=self.create(quantity=2).data['id'])
+        self.set_status(order, 'cancelled')
+        self.set_status(order, 'cancelled')
+        self.assertEqual(self.stock(), 2)
+
+    def test_reopening_takes_stock_again(self):
+        order = Order.objects.get(pk=self.create(quantity=2).data['id'])
+        self.set_status(order, 'cancelled')
+        self.assertEqual(self.set_status(order, 'processing').status_code, 200)
+        self.assertEqual(self.stock(), 0)
+
+    def test_reopening_without_stock_conflicts(self):
+        order = Order.objects.get(pk=self.create(quantity=2).data['id'])
+        self.set_status(order, 'cancelled')
+        self.create(quantity=1)
+        self.assertEqual(self.set_status(order, 'processing').status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(self.stock(), 1)
+
+    def test_stale_read_cannot_oversell(self):
+        # Without row locks another checkout can take the stock between our
+        # read and our UPDATE; the conditional UPDATE must still refuse
+        real_adjust = stock._adjust
+        seen = []
+
+        def sold_in_between(totals, sign):
+            ProductSize.objects.filter(pk=self.size.pk).update(stock=0)
+            updated = real_adjust(totals, sign)
+            seen.append(self.stock())
+            return updated
+
+        with mock.patch.object(stock, '_adjust', side_effect=sold_in_between):
+            self.assertEqual(self.create().status_code, 409)
+        self.assertEqual(seen, [0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_orders_without_reservation_leave_stock_alone(self):
+        # Added in the admin, or placed before reservations existed
+        order = make_order(self.product)
+        self.assertFalse(order.stock_reserved)
+        self.set_status(order, 'cancelled')
+        self.assertEqual(self.stock(), 2)
+        self.set_status(order, 'processing')
+        self.assertEqual(self.stock(), 2)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'processing')
+
+    def test_admin_locks_lines_of_reserved_orders(self):
+        order = Order.objects.get(pk=self.create().data['id'])
+        self.assertTrue(order.stock_reserved)
+        request = RequestFactory().get('/')
+        request.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        inline = OrderAdmin(Order, admin.site).get_inline_instances(request, order)[0]
+        self.assertIn('quantity', inline.get_readonly_fields(request, order))
+        self.assertFalse(inline.has_add_permission(request, order))
+        manual = make_order(self.product)
+        self.assertNotIn('quantity', inline.get_readonly_fields(request, manual))
+
+    def test_admin_cancel_action_returns_stock(self):
+        orders = [Order.objects.get(pk=self.create().data['id']) for _ in range(2)]
+        request = RequestFactory().post('/')
+        model_admin = OrderAdmin(Order, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.mark_as_cancelled(request, Order.objects.filter(pk__in=[o.pk for o in orders]))
+        self.assertEqual(self.stock(), 2)
+
+
+class IdempotencyKeyTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.size = ProductSize.objects.create(product=self.product, size=40, stock=5)
+
+    def create(self, key='checkout-1', **kwargs):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('order-list'), order_payload(self.product, **kwargs),
+            content_type='application/json', **headers
+        )
+
+    def test_retry_replays_first_response(self):
+        first = self.create()
+        second = self.create()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(first['Idempotent-Replayed'], 'false')
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.stock, 4)
+
+    def test_key_adds_one_insert_and_one_update(self):
+        with CaptureQueriesContext(connection) as with_key:
+            self.create()
+        with CaptureQueriesContext(connection) as without_key:
+            self.create(key=None)
+        key_queries = [q['sql'] for q in with_key if 'orders_idempotencykey' in q['sql']]
+        self.assertEqual([sql.split()[0] for sql in key_queries], ['INSERT', 'UPDATE'])
+        # The UPDATE goes by primary key; the INSERT is the only probe of
+        # the key index. Add 2 for the outer savepoint and its release.
+        self.assertEqual(len(with_key), len(without_key) + 4)
+
+    def test_key_reused_with_other_body(self):
+        self.create()
+        response = self.create(quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_rejected_request_is_not_remembered(self):
+        self.assertEqual(self.create(quantity=9).status_code, 409)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        ProductSize.objects.filter(pk=self.size.pk).update(stock=10)
+        self.assertEqual(self.create(quantity=9).status_code, 201)
+
+    def test_expired_key_runs_again(self):
+        self.create()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.create()['Idempotent-Replayed'], 'false')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_requests_without_key_are_untouched(self):
+        self.create(key=None)
+        self.create(key=None)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_purge_deletes_only_expired_keys(self):
+        now = timezone.now()
+        IdempotencyKey.objects.bulk_create([
+            IdempotencyKey(key=f'old-{n}', request_hash='x', expires_at=now - timedelta(hours=1))
+            for n in range(5)
+        ] + [IdempotencyKey(key='fresh', request_hash='x', expires_at=now + timedelta(hours=1))])
+        call_command('purge_idempotency_keys', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+
+class AsyncOrderCreateTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.size = ProductSize.objects.create(product=self.product, size=40, stock=2)
+
+    def create(self, name='async-order-create', **kwargs):
+        return self.client.post(
+            reverse(name), order_payload(self.product), content_type='application/json', **kwargs
+        )
+
+    def test_matches_sync_endpoint(self):
+        expected = self.create('order-list').json()
+        data = self.create().json()
+        self.assertEqual(data['id'], expected['id'] + 1)
+        for payload in (data, expected):
+            del payload['id'], payload['created_at']
+        self.assertEqual(data, expected)
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.stock, 0)
+
+    def test_errors_match_sync_endpoint(self):
+        self.create()
+        self.create()
+        self.assertEqual(self.create().status_code, 409)
+        response = self.client.post(reverse('async-order-create'), {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.json())
+        response = self.client.post(reverse('async-order-create'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('async-order-create')).status_code, 405)
+
+    def test_idempotency_key(self):
+        first = self.create(HTTP_IDEMPOTENCY_KEY='async-1')
+        second = self.create(HTTP_IDEMPOTENCY_KEY='async-1')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite locks whole tables instead of queueing writers')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_last_pair_is_sold_once(self):
+        product = Product.objects.create(
+            name='Air Max 90', brand=Brand.objects.get_or_create(name='Nike')[0], price=1000000, category='men',
+            description_uz='Tavsif', description_ru='Описание',
+        )
+        size = ProductSize.objects.create(product=product, size=40, stock=1)
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def checkout():
+            try:
+                barrier.wait()
+                response = self.client_class().post(
+                    reverse('order-list'), order_payload(product), content_type='application/json'
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        size.refresh_from_db()
+        self.assertEqual(sorted(statuses), [201] + [409] * 7)
+        self.assertEqual(size.stock, 0)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_concurrent_retries_create_one_order(self):
+        product = Product.objects.create(
+            name='Air Max 90', brand=Brand.objects.get_or_create(name='Nike')[0], price=1000000, category='men',
+            description_uz='Tavsif', description_ru='Описание',
+        )
+        ProductSize.objects.create(product=product, size=40, stock=5)
+        barrier = threading.Barrier(4)
+        bodies = []
+
+        def retry():
+            try:
+                barrier.wait()
+                response = self.client_class().post(
+                    reverse('order-list'), order_payload(product),
+                    content_type='application/json', HTTP_IDEMPOTENCY_KEY='flaky-network',
+                )
+                bodies.append((response.status_code, response.json()['id']))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=retry) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(bodies)), 1)
+        self.assertEqual(Order.objects.count(), 1)
@@ -1,10 +1,15 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from . import async_views
+from .views import OrderViewSet, order_export
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
 
 urlpatterns = [
+    # Ahead of the router, whose detail route would take 'export' for a pk
+    re_path(r'^orders/export\.(?P<file_format>ndjson|csv)$', order_export, name='order-export'),
     path('', include(router.urls)),
+    # Async (ASGI) variant of order creation
+    path('async/orders/', async_views.order_create, name='async-order-create'),
 ]
@@ -1,23 +1,71 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .models import Order
+from .exports import OrderExport
+from .models import Order, OrderItem
+from .rows import ORDER_ITEM_SUMMARY_FIELDS, order_payloads, order_rows
 from .serializers import OrderSerializer, OrderCreateSerializer
+from .idempotency import idempotent
+from .stock import InsufficientStock, set_order_status
+from products.conditional import instance_validators, not_modified, set_validators
+from products.views import catalog_queryset
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def order_items_prefetch(expand=()):
+    """Prefetch for Order.items: one query on the order lines alone, or
+    with ``expand`` containing 'product', full products in three more."""
+    if 'product' in expand:
+        items = OrderItem.objects.prefetch_related(Prefetch('product', queryset=catalog_queryset()))
+    else:
+        items = OrderItem.objects.only(*ORDER_ITEM_SUMMARY_FIELDS)
+    return Prefetch('items', queryset=items.order_by('id'))
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     
+    def get_expand(self):
+        values = self.request.query_params.get('expand', '')
+        return {value.strip() for value in values.split(',') if value.strip()}
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'update_status']:
+            queryset = queryset.prefetch_related(order_items_prefetch(self.get_expand()))
+        return queryset
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
         return OrderSerializer
     
+    def list(self, request, *args, **kwargs):
+        # Expanded lines carry full products: those go through the serializers
+        if not settings.FAST_LIST_SERIALIZATION or 'product' in self.get_expand():
+            return super().list(request, *args, **kwargs)
+        queryset = order_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(order_payloads(queryset))
+        return self.get_paginated_response(order_payloads(page))
+    
     def create(self, request, *args, **kwargs):
-        logger.info(f"Received order data: {request.data}")
+        # Retries carrying the same Idempotency-Key replay the first result
+        return idempotent(request, lambda: self.create_order(request))
+    
+    def create_order(self, request):
+        # The placed order is logged by the order_placed background job
         serializer = self.get_serializer(data=request.data)
         if not serializer.is_valid():
             logger.error(f"Validation errors: {serializer.errors}")
@@ -27,6 +75,25 @@ class OrderViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Expanded items embed the live product, so product edits must change
+        # the validators too; the summary is a snapshot and cannot go stale
+        products_modified = None
+        if 'product' in self.get_expand():
+            products_modified = max(
+                (item.product.updated_at for item in instance.items.all() if item.product),
+                default=None
+            )
+        etag, last_modified = instance_validators(request, instance, products_modified)
+        if products_modified and products_modified > last_modified:
+            last_modified = products_modified
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            serializer = self.get_serializer(instance)
+            response = set_validators(Response(serializer.data), etag, last_modified)
+        return response
+    
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         order = self.get_object()
@@ -38,7 +105,18 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order.status = new_status
-        order.save()
+        # Cancelling returns the stock; re-opening takes it again (409 if gone)
+        _, failed = set_order_status(Order.objects.filter(pk=order.pk), new_status)
+        if failed:
+            raise InsufficientStock(failed[order.pk])
+        order.refresh_from_db()
         serializer = self.get_serializer(order)
         return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def order_export(request, file_format):
+    """All orders with their lines (or those ``?created_after=`` /
+    ``?created_before=`` a date) as NDJSON or CSV, streamed in chunks."""
+    return OrderExport.from_query_params(request.query_params).response(file_format)
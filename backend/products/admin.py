@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Count, Sum
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from jobs.queue import enqueue
+from .cache import invalidate_catalog
 from .models import Brand, Product, ProductImage, ProductSize
+from . import tasks
 
 
 @admin.register(Brand)
@@ -25,14 +30,28 @@ class BrandAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Every brand's product count in the changelist's one query, as a
+        # subquery for the same reasons as ProductAdmin's stock totals
+        counts = (
+            Product.objects.filter(brand=OuterRef('pk'))
+            .order_by().values('brand').annotate(count=Count('pk')).values('count')
+        )
+        return qs.annotate(products_total=Coalesce(Subquery(counts), 0))
+    
+    def products_total(self, obj):
+        if hasattr(obj, 'products_total'):
+            return obj.products_total
+        return obj.products.count() if obj.pk else 0
+    
     def product_count(self, obj):
-        # Count products by brand name (CharField)
-        return Product.objects.filter(brand=obj.name).count()
+        return self.products_total(obj)
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'products_total'
     
     def product_count_detail(self, obj):
-        # Count products by brand name (CharField)
-        count = Product.objects.filter(brand=obj.name).count()
+        count = self.products_total(obj)
         return format_html(
             '<strong>{}</strong> products using this brand',
             count
@@ -78,20 +97,23 @@ class ProductAdmin(admin.ModelAdmin):
         'category', 'is_new', 'is_sale', 'is_featured', 
         'brand', 'created_at', 'updated_at'
     ]
-    search_fields = ['name', 'brand', 'description_uz', 'description_ru']
+    search_fields = ['name', 'sku', 'brand__name', 'description_uz', 'description_ru']
     list_editable = ['is_new', 'is_sale', 'is_featured']
     inlines = [ProductImageInline, ProductSizeInline]
     readonly_fields = [
         'image_preview', 'discount_percentage', 'created_at', 
-        'updated_at', 'total_stock', 'available_brands'
+        'updated_at', 'total_stock'
     ]
+    list_select_related = ['brand']
     list_per_page = 20
+    # Larger duplicate_products selections run as a background job
+    duplicate_inline_limit = 500
     date_hierarchy = 'created_at'
     save_on_top = True
     
     fieldsets = (
         ('Product Information', {
-            'fields': ('name', 'brand', 'available_brands', 'category')
+            'fields': ('name', 'sku', 'brand', 'category')
         }),
         ('Pricing', {
             'fields': ('price', 'original_price', 'discount_percentage'),
@@ -126,19 +148,21 @@ class ProductAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('sizes')
-    
-    def available_brands(self, obj):
-        """Show list of available brands from Brand model"""
-        brands = Brand.objects.filter(is_active=True).values_list('name', flat=True)
-        return format_html(
-            '<div style="background: #f8f9fa; padding: 10px; border-radius: 4px;">'
-            '<strong>Available Brands:</strong><br>{}</div>',
-            ', '.join(brands) if brands else 'No brands defined - add them in Brands section'
+        # Stock across sizes as a correlated subquery: one query for the
+        # whole page, and no GROUP BY to trip up actions or deletes
+        totals = (
+            ProductSize.objects.filter(product=OuterRef('pk'))
+            .order_by().values('product').annotate(total=Sum('stock')).values('total')
         )
-    available_brands.short_description = 'Available Brands'
+        return qs.annotate(sizes_stock=Coalesce(Subquery(totals), 0))
+    
+    def sizes_stock(self, obj):
+        if hasattr(obj, 'sizes_stock'):
+            return obj.sizes_stock
+        return obj.sizes.aggregate(total=Sum('stock'))['total'] or 0
+    
     def stock_status(self, obj):
-        total = obj.sizes.aggregate(total=Sum('stock'))['total'] or 0
+        total = self.sizes_stock(obj)
         if total == 0:
             color = 'red'
             status = 'Out of Stock'
@@ -153,9 +177,10 @@ class ProductAdmin(admin.ModelAdmin):
             color, status
         )
     stock_status.short_description = 'Stock'
+    stock_status.admin_order_field = 'sizes_stock'
     
     def total_stock(self, obj):
-        total = obj.sizes.aggregate(total=Sum('stock'))['total'] or 0
+        total = self.sizes_stock(obj)
         return format_html(
             '<strong>{}</strong> items across all sizes',
             total
@@ -164,65 +189,57 @@ class ProductAdmin(admin.ModelAdmin):
     
     # Bulk Actions
     def mark_as_new(self, request, queryset):
-        updated = queryset.update(is_new=True)
+        updated = queryset.update(is_new=True, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'{updated} products marked as new.')
     mark_as_new.short_description = 'Mark as NEW'
     
     def remove_new_flag(self, request, queryset):
-        updated = queryset.update(is_new=False)
+        updated = queryset.update(is_new=False, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'NEW flag removed from {updated} products.')
     remove_new_flag.short_description = 'Remove NEW flag'
     
     def mark_as_sale(self, request, queryset):
-        updated = queryset.update(is_sale=True)
+        updated = queryset.update(is_sale=True, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'{updated} products marked as SALE.')
     mark_as_sale.short_description = 'Mark as SALE'
     
     def remove_sale_flag(self, request, queryset):
-        updated = queryset.update(is_sale=False)
+        updated = queryset.update(is_sale=False, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'SALE flag removed from {updated} products.')
     remove_sale_flag.short_description = 'Remove SALE flag'
     
     def feature_products(self, request, queryset):
-        updated = queryset.update(is_featured=True)
+        updated = queryset.update(is_featured=True, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'{updated} products marked as featured.')
     feature_products.short_description = 'Feature on homepage'
     
     def unfeature_products(self, request, queryset):
-        updated = queryset.update(is_featured=False)
+        updated = queryset.update(is_featured=False, updated_at=timezone.now())
+        invalidate_catalog()
         self.message_user(request, f'{updated} products removed from featured.')
     unfeature_products.short_description = 'Remove from featured'
     
     def duplicate_products(self, request, queryset):
-        for product in queryset:
-            # Store related data before duplicating
-            sizes = list(product.sizes.all())
-            images = list(product.images.all())
-            
-            # Duplicate product
-            product.pk = None
-            product.name = f"{product.name} (Copy)"
-            product.save()
-            
-            # Duplicate sizes
-            for size in sizes:
-                size.pk = None
-                size.product = product
-                size.save()
-            
-            # Duplicate images
-            for image in images:
-                image.pk = None
-                image.product = product
-                image.save()
-        
-        self.message_user(request, f'{queryset.count()} products duplicated.')
+        product_ids = list(queryset.values_list('pk', flat=True))
+        if len(product_ids) > self.duplicate_inline_limit:
+            # Too many to clone within one admin request
+            enqueue(tasks.duplicate_products, product_ids=product_ids)
+            self.message_user(request, f'Duplicating {len(product_ids)} products in the background.')
+            return
+        duplicated = tasks.duplicate_products(product_ids)
+        self.message_user(request, f'{duplicated} products duplicated.')
     duplicate_products.short_description = 'Duplicate selected products'
 
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ['image_preview', 'product', 'order', 'alt_text']
+    list_select_related = ['product__brand']
     list_filter = ['product__brand', 'product__category']
     search_fields = ['product__name', 'alt_text']
     list_editable = ['order']
@@ -233,23 +250,35 @@ class ProductImageAdmin(admin.ModelAdmin):
 @admin.register(ProductSize)
 class ProductSizeAdmin(admin.ModelAdmin):
     list_display = ['product', 'size', 'stock', 'is_available']
+    list_select_related = ['product__brand']
     list_filter = ['is_available', 'size', 'product__brand']
     search_fields = ['product__name']
     list_editable = ['stock', 'is_available']
     
     actions = ['mark_available', 'mark_unavailable', 'restock']
     
+    def touch_products(self, queryset):
+        # Run before the update: the action queryset may carry changelist
+        # filters on the very columns being changed.
+        Product.objects.filter(
+            pk__in=queryset.values('product_id')
+        ).update(updated_at=timezone.now())
+        invalidate_catalog()
+    
     def mark_available(self, request, queryset):
+        self.touch_products(queryset)
         updated = queryset.update(is_available=True)
         self.message_user(request, f'{updated} sizes marked as available.')
     mark_available.short_description = 'Mark as available'
     
     def mark_unavailable(self, request, queryset):
+        self.touch_products(queryset)
         updated = queryset.update(is_available=False)
         self.message_user(request, f'{updated} sizes marked as unavailable.')
     mark_unavailable.short_description = 'Mark as unavailable'
     
     def restock(self, request, queryset):
+        self.touch_products(queryset)
         updated = queryset.update(stock=10, is_available=True)
         self.message_user(request, f'{updated} sizes restocked with 10 items each.')
     restock.short_description = 'Restock (set to 10 items)'
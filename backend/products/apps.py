@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def setup_sqlite_search(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if 'products_product' not in connection.introspection.table_names():
+        return
+    from .search import ensure_sqlite_fts
+    ensure_sqlite_fts(using)
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(setup_sqlite_search, sender=self)
@@ -0,0 +1,88 @@
+"""
+Async product reads for the ASGI deployment (see ``config/asgi.py``).
+
+Same payloads as ``GET /api/products/`` and ``/api/products/{id}/``
+(filters, ``?search=``, ``?page=``), fetched with the async ORM so a
+slow client never holds a worker thread. They skip the catalog response
+cache, whose helpers are synchronous.
+"""
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from config.renderers import ORJSONRenderer
+
+from .filters import ProductFilter
+from .models import Product
+from .search import search_products
+from .serializers import ProductSerializer
+from .views import catalog_queryset
+
+
+def json_response(data, status=200, headers=None):
+    # Rendered like the sync API so the bytes match
+    return HttpResponse(
+        ORJSONRenderer().render(data), status=status, headers=headers, content_type='application/json'
+    )
+
+
+def error_response(exc):
+    # Shaped like DRF's exception handler output
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status=exc.status_code)
+
+
+def page_number(request):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise NotFound('Invalid page.')
+    if page < 1:
+        raise NotFound('Invalid page.')
+    return page
+
+
+def page_link(request, page, last_page):
+    if page < 1 or page > last_page:
+        return None
+    url = request.build_absolute_uri()
+    if page == 1:
+        return remove_query_param(url, 'page')
+    return replace_query_param(url, 'page', page)
+
+
+@require_GET
+async def product_list(request):
+    try:
+        queryset = ProductFilter(request.GET).apply(catalog_queryset())
+        search = request.GET.get('search', '').strip()
+        if search:
+            queryset = search_products(queryset, search)
+        page = page_number(request)
+    except APIException as exc:
+        return error_response(exc)
+
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    count = await queryset.acount()
+    last_page = max(1, -(-count // page_size))
+    if page > last_page:
+        return error_response(NotFound('Invalid page.'))
+    offset = (page - 1) * page_size
+    products = [product async for product in queryset[offset:offset + page_size]]
+    return json_response({
+        'count': count,
+        'next': page_link(request, page + 1, last_page),
+        'previous': page_link(request, page - 1, last_page),
+        'results': ProductSerializer(products, many=True).data,
+    })
+
+
+@require_GET
+async def product_detail(request, pk):
+    try:
+        product = await catalog_queryset().aget(pk=pk)
+    except Product.DoesNotExist:
+        return error_response(NotFound('No Product matches the given query.'))
+    return json_response(ProductSerializer(product).data)
@@ -0,0 +1,63 @@
+"""
+Helpers shared by the product ``bench_*`` management commands.
+
+Products are seeded straight through ``bulk_create`` with what a real
+catalog row carries (uploaded image names, built variants, placeholder
+metadata, two descriptions, a gallery and sizes) but no files; they are
+meant for a scratch database, never production.
+"""
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .images import derivative_urls
+from .models import Brand, Product, ProductImage, ProductSize
+
+NAME_PREFIX = 'Bench product'
+GALLERY_SIZE = 3
+SIZES = range(39, 45)
+DESCRIPTION = {
+    'uz': 'Yengil va qulay krossovka: nafas oladigan to\'r, yumshoq taglik va har kuni kiyish uchun mustahkam rezina. ' * 3,
+    'ru': 'Лёгкие и удобные кроссовки: дышащая сетка, мягкая подошва и прочная резина для каждого дня. ' * 3,
+}
+
+
+def stored_image(name):
+    """Column values of an uploaded image whose variants and metadata are built."""
+    digest = hashlib.sha256(name.encode()).hexdigest()[:32]
+    widths = [200, 400, 800]
+    return {
+        'image': name,
+        'image_file_url': default_storage.url(name),
+        'image_variants': {'source': name, 'digest': digest, 'widths': widths, **derivative_urls(digest, widths)},
+        'image_meta': {
+            'source': name, 'width': 1200, 'height': 800, 'color': '#c8c2b8',
+            'blurhash': 'LEHV6nWB2yk8pyo0adR*.7kCMdnj',
+        },
+    }
+
+
+def seed_products(total):
+    """Top the benchmark products up to ``total``."""
+    existing = Product.objects.filter(name__startswith=NAME_PREFIX).count()
+    brand = Brand.objects.get_or_create(name='Bench')[0]
+    with transaction.atomic():
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'{NAME_PREFIX} {n}', brand=brand, price=1000000, category='unisex',
+                description_uz=DESCRIPTION['uz'], description_ru=DESCRIPTION['ru'],
+                **stored_image(f'products/bench-{n}.jpg'),
+            )
+            for n in range(existing, total)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(
+                product=product, order=index, **stored_image(f'products/gallery/bench-{product.pk}-{index}.jpg'),
+            )
+            for product in products for index in range(GALLERY_SIZE)
+        ])
+        ProductSize.objects.bulk_create([
+            ProductSize(product=product, size=size, stock=5) for product in products for size in SIZES
+        ])
+    return total - existing
@@ -0,0 +1,75 @@
+"""
+BlurHash encoder (https://blurha.sh): a short string a client decodes
+into a blurred placeholder while the real image loads.
+
+Pure Python; meant for an image already shrunk to a few dozen pixels,
+where the separable sums below cost a couple of milliseconds.
+"""
+import math
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+SRGB_TO_LINEAR = [srgb_to_linear(value) for value in range(256)]
+
+
+def encode83(value, length):
+    return ''.join(ALPHABET[value // 83 ** (length - index) % 83] for index in range(1, length + 1))
+
+
+def sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode(image, x_components=4, y_components=3):
+    """BlurHash of a small RGB Pillow image."""
+    width, height = image.size
+    pixels = image.tobytes()
+    channels = [
+        [SRGB_TO_LINEAR[value] for value in pixels[offset::3]]
+        for offset in range(3)
+    ]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    # factor(i, j) = sum over rows y of cos_y[j][y] * (sum over x of cos_x[i][x] * pixel)
+    factors = [[0.0, 0.0, 0.0] for _ in range(x_components * y_components)]
+    for channel, values in enumerate(channels):
+        for i in range(x_components):
+            weights = cos_x[i]
+            row_sums = [
+                sum(w * v for w, v in zip(weights, values[y * width:(y + 1) * width]))
+                for y in range(height)
+            ]
+            for j in range(y_components):
+                normalisation = 1 if i == 0 and j == 0 else 2
+                total = sum(c * s for c, s in zip(cos_y[j], row_sums))
+                factors[j * x_components + i][channel] = normalisation * total / (width * height)
+
+    dc, ac = factors[0], factors[1:]
+    result = encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += encode83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += encode83(0, 1)
+    result += encode83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (max(0, min(18, int(sign_pow(value / maximum, 0.5) * 9 + 9.5))) for value in factor)
+        result += encode83(r * 19 * 19 + g * 19 + b, 2)
+    return result
@@ -0,0 +1,113 @@
+"""
+Versioned response cache for the public catalog endpoints.
+
+Cached entries are keyed by endpoint, query string and a catalog version
+number. Any write to the catalog bumps the version, which orphans every
+entry at once instead of tracking which responses a product appears in;
+orphaned entries simply age out after CATALOG_CACHE_TIMEOUT.
+
+Only the Django cache API is used (get/add/incr/delete), so this works the
+same on the file-based (the default) and Redis backends. The cache must
+be shared by every process, job workers included, or the others keep
+serving what a bump orphaned: the local-memory backend is per process and
+only fits a single one.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .conditional import not_modified, queryset_validators, request_digest, set_validators
+
+
+VERSION_KEY = 'catalog:version'
+# How long a cold-cache rebuild may hold its lock, and how long other
+# requests wait for it before rebuilding themselves.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key evicted or never set; any fresh value invalidates old entries
+        cache.set(VERSION_KEY, int(time.time()), timeout=None)
+
+
+def invalidate_catalog():
+    """Invalidate cached catalog responses once the current transaction commits."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def catalog_cache_key(request):
+    return f'catalog:{get_catalog_version()}:{request_digest(request)}'
+
+
+def get_or_build(key, build, timeout=None):
+    """
+    Return the cached value for ``key``, calling ``build`` on a miss.
+
+    Only one caller rebuilds a cold key; concurrent callers poll for its
+    result and fall back to building themselves if it takes too long.
+    """
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(key, value, timeout=timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return build()
+
+
+def cached_catalog_response(request, queryset, build, with_last_modified=False):
+    """
+    Response for a catalog read rendered from ``queryset``.
+
+    Cached entries carry their ETag (and, ``with_last_modified``, for a
+    single product, Last-Modified), so a warm hit costs no queries at all.
+    On a miss the validators are computed first with one aggregate query
+    and a conditional request is answered with 304 before ``build``
+    serializes anything.
+    """
+    key = catalog_cache_key(request)
+    entry = cache.get(key)
+    if entry is None:
+        etag, last_modified = queryset_validators(request, queryset, with_last_modified)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        entry = get_or_build(key, lambda: (etag, last_modified, build()))
+
+    etag, last_modified, data = entry
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = set_validators(Response(data), etag, last_modified)
+    return response
@@ -0,0 +1,68 @@
+"""
+ETag / Last-Modified helpers for read endpoints.
+
+Validators are derived from ``updated_at`` with a single aggregate query
+(or from an already loaded instance), so a matching ``If-None-Match`` or
+``If-Modified-Since`` is answered with 304 before anything is serialized.
+Lists only get an ETag: their Last-Modified could not see deletions.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def request_digest(request):
+    """Stable digest of host, path and (sorted) query params."""
+    params = sorted(
+        (key, value)
+        for key in request.GET
+        for value in request.GET.getlist(key)
+    )
+    raw = f'{request.get_host()}{request.path}?{params}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_etag(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32])
+
+
+def queryset_validators(request, queryset, with_last_modified=False):
+    """(etag, last_modified) for a response rendered from ``queryset``.
+
+    last_modified is None unless ``with_last_modified``: for a list it would
+    be the newest ``updated_at``, which stays put when a product is deleted
+    or leaves the filter; only the ETag, which also counts the rows, sees
+    that. Pass it for a single-row queryset."""
+    stats = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+    last_modified = stats['last_modified']
+    etag = make_etag(
+        request_digest(request), stats['count'],
+        last_modified.isoformat() if last_modified else '',
+    )
+    return etag, last_modified if with_last_modified else None
+
+
+def instance_validators(request, instance, *extra):
+    """(etag, last_modified) for a response rendered from one instance."""
+    return make_etag(
+        request_digest(request), instance.pk, instance.updated_at.isoformat(), *extra
+    ), instance.updated_at
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 response if the client's copy is current, otherwise None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+    return None
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,59 @@
+from django.db.models import Prefetch
+
+from config.exports import Export
+
+from .importer import LIST_SEPARATOR
+from .models import Product, ProductImage, ProductSize
+
+
+class ProductExport(Export):
+    """Every product with its sizes (and stock) and images, oldest first.
+
+    CSV columns use the ``import_products`` names and list formats."""
+    filename = 'products'
+    csv_header = [
+        'id', 'sku', 'name', 'brand', 'price', 'original_price', 'category', 'is_new', 'is_sale',
+        'is_featured', 'description_uz', 'description_ru', 'image', 'images', 'sizes',
+        'stock_quantity', 'created_at', 'updated_at',
+    ]
+
+    def get_queryset(self):
+        return Product.objects.select_related('brand').defer('search_document').order_by('pk').prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.only('id', 'product_id', 'image_file_url', 'image_url', 'order')),
+            Prefetch('sizes', queryset=ProductSize.objects.only('id', 'product_id', 'size', 'stock', 'is_available')),
+        )
+
+    def record(self, product):
+        return {
+            'id': product.pk,
+            'sku': product.sku,
+            'name': product.name,
+            'brand': product.brand.name,
+            'price': product.price,
+            'original_price': product.original_price,
+            'category': product.category,
+            'is_new': product.is_new,
+            'is_sale': product.is_sale,
+            'is_featured': product.is_featured,
+            'description': {'uz': product.description_uz, 'ru': product.description_ru},
+            'image': product.get_image_url() or None,
+            'images': [image.get_image_url() for image in product.images.all()],
+            'sizes': [
+                {'size': size.size, 'stock': size.stock, 'is_available': size.is_available}
+                for size in product.sizes.all()
+            ],
+            'stock_quantity': product.stock_quantity,
+            'created_at': product.created_at,
+            'updated_at': product.updated_at,
+        }
+
+    def csv_rows(self, product):
+        yield [
+            product.pk, product.sku or '', product.name, product.brand.name, product.price,
+            product.original_price if product.original_price is not None else '', product.category,
+            product.is_new, product.is_sale, product.is_featured,
+            product.description_uz, product.description_ru, product.get_image_url() or '',
+            LIST_SEPARATOR.join(image.get_image_url() or '' for image in product.images.all()),
+            LIST_SEPARATOR.join(f'{size.size}:{size.stock}' for size in product.sizes.all()),
+            product.stock_quantity, product.created_at.isoformat(), product.updated_at.isoformat(),
+        ]
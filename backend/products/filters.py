@@ -0,0 +1,198 @@
+"""
+Structured catalog filters and facet counts.
+
+Filters (all optional, repeat a parameter or comma-separate for several
+values): ``brand``, ``category``, ``size`` (only sizes in stock),
+``price_min``, ``price_max``, ``is_new``, ``is_sale``.
+
+Facets are disjunctive: each dimension is counted with every filter
+applied except its own, so picking "Nike" still shows how many products
+the other brands have. All of them come from four aggregate queries,
+whatever the catalog size or the number of filter values.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Q
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from .models import ProductSize
+
+
+# Range of an IntegerField (ProductSize.size) on every supported database
+INTEGER_MIN, INTEGER_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Price facet buckets in UZS: (min inclusive, max exclusive)
+PRICE_BUCKETS = [
+    (None, 1000000),
+    (1000000, 1500000),
+    (1500000, 2000000),
+    (2000000, 3000000),
+    (3000000, None),
+]
+
+TRUE_VALUES = {'true', '1', 'yes'}
+FALSE_VALUES = {'false', '0', 'no'}
+
+
+def count_where(condition):
+    return Count('pk', filter=condition or None)
+
+
+def in_stock_sizes():
+    return ProductSize.objects.filter(stock__gt=0, is_available=True)
+
+
+class ProductFilter:
+    """Parsed filter parameters, applicable with any one dimension left out."""
+
+    def __init__(self, query_params):
+        self.brands = self.get_list(query_params, 'brand')
+        self.categories = self.get_list(query_params, 'category')
+        self.sizes = [self.parse_int(value, 'size') for value in self.get_list(query_params, 'size')]
+        self.price_min = self.parse_price(query_params.get('price_min'), 'price_min')
+        self.price_max = self.parse_price(query_params.get('price_max'), 'price_max')
+        self.is_new = self.parse_bool(query_params.get('is_new'))
+        self.is_sale = self.parse_bool(query_params.get('is_sale'))
+
+    @staticmethod
+    def get_list(query_params, name):
+        values = []
+        for raw in query_params.getlist(name):
+            values.extend(value.strip() for value in raw.split(',') if value.strip())
+        return values
+
+    @staticmethod
+    def parse_int(value, name):
+        try:
+            number = int(value)
+        except ValueError:
+            number = None
+        # Beyond an IntegerField the query itself fails
+        if number is None or not INTEGER_MIN <= number <= INTEGER_MAX:
+            raise ValidationError({name: f'"{value}" is not a whole number.'})
+        return number
+
+    @staticmethod
+    def parse_price(value, name):
+        if value in (None, ''):
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            price = None
+        # NaN and Infinity parse, but are no price to filter by
+        if price is None or not price.is_finite():
+            raise ValidationError({name: f'"{value}" is not a valid price.'})
+        return price
+
+    @staticmethod
+    def parse_bool(value):
+        if value is None:
+            return None
+        value = value.lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        return None
+
+    def conditions(self):
+        """Filter conditions by dimension; inactive dimensions are left out."""
+        conditions = {}
+        if self.brands:
+            conditions['brand'] = Q(brand__name__in=self.brands)
+        if self.categories:
+            conditions['category'] = Q(category__in=self.categories)
+        if self.sizes:
+            in_stock = in_stock_sizes().filter(size__in=self.sizes).values('product_id')
+            conditions['size'] = Q(pk__in=in_stock)
+        price = Q()
+        if self.price_min is not None:
+            price &= Q(price__gte=self.price_min)
+        if self.price_max is not None:
+            price &= Q(price__lte=self.price_max)
+        if price:
+            conditions['price'] = price
+        if self.is_new is not None:
+            conditions['is_new'] = Q(is_new=self.is_new)
+        if self.is_sale is not None:
+            conditions['is_sale'] = Q(is_sale=self.is_sale)
+        return conditions
+
+    def apply(self, queryset, exclude=()):
+        for dimension, condition in self.conditions().items():
+            if dimension not in exclude:
+                queryset = queryset.filter(condition)
+        return queryset
+
+    def facets(self, queryset):
+        conditions = self.conditions()
+        price = conditions.get('price', Q())
+        is_new = conditions.get('is_new', Q())
+        is_sale = conditions.get('is_sale', Q())
+
+        brands = (
+            self.apply(queryset, exclude=['brand'])
+            .order_by('brand__name').values('brand__name').annotate(count=Count('pk'))
+        )
+        categories = (
+            self.apply(queryset, exclude=['category'])
+            .order_by('category').values('category').annotate(count=Count('pk'))
+        )
+        # Skip the IN (products) restriction entirely when nothing narrows
+        # the catalog; it doubles the cost of the unfiltered sidebar
+        sizes = in_stock_sizes()
+        other_conditions = set(conditions) - {'size'}
+        if other_conditions or queryset.query.has_filters():
+            sizes = sizes.filter(product__in=self.apply(queryset, exclude=['size']).values('pk'))
+        sizes = sizes.order_by('size').values('size').annotate(count=Count('product_id'))
+
+        # Price buckets and flags share one conditional aggregate
+        base = self.apply(queryset, exclude=['price', 'is_new', 'is_sale']).order_by()
+        aggregates = {'total': count_where(price & is_new & is_sale)}
+        for index, (low, high) in enumerate(PRICE_BUCKETS):
+            bucket = Q()
+            if low is not None:
+                bucket &= Q(price__gte=low)
+            if high is not None:
+                bucket &= Q(price__lt=high)
+            aggregates[f'price_{index}'] = count_where(bucket & is_new & is_sale)
+        aggregates['new_count'] = count_where(Q(is_new=True) & price & is_sale)
+        aggregates['sale_count'] = count_where(Q(is_sale=True) & price & is_new)
+        counts = base.aggregate(**aggregates)
+
+        return {
+            'count': counts['total'],
+            'facets': {
+                'brand': [{'value': row['brand__name'], 'count': row['count']} for row in brands],
+                'category': [{'value': row['category'], 'count': row['count']} for row in categories],
+                'size': [{'value': row['size'], 'count': row['count']} for row in sizes],
+                'price': [
+                    {'min': low, 'max': high, 'count': counts[f'price_{index}']}
+                    for index, (low, high) in enumerate(PRICE_BUCKETS)
+                ],
+                'is_new': counts['new_count'],
+                'is_sale': counts['sale_count'],
+            },
+        }
+
+
+class ProductFilterBackend(filters.BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return ProductFilter(request.query_params).apply(queryset)
+
+    def get_schema_operation_parameters(self, view):
+        params = [
+            ('brand', 'string', 'Brand name(s), comma-separated'),
+            ('category', 'string', 'men, women and/or unisex, comma-separated'),
+            ('size', 'string', 'EU size(s) in stock, comma-separated'),
+            ('price_min', 'number', 'Minimum price'),
+            ('price_max', 'number', 'Maximum price'),
+            ('is_new', 'boolean', 'New arrivals only'),
+            ('is_sale', 'boolean', 'Sale items only'),
+        ]
+        return [
+            {'name': name, 'required': False, 'in': 'query', 'description': description, 'schema': {'type': kind}}
+            for name, kind, description in params
+        ]
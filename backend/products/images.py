@@ -0,0 +1,311 @@
+"""
+Resized WebP and JPEG copies of uploaded images, for ``srcset``.
+
+Each uploaded original (``Product.image``, ``ProductImage.image``,
+``Brand.logo``) gets derivatives at ``DERIVATIVE_WIDTHS`` (never wider
+than the original), stored under ``derivatives/<content hash>/`` so an
+image uploaded twice is only encoded once. What was built is recorded in
+the model's ``*_variants`` JSON field::
+
+    {"source": "products/a.jpg", "digest": "<hash>", "widths": [200, 400, 800],
+     "srcset": {"webp": "<url> 200w, ...", "jpeg": "..."}, "thumbnail": "<url>"}
+
+URLs are resolved by the storage backend when the variants are built, so
+serializing never calls it; ``manage.py refresh_image_urls`` resolves
+them again after a storage or ``MEDIA_URL`` change, and periodically with
+storage that signs (and so expires) its URLs.
+
+Building happens in the background: saving a new upload queues the
+``build_image_derivatives`` job, and ``manage.py build_image_derivatives``
+backfills existing images with a process pool. Until then ``srcset_map``
+returns None and clients use the original. Images given as ``image_url``
+are hosted elsewhere and left alone.
+
+Product and gallery images also get placeholder metadata in
+``image_meta``: the dimensions (for reserving space), a dominant color
+and a BlurHash, read from the upload or, for ``image_url``, downloaded by
+the ``IMAGE_FETCHER`` setting's function. The ``compute_image_metadata``
+job and command fill it in the same way.
+"""
+import hashlib
+import http.client
+import ipaddress
+import socket
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from . import blurhash
+from .cache import invalidate_catalog
+
+DERIVATIVE_WIDTHS = (200, 400, 800)
+DERIVATIVES_DIR = 'derivatives'
+# format key -> (extension, Pillow format, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Model label -> (image field, variants field)
+IMAGE_FIELDS = {
+    'products.product': ('image', 'image_variants'),
+    'products.productimage': ('image', 'image_variants'),
+    'products.brand': ('logo', 'logo_variants'),
+}
+# A missing or unreadable original: retrying will not help
+SOURCE_ERRORS = (OSError, UnidentifiedImageError, Image.DecompressionBombError)
+# Longest side of the copy the placeholder is computed from
+PLACEHOLDER_SIZE = 32
+# Bigger downloads are refused
+MAX_FETCH_BYTES = 20 * 1024 * 1024
+FETCH_TIMEOUT = 10
+FETCH_SCHEMES = ('http', 'https')
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def derivative_name(digest, width, format_key):
+    extension = DERIVATIVE_FORMATS[format_key][0]
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}/{width}.{extension}'
+
+
+def flatten(image):
+    """RGB copy for JPEG, with any transparency laid over white."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_derivatives(name, storage=default_storage):
+    """Write the derivatives of the stored file ``name``; returns its variants.
+
+    Touches storage only, never the database, so it can run in a worker process."""
+    with storage.open(name, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    image = Image.open(BytesIO(data))
+    # Lets JPEG decode at a fraction of its size: much faster for photos
+    image.draft('RGB', (DERIVATIVE_WIDTHS[-1], DERIVATIVE_WIDTHS[-1]))
+    image = ImageOps.exif_transpose(image)
+    widths = [width for width in DERIVATIVE_WIDTHS if width <= image.width] or [image.width]
+    variants = {'source': name, 'digest': digest, 'widths': widths}
+    # URLs are resolved here once rather than on every serialization
+    variants.update(derivative_urls(digest, widths, storage))
+
+    # Same content as an image done before
+    if all(storage.exists(derivative_name(digest, widths[-1], key)) for key in DERIVATIVE_FORMATS):
+        return variants
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'P')
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    # Largest first, each resized from the previous one
+    for width in reversed(widths):
+        if width != image.width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for key, (extension, pillow_format, options) in DERIVATIVE_FORMATS.items():
+            target = derivative_name(digest, width, key)
+            if storage.exists(target):
+                continue
+            buffer = BytesIO()
+            (image if key == 'webp' else flatten(image)).save(buffer, pillow_format, **options)
+            storage.save(target, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def derivative_urls(digest, widths, storage=default_storage):
+    """The ``srcset`` map and ``thumbnail`` URL of a variants field."""
+    srcset = {
+        key: ', '.join(f'{storage.url(derivative_name(digest, width, key))} {width}w' for width in widths)
+        for key in DERIVATIVE_FORMATS
+    }
+    return {'srcset': srcset, 'thumbnail': storage.url(derivative_name(digest, widths[0], 'jpeg'))}
+
+
+def srcset_map(variants):
+    """The srcset map of a variants field, or None while it has no derivatives."""
+    return variants.get('srcset') if variants else None
+
+
+def thumbnail_url(variants):
+    """Smallest JPEG derivative, for admin previews; None if not built yet."""
+    return variants.get('thumbnail') if variants else None
+
+
+def touch_products(model, pks):
+    """Move the updated_at of the products owning rows ``pks`` of ``model``
+    (image fields are part of the product payload) and drop cached pages."""
+    from .models import Product
+    products = pks if model is Product else model.objects.filter(pk__in=pks).values('product_id')
+    Product.objects.filter(pk__in=products).update(updated_at=timezone.now())
+    invalidate_catalog()
+
+
+def store_variants(model, variants_by_pk):
+    """Save built variants, skipping rows whose image changed meanwhile."""
+    field, variants_field = IMAGE_FIELDS[model._meta.label_lower]
+    stored = []
+    with transaction.atomic():
+        for pk, variants in variants_by_pk.items():
+            if model.objects.filter(pk=pk, **{field: variants['source']}).update(**{variants_field: variants}):
+                stored.append(pk)
+        if stored and model._meta.label_lower != 'products.brand':
+            touch_products(model, stored)
+    return stored
+
+
+def metadata_source(obj):
+    """The uploaded file's name, else the image URL; '' if neither."""
+    return obj.image.name or obj.image_url or ''
+
+
+def check_fetch_scheme(url):
+    if urllib.parse.urlsplit(url).scheme not in FETCH_SCHEMES:
+        raise OSError(f'{url} is not an http(s) URL')
+
+
+def is_public_address(ip):
+    """False for private, loopback, link-local, reserved and multicast addresses."""
+    return ip.is_global and not ip.is_multicast
+
+
+def public_connection(address, timeout=FETCH_TIMEOUT, source_address=None, *args, **kwargs):
+    """``socket.create_connection`` for public hosts only: the name is
+    resolved once, every address checked, and the socket connected to a
+    checked address, so DNS cannot answer differently in between."""
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise OSError(f'Cannot resolve {host}: {exc}') from exc
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not is_public_address(getattr(ip, 'ipv4_mapped', None) or ip):
+            raise OSError(f'{host} resolves to non-public address {ip}')
+    return socket.create_connection((infos[0][4][0], port), timeout, source_address)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # urllib would also follow ftp://, which skips the address check
+        check_fetch_scheme(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch_url(url):
+    """Default ``IMAGE_FETCHER``: the bytes at ``url``.
+
+    ``image_url`` comes from API clients, so only http(s) URLs of public
+    hosts are fetched, redirects included; no proxy is used, as it would
+    make the connection on the fetcher's behalf."""
+    check_fetch_scheme(url)
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler, PublicRedirectHandler,
+    )
+    request = urllib.request.Request(url, headers={'User-Agent': 'sneakr-image-metadata'})
+    with opener.open(request, timeout=FETCH_TIMEOUT) as response:
+        data = response.read(MAX_FETCH_BYTES + 1)
+    if len(data) > MAX_FETCH_BYTES:
+        raise OSError(f'{url} is larger than {MAX_FETCH_BYTES} bytes')
+    return data
+
+
+def dominant_color(image):
+    """Most common of five median-cut colors, as #rrggbb."""
+    palette_image = image.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    count, index = max(palette_image.getcolors())
+    r, g, b = palette_image.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def build_metadata(source, storage=default_storage):
+    """Dimensions, dominant color and BlurHash of a stored file name or URL.
+
+    Like build_derivatives, touches no database."""
+    if source.startswith(('http://', 'https://')):
+        data = import_string(settings.IMAGE_FETCHER)(source)
+    else:
+        with storage.open(source, 'rb') as file:
+            data = file.read()
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    # JPEGs are decoded at 1/8 scale: the placeholder needs a few pixels
+    image.draft('RGB', (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    image = ImageOps.exif_transpose(image)
+    image = flatten(image)
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    return {
+        'source': source,
+        'width': width,
+        'height': height,
+        'color': dominant_color(image),
+        'blurhash': blurhash.encode(image),
+    }
+
+
+def placeholder(meta):
+    """What the API shows of ``image_meta``; None until computed."""
+    if not meta:
+        return None
+    return {name: meta[name] for name in ('width', 'height', 'color', 'blurhash')}
+
+
+def store_metadata(model, meta_by_pk):
+    """Save computed metadata, skipping rows whose image changed meanwhile."""
+    with transaction.atomic():
+        rows = [
+            row for row in model.objects.filter(pk__in=meta_by_pk).only('image', 'image_url')
+            if metadata_source(row) == meta_by_pk[row.pk]['source']
+        ]
+        for row in rows:
+            row.image_meta = meta_by_pk[row.pk]
+        model.objects.bulk_update(rows, ['image_meta'])
+        if rows:
+            touch_products(model, [row.pk for row in rows])
+    return [row.pk for row in rows]
+
+
+def parallel_map(func, items, processes):
+    """``func`` over ``items``, in a pool of ``processes`` when more than
+    one. ``func`` must not use the database: the connections are closed
+    before forking."""
+    if processes <= 1:
+        yield from map(func, items)
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from pool.map(func, items, chunksize=8)
@@ -0,0 +1,323 @@
+"""
+Bulk catalog import behind ``manage.py import_products``.
+
+Rows are streamed from a CSV or JSONL file and written one batch at a
+time, each batch in its own transaction:
+
+- products are upserted on ``sku`` with ``INSERT ... ON CONFLICT DO
+  UPDATE``, setting only the columns the rows supply (and clearing
+  ``image_meta`` when a new ``image_url`` is its source);
+- sizes are upserted on (product, size), and sizes missing from a row's
+  list are deleted;
+- URL images are replaced for products whose list changed (uploaded
+  images are left alone);
+- ``stock_quantity`` is recomputed from the sizes in one UPDATE.
+
+Products, sizes and images that already match their row are not
+written at all, so re-importing a mostly unchanged feed is cheap and
+leaves those products' ``updated_at`` alone.
+
+That is a fixed handful of statements per batch, and only one batch is
+held in memory whatever the size of the file.
+
+CSV columns are the field names of ``ProductRowSerializer``; ``images``
+holds ``|``-separated URLs and ``sizes`` ``|``-separated ``size:stock``
+pairs (a bare size means no stock). In JSONL, ``images`` is a list of
+URLs and ``sizes`` a list of ``{"size": 42, "stock": 5}`` objects.
+Leaving ``images`` or ``sizes`` out (or empty, in CSV) keeps a product's
+current ones.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import invalidate_catalog
+from .models import Brand, Product, ProductImage, ProductSize
+from .signals import deferred_product_touch
+
+LIST_SEPARATOR = '|'
+# Only the first few invalid rows are kept for the report
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(Exception):
+    """A line that could not be parsed at all."""
+
+
+class SizeListField(serializers.Field):
+    """``[{"size": 42, "stock": 5}, ...]``, checked in plain Python: a
+    nested serializer per size was most of the validation time."""
+    default_error_messages = {
+        'invalid': 'Expected a list of {{"size": <int>, "stock": <int>}} objects.',
+        'out_of_range': 'Sizes must be positive and stock not negative.',
+        'duplicate': 'Duplicate size {size}.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            self.fail('invalid')
+        sizes = {}
+        for item in data:
+            try:
+                size, stock = int(item['size']), int(item.get('stock', 0))
+            except (TypeError, KeyError, ValueError, AttributeError):
+                self.fail('invalid')
+            if size < 1 or stock < 0:
+                self.fail('out_of_range')
+            if size in sizes:
+                self.fail('duplicate', size=size)
+            sizes[size] = stock
+        return [{'size': size, 'stock': stock} for size, stock in sizes.items()]
+
+
+class ProductRowSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=200)
+    brand = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    original_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False, allow_null=True
+    )
+    category = serializers.ChoiceField(choices=Product.CATEGORY_CHOICES)
+    is_new = serializers.BooleanField(required=False)
+    is_sale = serializers.BooleanField(required=False)
+    is_featured = serializers.BooleanField(required=False)
+    description_uz = serializers.CharField(allow_blank=True)
+    description_ru = serializers.CharField(allow_blank=True)
+    image_url = serializers.URLField(max_length=500, required=False, allow_blank=True)
+    images = serializers.ListField(child=serializers.URLField(max_length=500), required=False)
+    sizes = SizeListField(required=False)
+
+
+# Columns a row may set on Product itself
+PRODUCT_FIELDS = [
+    'sku', 'name', 'price', 'original_price', 'category', 'is_new', 'is_sale',
+    'is_featured', 'description_uz', 'description_ru', 'image_url',
+]
+
+
+def csv_rows(file):
+    """(line number, row) for each CSV record; blank cells are left out."""
+    reader = csv.DictReader(file)
+    for row in reader:
+        row = {
+            key.strip(): value.strip() for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        }
+        if 'images' in row:
+            row['images'] = [url.strip() for url in row['images'].split(LIST_SEPARATOR) if url.strip()]
+        if 'sizes' in row:
+            sizes = []
+            for item in row['sizes'].split(LIST_SEPARATOR):
+                size, _, stock = item.partition(':')
+                sizes.append({'size': size.strip(), 'stock': stock.strip() or 0})
+            row['sizes'] = sizes
+        yield reader.line_num, row
+
+
+def jsonl_rows(file):
+    """(line number, row) for each non-blank JSONL line."""
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f'Invalid JSON: {exc}')
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stats = ImportStats()
+        # One serializer validates every row, so its fields are built once
+        self.validator = ProductRowSerializer()
+        self.brands = {}
+
+    def run(self, rows):
+        """Import ``rows``, yielding the running stats after each batch."""
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            self.stats.rows += len(batch)
+            valid = self.validate(batch)
+            if valid:
+                with transaction.atomic():
+                    self.import_batch(valid)
+                    if self.dry_run:
+                        transaction.set_rollback(True)
+                if self.dry_run:
+                    # Brands created by the rolled back batch are gone again
+                    self.brands = {}
+            yield self.stats
+
+    def validate(self, batch):
+        """Valid rows by sku; a sku repeated in the batch keeps its last row."""
+        valid = {}
+        for line_number, data in batch:
+            if isinstance(data, RowError):
+                self.stats.add_error(line_number, str(data))
+                continue
+            try:
+                row = self.validator.run_validation(data)
+            except serializers.ValidationError as exc:
+                self.stats.add_error(line_number, json.dumps(exc.detail))
+                continue
+            row['brand'] = ' '.join(row['brand'].split())
+            valid[row['sku']] = row
+        return valid
+
+    def import_batch(self, rows):
+        brands = self.get_brands({row['brand'] for row in rows.values()})
+        current = {
+            values['sku']: values
+            for values in Product.objects.filter(sku__in=rows).values('pk', 'brand_id', 'image', *PRODUCT_FIELDS)
+        }
+
+        # Rows identical to the stored product are skipped, which keeps its
+        # updated_at (and ETag). The rest get one upsert per set of supplied
+        # columns (a CSV file has just one), so columns a row leaves out
+        # keep their current values.
+        groups = {}
+        for sku, row in rows.items():
+            brand = brands[row['brand'].lower()]
+            columns = tuple(name for name in PRODUCT_FIELDS if name in row and name != 'sku')
+            stored = current.get(sku)
+            if stored and stored['brand_id'] == brand.pk and all(stored[name] == row[name] for name in columns):
+                continue
+            product = Product(brand=brand, **{name: row[name] for name in PRODUCT_FIELDS if name in row})
+            product.search_document = product.build_search_document()
+            if stored and 'image_url' in columns and not stored['image'] and stored['image_url'] != row['image_url']:
+                # The placeholder described the old picture;
+                # compute_image_metadata fills it in again
+                columns += ('image_meta',)
+            groups.setdefault(columns, []).append(product)
+        for columns, products in groups.items():
+            Product.objects.bulk_create(
+                products, update_conflicts=True, unique_fields=['sku'],
+                update_fields=[*columns, 'brand', 'search_document', 'updated_at'],
+            )
+        upserted = {product.sku for products in groups.values() for product in products}
+
+        ids = {sku: values['pk'] for sku, values in current.items()}
+        created = [sku for sku in rows if sku not in ids]
+        if created:
+            ids.update(Product.objects.filter(sku__in=created).values_list('sku', 'pk'))
+        touched = self.sync_sizes(
+            {ids[sku]: row['sizes'] for sku, row in rows.items() if 'sizes' in row}
+        ) | self.sync_images(
+            {ids[sku]: row['images'] for sku, row in rows.items() if 'images' in row}
+        )
+        # Sizes and images are part of the product payload
+        children_only = touched - {ids[sku] for sku in upserted}
+        if children_only:
+            Product.objects.filter(pk__in=children_only).update(updated_at=timezone.now())
+        if upserted or touched:
+            invalidate_catalog()
+
+        changed = len(upserted) + len(children_only)
+        self.stats.created += len(created)
+        self.stats.updated += changed - len(created)
+        self.stats.unchanged += len(rows) - changed
+
+    def get_brands(self, names):
+        """Brands by lowercased name, created if missing."""
+        missing = {name.lower(): name for name in names if name.lower() not in self.brands}
+        if missing:
+            self.brands.update(self.find_brands(missing))
+        new = [Brand(name=name) for key, name in missing.items() if key not in self.brands]
+        if new:
+            Brand.objects.bulk_create(new, ignore_conflicts=True)
+            self.brands.update(self.find_brands([brand.name.lower() for brand in new]))
+        return self.brands
+
+    def find_brands(self, keys):
+        return {
+            brand.key: brand
+            for brand in Brand.objects.annotate(key=Lower('name')).filter(key__in=keys)
+        }
+
+    def sync_sizes(self, sizes_by_product):
+        """Bring sizes in line with the rows; returns the products changed."""
+        if not sizes_by_product:
+            return set()
+        current = {
+            (product_id, size): (pk, stock)
+            for pk, product_id, size, stock in ProductSize.objects.filter(
+                product_id__in=sizes_by_product
+            ).values_list('pk', 'product_id', 'size', 'stock')
+        }
+        wanted = {
+            (product_id, size['size']): size['stock']
+            for product_id, sizes in sizes_by_product.items()
+            for size in sizes
+        }
+        stale = [key for key in current if key not in wanted]
+        upserts = [
+            ProductSize(product_id=product_id, size=size, stock=stock)
+            for (product_id, size), stock in wanted.items()
+            if current.get((product_id, size), (None, None))[1] != stock
+        ]
+        if stale:
+            # import_batch touches all the products at once
+            with deferred_product_touch():
+                ProductSize.objects.filter(pk__in=[current[key][0] for key in stale]).delete()
+        if upserts:
+            ProductSize.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=['product', 'size'], update_fields=['stock'],
+            )
+        changed = {product_id for product_id, size in stale} | {size.product_id for size in upserts}
+        if changed:
+            totals = (
+                ProductSize.objects.filter(product=OuterRef('pk'))
+                .order_by().values('product').annotate(total=Sum('stock')).values('total')
+            )
+            Product.objects.filter(pk__in=changed).update(stock_quantity=Coalesce(Subquery(totals), 0))
+        return changed
+
+    def sync_images(self, images_by_product):
+        """Replace URL images whose list changed; returns the products changed."""
+        if not images_by_product:
+            return set()
+        url_images = Q(image='') | Q(image__isnull=True)
+        current = {}
+        for product_id, image_url in (
+            ProductImage.objects.filter(url_images, product_id__in=images_by_product)
+            .order_by('product_id', 'order', 'pk').values_list('product_id', 'image_url')
+        ):
+            current.setdefault(product_id, []).append(image_url)
+        changed = {
+            product_id for product_id, urls in images_by_product.items()
+            if current.get(product_id, []) != urls
+        }
+        if changed:
+            with deferred_product_touch():
+                ProductImage.objects.filter(url_images, product_id__in=changed).delete()
+            ProductImage.objects.bulk_create([
+                ProductImage(product_id=product_id, image_url=url, order=index)
+                for product_id in changed
+                for index, url in enumerate(images_by_product[product_id])
+            ])
+        return changed
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import ORJSONRenderer
+from orders.benchmarks import seed_orders, timed
+from orders.models import Order
+from orders.rows import order_payloads, order_rows
+from orders.serializers import OrderSerializer
+from orders.views import order_items_prefetch
+from products.benchmarks import NAME_PREFIX, seed_products
+from products.models import Product
+from products.rows import product_payloads, product_rows
+from products.serializers import ProductSerializer
+from products.views import catalog_columns, catalog_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        'Time building product and order lists through the serializers and from '
+        'values() rows (queries included), and rendering them with each renderer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--orders', type=int, default=10000, help='Rows to seed the orders table up to')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        seeded = seed_products(options['products'])
+        seed_orders(options['orders'], items_per_order=2)
+        products = Product.objects.filter(name__startswith=NAME_PREFIX).order_by('pk')[:options['products']]
+        orders = Order.objects.order_by('-created_at')[:options['orders']]
+        self.stdout.write(f'{options["products"]} products ({seeded} seeded), {options["orders"]} orders')
+
+        builders = {
+            'products': {
+                'serializer': lambda: ProductSerializer(catalog_queryset(products), many=True).data,
+                'rows': lambda: product_payloads(product_rows(products, catalog_columns())),
+            },
+            'orders': {
+                'serializer': lambda: OrderSerializer(
+                    orders.prefetch_related(order_items_prefetch()), many=True, context={'expand': set()},
+                ).data,
+                'rows': lambda: order_payloads(order_rows(orders)),
+            },
+        }
+        renderers = {'json': JSONRenderer(), 'orjson': ORJSONRenderer()}
+
+        self.stdout.write(f'{"":<10} {"payloads":<11} {"build ms":>9} {"json ms":>8} {"orjson ms":>10} {"bytes":>10}')
+        for name, paths in builders.items():
+            for path, build in paths.items():
+                data = build()
+                rendered = {key: renderer.render(data) for key, renderer in renderers.items()}
+                if len(set(rendered.values())) != 1:
+                    raise CommandError(f'{name} {path}: the renderers disagree')
+                self.stdout.write(
+                    f'{name:<10} {path:<11} {timed(build, options["repeat"]):>9.1f} '
+                    f'{timed(lambda: renderers["json"].render(data), options["repeat"]):>8.1f} '
+                    f'{timed(lambda: renderers["orjson"].render(data), options["repeat"]):>10.1f} '
+                    f'{len(rendered["json"]):>10}'
+                )
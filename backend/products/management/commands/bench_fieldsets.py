@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from orders.benchmarks import timed
+from products.benchmarks import seed_products
+
+# What a catalog grid card shows
+GRID_FIELDS = 'id,name,brand,price,original_price,image,image_srcset,image_meta'
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and latency of a product list page with and without ?fields= / ?lang='
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        seeded = seed_products(options['products'])
+        self.stdout.write(f'{options["products"]} products ({seeded} seeded)')
+
+        client = Client()
+        variants = [
+            ('everything', {}),
+            ('?lang=uz', {'lang': 'uz'}),
+            ('?omit=description', {'omit': 'description'}),
+            ('grid card', {'fields': GRID_FIELDS}),
+            ('grid card, lang', {'fields': f'{GRID_FIELDS},description', 'lang': 'uz'}),
+        ]
+        self.stdout.write(f'{"":<20} {"bytes":>8} {"queries":>8} {"miss ms":>9} {"hit ms":>8}')
+        for label, params in variants:
+
+            def get():
+                return client.get('/api/products/', params, HTTP_HOST='localhost')
+
+            def miss():
+                cache.clear()
+                get()
+
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                size = len(get().content)
+            self.stdout.write(
+                f'{label:<20} {size:>8} {len(queries):>8} '
+                f'{timed(miss, options["repeat"]):>9.2f} {timed(get, options["repeat"]):>8.2f}'
+            )
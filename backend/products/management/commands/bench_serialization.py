@@ -0,0 +1,82 @@
+import time
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from orders.benchmarks import timed
+from products.benchmarks import GALLERY_SIZE, NAME_PREFIX, seed_products
+from products.models import Product, ProductImage, ProductSize, resolve_file_url
+from products.serializers import ProductSerializer
+from products.views import PRODUCT_LIST_FIELDS, catalog_queryset
+
+
+def per_call_image_url(obj):
+    """get_image_url as it was: ask the storage backend every time."""
+    return resolve_file_url(obj.image) or obj.image_url
+
+
+class Command(BaseCommand):
+    help = 'Compare serializing products with stored image URLs against resolving them per call'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--url-latency-ms', type=float, default=0,
+            help='Added to each storage url() call, to stand in for remote or signing storage',
+        )
+
+    def handle(self, *args, **options):
+        seeded = seed_products(options['products'])
+        products = Product.objects.filter(name__startswith=NAME_PREFIX).order_by('pk')[:options['products']]
+        self.stdout.write(f'{options["products"]} products ({seeded} seeded), {GALLERY_SIZE} gallery images each')
+
+        calls = []
+        latency = options['url_latency_ms'] / 1000
+        original_url = FileSystemStorage.url
+
+        def url(storage, name):
+            calls.append(name)
+            if latency:
+                time.sleep(latency)
+            return original_url(storage, name)
+
+        def stored():
+            ProductSerializer(catalog_queryset(products), many=True).data
+
+        # The previous list query: the image column instead of the stored URL
+        per_call_queryset = products.select_related('brand').only(*PRODUCT_LIST_FIELDS, 'image').prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.only(
+                'id', 'product_id', 'image', 'image_url', 'image_variants', 'image_meta', 'order',
+            )),
+            Prefetch('sizes', queryset=ProductSize.objects.only('id', 'product_id', 'size')),
+        )
+
+        def per_call():
+            ProductSerializer(per_call_queryset.all(), many=True).data
+
+        with mock.patch.object(FileSystemStorage, 'url', url):
+            results = {}
+            for label, func, patches in (
+                ('stored URLs', stored, []),
+                ('per-call url()', per_call, [
+                    mock.patch.object(Product, 'get_image_url', per_call_image_url),
+                    mock.patch.object(ProductImage, 'get_image_url', per_call_image_url),
+                ]),
+            ):
+                for patch in patches:
+                    patch.start()
+                try:
+                    calls.clear()
+                    func()
+                    url_calls = len(calls)
+                    results[label] = (timed(func, options['repeat']), url_calls)
+                finally:
+                    for patch in patches:
+                        patch.stop()
+
+        self.stdout.write(f'{"":<16} {"ms":>10} {"url() calls":>12}')
+        for label, (elapsed, url_calls) in results.items():
+            self.stdout.write(f'{label:<16} {elapsed:>10.1f} {url_calls:>12}')
@@ -0,0 +1,65 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from products.images import IMAGE_FIELDS, SOURCE_ERRORS, build_derivatives, parallel_map, store_variants
+
+# Images resized between database writes
+STORE_EVERY = 200
+
+
+def build(name):
+    """Worker: (name, variants or None, error message or None)."""
+    try:
+        return name, build_derivatives(name), None
+    except SOURCE_ERRORS as exc:
+        return name, None, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Build resized WebP/JPEG derivatives for uploaded product images and brand logos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Worker processes resizing images')
+        parser.add_argument('--all', action='store_true', help='Rebuild images that already have derivatives')
+
+    def handle(self, *args, **options):
+        # Each distinct upload is resized once, whichever rows share it
+        targets = {}
+        for label, (field, variants_field) in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if not options['all']:
+                rows = rows.filter(**{variants_field: {}})
+            for pk, name in rows.values_list('pk', field).iterator():
+                targets.setdefault(name, []).append((model, pk))
+        if not targets:
+            self.stdout.write('Nothing to build')
+            return
+
+        started = time.perf_counter()
+        built = failed = 0
+        pending = {}
+        for name, variants, error in parallel_map(build, targets, options['processes']):
+            if error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            for model, pk in targets[name]:
+                pending.setdefault(model, {})[pk] = variants
+            built += 1
+            if built % STORE_EVERY == 0:
+                self.store(pending)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {built} images')
+        self.store(pending)
+        self.stdout.write(self.style.SUCCESS(
+            f'{built} images in {time.perf_counter() - started:.1f}s, {failed} unreadable'
+        ))
+
+    @staticmethod
+    def store(pending):
+        for model, variants_by_pk in pending.items():
+            store_variants(model, variants_by_pk)
+        pending.clear()
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.images import SOURCE_ERRORS, build_metadata, parallel_map, store_metadata
+from products.models import Product, ProductImage
+
+# Images read between database writes
+STORE_EVERY = 500
+
+
+def compute(source):
+    """Worker: (source, metadata or None, error message or None)."""
+    try:
+        return source, build_metadata(source), None
+    except SOURCE_ERRORS as exc:
+        return source, None, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Compute dimensions, dominant color and BlurHash for product and gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Worker processes reading images')
+        parser.add_argument('--all', action='store_true', help='Recompute images whose metadata is current')
+
+    def handle(self, *args, **options):
+        # Each distinct file or URL is read once, whichever rows share it.
+        # Without --all, only images with no metadata or with metadata of
+        # an earlier source (a URL changed by a bulk write) are read.
+        targets = {}
+        for model in (Product, ProductImage):
+            rows = model.objects.values_list('pk', 'image', 'image_url', 'image_meta__source')
+            for pk, name, url, computed in rows.iterator():
+                source = name or url
+                if source and (options['all'] or computed != source):
+                    targets.setdefault(source, []).append((model, pk))
+        if not targets:
+            self.stdout.write('Nothing to compute')
+            return
+
+        started = time.perf_counter()
+        done = failed = 0
+        pending = {}
+        for source, meta, error in parallel_map(compute, targets, options['processes']):
+            if error:
+                failed += 1
+                self.stderr.write(f'{source}: {error}')
+                continue
+            for model, pk in targets[source]:
+                pending.setdefault(model, {})[pk] = meta
+            done += 1
+            if done % STORE_EVERY == 0:
+                self.store(pending)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {done} images')
+        self.store(pending)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} images in {elapsed:.1f}s ({done / max(elapsed, 1e-6):,.0f}/s), {failed} unreadable'
+        ))
+
+    @staticmethod
+    def store(pending):
+        for model, meta_by_pk in pending.items():
+            store_metadata(model, meta_by_pk)
+        pending.clear()
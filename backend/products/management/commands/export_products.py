@@ -0,0 +1,7 @@
+from config.exports import ExportCommand
+from products.exports import ProductExport
+
+
+class Command(ExportCommand):
+    help = 'Write every product with its sizes and images as NDJSON or CSV'
+    export_class = ProductExport
@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import CatalogImporter, csv_rows, jsonl_rows
+
+READERS = {'csv': csv_rows, 'jsonl': jsonl_rows}
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSONL feed, matched on sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll every batch back')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unknown format {file_format!r}; pass --format csv or --format jsonl')
+        if not path.is_file():
+            raise CommandError(f'No such file: {path}')
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        # utf-8-sig drops the byte order mark spreadsheet exports start with
+        with path.open(encoding='utf-8-sig', newline='') as file:
+            for stats in importer.run(READERS[file_format](file)):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {stats.rows} rows, {self.rate(stats, started)} rows/s')
+        stats = importer.stats
+
+        for line_number, message in stats.errors:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if stats.invalid > len(stats.errors):
+            self.stderr.write(f'... and {stats.invalid - len(stats.errors)} more invalid rows')
+        prefix = 'Dry run, nothing saved: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{stats.rows} rows in {time.perf_counter() - started:.1f}s '
+            f'({self.rate(stats, started)} rows/s): {stats.created} created, '
+            f'{stats.updated} updated, {stats.unchanged} unchanged, {stats.invalid} invalid'
+        ))
+
+    @staticmethod
+    def rate(stats, started):
+        return f'{stats.rows / max(time.perf_counter() - started, 1e-6):,.0f}'
@@ -1,10 +1,10 @@
 from django.core.management.base import BaseCommand
-from products.models import Product, ProductImage, ProductSize
+from products.models import Brand, Product, ProductImage, ProductSize
 
 
 class Command(BaseCommand):
     help = 'Load sample products into the database'
-
+    
     def handle(self, *args, **kwargs):
         # Clear existing products
         Product.objects.all().delete()
@@ -82,6 +82,7 @@ class Command(BaseCommand):
         for product_data in products_data:
             images = product_data.pop('images')
             sizes = product_data.pop('sizes')
+            product_data['brand'], _ = Brand.objects.get_or_create(name=product_data['brand'])
             
             product = Product.objects.create(**product_data)
             
@@ -95,9 +96,11 @@ class Command(BaseCommand):
             
             # Create sizes
             for size in sizes:
+                # Orders reserve stock per size, so sample sizes need some
                 ProductSize.objects.create(
                     product=product,
-                    size=size
+                    size=size,
+                    stock=10
                 )
             
             self.stdout.write(self.style.SUCCESS(f'Created product: {product.name}'))
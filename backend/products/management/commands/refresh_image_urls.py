@@ -0,0 +1,61 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.cache import invalidate_catalog
+from products.images import IMAGE_FIELDS, derivative_urls, touch_products
+from products.models import resolve_file_url
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Resolve the stored image URLs (uploads and their resized copies) again: after '
+        'changing the storage backend or MEDIA_URL, and on a schedule with storage that signs URLs'
+    )
+
+    def handle(self, *args, **options):
+        for label, (field, variants_field) in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            has_file_url = any(f.name == 'image_file_url' for f in model._meta.fields)
+            fields = [variants_field, 'image_file_url'] if has_file_url else [variants_field]
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            changed = 0
+            batch = []
+            for row in rows.only(field, *fields).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+                if self.refresh(row, field, variants_field, has_file_url):
+                    batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    changed += self.save(model, batch, fields)
+            changed += self.save(model, batch, fields)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {changed} refreshed')
+        invalidate_catalog()
+
+    @staticmethod
+    def refresh(row, field, variants_field, has_file_url):
+        """Resolve ``row``'s URLs again; True if any changed."""
+        changed = False
+        variants = getattr(row, variants_field)
+        if variants:
+            urls = derivative_urls(variants['digest'], variants['widths'])
+            if any(variants.get(key) != value for key, value in urls.items()):
+                variants.update(urls)
+                changed = True
+        if has_file_url:
+            url = resolve_file_url(getattr(row, field))
+            if url != row.image_file_url:
+                row.image_file_url = url
+                changed = True
+        return changed
+
+    @staticmethod
+    def save(model, batch, fields):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, fields)
+            # New validators for the responses showing them, not 304s with the old URLs
+            if batch and model._meta.label_lower != 'products.brand':
+                touch_products(model, [row.pk for row in batch])
+        count = len(batch)
+        batch.clear()
+        return count
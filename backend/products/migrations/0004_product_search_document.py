@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-17 12:19
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Written out rather than imported from products.search, so later changes
+# there do not alter what this migration does. The vector expression is
+# what products.search.search_vector() compiles to, so queries use it.
+CREATE_SEARCH_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX "product_search_vector_idx" ON "products_product" '
+    "USING gin ((to_tsvector('simple'::regconfig, COALESCE(\"search_document\", ''))))",
+    'CREATE INDEX "product_search_trgm_idx" ON "products_product" USING gin ("search_document" gin_trgm_ops)',
+]
+DROP_SEARCH_INDEXES = [
+    'DROP INDEX IF EXISTS "product_search_vector_idx"',
+    'DROP INDEX IF EXISTS "product_search_trgm_idx"',
+]
+
+
+def backfill_search_document(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    last_pk = 0
+    while True:
+        batch = list(
+            Product.objects.filter(pk__gt=last_pk).order_by('pk').only(
+                'name', 'brand', 'category', 'description_uz', 'description_ru'
+            )[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for product in batch:
+            parts = [product.name, product.brand, product.category, product.description_uz, product.description_ru]
+            product.search_document = ' '.join(str(part) for part in parts if part).lower()
+        Product.objects.bulk_update(batch, ['search_document'])
+        last_pk = batch[-1].pk
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in CREATE_SEARCH_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_SEARCH_INDEXES:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, help_text='Precomputed text for full-text search'),
+        ),
+        migrations.RunPython(backfill_search_document, migrations.RunPython.noop),
+        # SQLite's FTS5 table is managed by products.apps on post_migrate
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
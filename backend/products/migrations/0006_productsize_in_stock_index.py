@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_catalog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productsize',
+            index=models.Index(condition=models.Q(('is_available', True), ('stock__gt', 0)), fields=['size', 'product'], name='productsize_in_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# On PostgreSQL a plain AddField would build the index and check the
+# foreign key while holding locks that block writes. Instead the nullable
+# column is added (no table rewrite), the index is built CONCURRENTLY and
+# the foreign key is added NOT VALID (brief locks), then validated, which
+# lets reads and writes through. CREATE INDEX CONCURRENTLY cannot run in a
+# transaction, so the migration is not atomic.
+ADD_BRAND_REF = [
+    'ALTER TABLE "products_product" ADD COLUMN "brand_ref_id" bigint NULL',
+    'CREATE INDEX CONCURRENTLY "products_product_brand_ref_id_idx" ON "products_product" ("brand_ref_id")',
+    'ALTER TABLE "products_product" ADD CONSTRAINT "products_product_brand_ref_id_fk" '
+    'FOREIGN KEY ("brand_ref_id") REFERENCES "products_brand" ("id") DEFERRABLE INITIALLY DEFERRED NOT VALID',
+    'ALTER TABLE "products_product" VALIDATE CONSTRAINT "products_product_brand_ref_id_fk"',
+]
+REMOVE_BRAND_REF = [
+    'ALTER TABLE "products_product" DROP COLUMN "brand_ref_id"',
+]
+
+
+class AddBrandRef(migrations.AddField):
+    """AddField of the brand foreign key, done with the statements above on
+    PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        for statement in ADD_BRAND_REF:
+            schema_editor.execute(statement)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        for statement in REMOVE_BRAND_REF:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0006_productsize_in_stock_index'),
+    ]
+
+    operations = [
+        AddBrandRef(
+            model_name='product',
+            name='brand_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='products.brand'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def brand_key(name):
+    return ' '.join(name.split()).lower()
+
+
+def link_brands(apps, schema_editor):
+    """Point every product at the Brand matching its brand text, creating
+    brands that don't exist yet. Each batch commits on its own, so the
+    products table is never locked for longer than one short UPDATE."""
+    Brand = apps.get_model('products', 'Brand')
+    Product = apps.get_model('products', 'Product')
+
+    names = Product.objects.order_by().values_list('brand', flat=True).distinct()
+    brands = {brand_key(brand.name): brand.pk for brand in Brand.objects.all()}
+    missing = {}
+    for name in names:
+        key = brand_key(name) or 'unknown'
+        if key not in brands:
+            missing.setdefault(key, ' '.join(name.split()) or 'Unknown')
+    Brand.objects.bulk_create([Brand(name=name) for name in missing.values()], ignore_conflicts=True)
+    brands.update({brand_key(brand.name): brand.pk for brand in Brand.objects.all()})
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Product.objects.filter(pk__gt=last_pk, brand_ref__isnull=True)
+            .order_by('pk').values_list('pk', 'brand')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        by_brand = {}
+        for pk, name in batch:
+            by_brand.setdefault(brands[brand_key(name) or 'unknown'], []).append(pk)
+        for brand_id, pks in by_brand.items():
+            Product.objects.filter(pk__in=pks).update(brand_ref_id=brand_id)
+        last_pk = batch[-1][0]
+
+
+def unlink_brands(apps, schema_editor):
+    Brand = apps.get_model('products', 'Brand')
+    Product = apps.get_model('products', 'Product')
+    for brand in Brand.objects.all():
+        Product.objects.filter(brand_ref=brand).update(brand=brand.name)
+
+
+class Migration(migrations.Migration):
+    # Batches commit one at a time instead of in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0007_product_brand_ref'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_brands, unlink_brands),
+    ]
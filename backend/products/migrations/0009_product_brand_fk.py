@@ -0,0 +1,130 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+backfill = import_module('products.migrations.0008_backfill_product_brand')
+
+# On PostgreSQL the operations below run these statements instead of
+# Django's, which would drop and re-create the foreign key on the rename
+# and scan the table for SET NOT NULL, both under ACCESS EXCLUSIVE locks.
+# For NOT NULL a CHECK constraint is added NOT VALID (a brief lock),
+# validated (a scan that lets reads and writes through) and then lets SET
+# NOT NULL skip its own scan. Each statement commits on its own: the
+# migration is not atomic, so the validation does not run under the
+# earlier locks.
+SET_BRAND_NOT_NULL = [
+    'ALTER TABLE "products_product" ADD CONSTRAINT "products_product_brand_not_null" '
+    'CHECK ("brand_id" IS NOT NULL) NOT VALID',
+    'ALTER TABLE "products_product" VALIDATE CONSTRAINT "products_product_brand_not_null"',
+    'ALTER TABLE "products_product" ALTER COLUMN "brand_id" SET NOT NULL',
+    'ALTER TABLE "products_product" DROP CONSTRAINT "products_product_brand_not_null"',
+]
+DROP_BRAND_NOT_NULL = [
+    'ALTER TABLE "products_product" ALTER COLUMN "brand_id" DROP NOT NULL',
+]
+RENAME_BRAND_REF = [
+    'ALTER TABLE "products_product" RENAME COLUMN "brand_ref_id" TO "brand_id"',
+]
+UNRENAME_BRAND_REF = [
+    'ALTER TABLE "products_product" RENAME COLUMN "brand_id" TO "brand_ref_id"',
+]
+KEEP_BRAND_TEXT = [
+    'ALTER TABLE "products_product" ALTER COLUMN "brand" DROP NOT NULL',
+]
+# Products created without the text column get their brand's name back
+RESTORE_BRAND_TEXT = [
+    'UPDATE "products_product" SET "brand" = (SELECT "name" FROM "products_brand" '
+    'WHERE "products_brand"."id" = "products_product"."brand_ref_id") WHERE "brand" IS NULL',
+    'ALTER TABLE "products_product" ALTER COLUMN "brand" SET NOT NULL',
+]
+
+
+class PostgreSQLStatements:
+    """Runs ``forwards`` / ``backwards`` statements on PostgreSQL in place of
+    the operation's own schema changes; other backends get the latter."""
+    forwards = backwards = ()
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        for statement in self.forwards:
+            schema_editor.execute(statement)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        for statement in self.backwards:
+            schema_editor.execute(statement)
+
+
+class RemoveBrandText(PostgreSQLStatements, migrations.RemoveField):
+    """On PostgreSQL the column only leaves the state: code from before the
+    foreign key may still be running during this deploy and reads it, so
+    it stays (nullable, for new code to insert without it) until a
+    migration of the next release drops it."""
+    forwards = KEEP_BRAND_TEXT
+    backwards = RESTORE_BRAND_TEXT
+
+
+class RenameBrandRef(PostgreSQLStatements, migrations.RenameField):
+    """Only the column: Django would also drop and re-create (and so
+    re-check) the foreign key."""
+    forwards = RENAME_BRAND_REF
+    backwards = UNRENAME_BRAND_REF
+
+
+class SetBrandNotNull(PostgreSQLStatements, migrations.AlterField):
+    forwards = SET_BRAND_NOT_NULL
+    backwards = DROP_BRAND_NOT_NULL
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('products', '0008_backfill_product_brand'),
+    ]
+
+    operations = [
+        # Link products created since 0008 by code that only knows the
+        # text column; NOT NULL below would fail on them
+        migrations.RunPython(backfill.link_brands, migrations.RunPython.noop),
+        # A default lets the text column come back empty on reverse where
+        # it was dropped, for 0008 to fill in again
+        migrations.AlterField(
+            model_name='product',
+            name='brand',
+            field=models.CharField(default='', max_length=100),
+        ),
+        RemoveBrandText(
+            model_name='product',
+            name='brand',
+        ),
+        RenameBrandRef(
+            model_name='product',
+            old_name='brand_ref',
+            new_name='brand',
+        ),
+        # Only NOT NULL reaches the database; related_name and help_text
+        # are state only
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                SetBrandNotNull(
+                    model_name='product',
+                    name='brand',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='products.brand'),
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='product',
+                    name='brand',
+                    field=models.ForeignKey(help_text='Manage brands in the Brands section', on_delete=django.db.models.deletion.PROTECT, related_name='products', to='products.brand'),
+                ),
+            ],
+        ),
+    ]
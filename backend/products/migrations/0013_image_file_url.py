@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-17 13:25
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def resolve_urls(apps, schema_editor):
+    """Store the storage URL of every uploaded image, a batch per commit."""
+    for model_name in ('Product', 'ProductImage'):
+        model = apps.get_model('products', model_name)
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk).exclude(image='').exclude(image__isnull=True)
+                .order_by('pk').only('pk', 'image')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            for row in batch:
+                row.image_file_url = default_storage.url(row.image.name)
+            model.objects.bulk_update(batch, ['image_file_url'])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Batches commit one at a time instead of in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0012_image_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_file_url',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_file_url',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(resolve_urls, migrations.RunPython.noop),
+    ]
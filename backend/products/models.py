@@ -1,11 +1,35 @@
 from django.db import models
 from django.utils.html import mark_safe
 
+from .images import thumbnail_url
+
+
+def resolve_file_url(file):
+    """Storage URL of an uploaded file, '' if there is none."""
+    if file and file.name:
+        try:
+            return file.url
+        except (ValueError, AttributeError):
+            pass
+    return ''
+
+
+def store_image_file_url(instance):
+    """Store the URL of ``instance.image`` once saved (and so uploaded, under
+    its final name). Done on save, not per response: with remote storage
+    ``.url`` can be slow, and serializers read the stored result."""
+    url = resolve_file_url(instance.image)
+    if url != instance.image_file_url:
+        type(instance).objects.filter(pk=instance.pk).update(image_file_url=url)
+        instance.image_file_url = url
+
 
 class Brand(models.Model):
     """Brand model for managing available brands"""
     name = models.CharField(max_length=100, unique=True)
     logo = models.ImageField(upload_to='brands/', null=True, blank=True)
+    # Resized copies of the logo, see products.images
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
     website = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
@@ -19,7 +43,8 @@ class Brand(models.Model):
     
     def logo_preview(self):
         if self.logo:
-            return mark_safe(f'<img src="{self.logo.url}" width="50" height="50" style="object-fit: contain;" />')
+            url = thumbnail_url(self.logo_variants) or self.logo.url
+            return mark_safe(f'<img src="{url}" width="50" height="50" style="object-fit: contain;" />')
         return "No Logo"
     logo_preview.short_description = 'Logo'
 
@@ -32,11 +57,20 @@ class Product(models.Model):
     ]
     
     name = models.CharField(max_length=200)
-    brand = models.CharField(max_length=100, help_text='Brand name - manage brands in Brands section')
+    # Supplier stock-keeping unit; import_products upserts on it
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text='Stock keeping unit')
+    brand = models.ForeignKey(
+        Brand, related_name='products', on_delete=models.PROTECT, help_text='Manage brands in the Brands section'
+    )
     price = models.DecimalField(max_digits=10, decimal_places=2)
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     image_url = models.URLField(max_length=500, blank=True, help_text='Alternative: Use URL instead of uploading')
+    # URL of the uploaded file, resolved by the storage backend on save
+    image_file_url = models.CharField(max_length=500, blank=True, default='', editable=False)
+    # Resized copies of the uploaded image and placeholder metadata, see products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES)
     is_new = models.BooleanField(default=False, help_text='Mark as new arrival')
     is_sale = models.BooleanField(default=False, help_text='Mark as on sale')
@@ -44,6 +78,7 @@ class Product(models.Model):
     stock_quantity = models.IntegerField(default=0, help_text='Total stock across all sizes')
     description_uz = models.TextField(verbose_name='Description (Uzbek)')
     description_ru = models.TextField(verbose_name='Description (Russian)')
+    search_document = models.TextField(blank=True, editable=False, help_text='Precomputed text for full-text search')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -51,23 +86,46 @@ class Product(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        indexes = [
+            # Keyset pagination seeks on (ordering field, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # Storefront filters, newest first
+            models.Index(fields=['category', '-created_at'], name='product_category_created_idx'),
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_new=True), name='product_new_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_sale=True), name='product_sale_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_featured=True), name='product_featured_created_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.brand} - {self.name}"
     
+    def save(self, *args, **kwargs):
+        self.search_document = self.build_search_document()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'search_document' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'search_document']
+        super().save(*args, **kwargs)
+        store_image_file_url(self)
+    
+    def build_search_document(self):
+        """Text indexed by products.search: name, brand, category and both descriptions"""
+        parts = [self.name, self.brand.name, self.category, self.description_uz, self.description_ru]
+        return ' '.join(str(part) for part in parts if part).lower()
+    
     def get_image_url(self):
         """Return uploaded image or URL fallback"""
-        if self.image:
-            # Check if it's actually a file (has a name attribute and file exists)
-            if hasattr(self.image, 'name') and self.image.name:
-                try:
-                    return self.image.url
-                except (ValueError, AttributeError):
-                    pass
-        return self.image_url
+        return self.image_file_url or self.image_url
     
     def image_preview(self):
-        img_url = self.get_image_url()
+        img_url = thumbnail_url(self.image_variants) or self.get_image_url()
         if img_url:
             return mark_safe(f'<img src="{img_url}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />')
         return "No Image"
@@ -85,6 +143,9 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/gallery/', null=True, blank=True)
     image_url = models.URLField(max_length=500, blank=True, help_text='Alternative: Use URL instead of uploading')
+    image_file_url = models.CharField(max_length=500, blank=True, default='', editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     order = models.IntegerField(default=0, help_text='Display order (lower = first)')
     alt_text = models.CharField(max_length=200, blank=True, help_text='Alternative text for accessibility')
     
@@ -96,18 +157,15 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Image {self.order} for {self.product.name}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        store_image_file_url(self)
+    
     def get_image_url(self):
-        if self.image:
-            # Check if it's actually a file (has a name attribute and file exists)
-            if hasattr(self.image, 'name') and self.image.name:
-                try:
-                    return self.image.url
-                except (ValueError, AttributeError):
-                    pass
-        return self.image_url
+        return self.image_file_url or self.image_url
     
     def image_preview(self):
-        img_url = self.get_image_url()
+        img_url = thumbnail_url(self.image_variants) or self.get_image_url()
         if img_url:
             return mark_safe(f'<img src="{img_url}" width="80" height="80" style="object-fit: cover; border-radius: 4px;" />')
         return "No Image"
@@ -123,6 +181,14 @@ class ProductSize(models.Model):
     class Meta:
         ordering = ['size']
         unique_together = ['product', 'size']
+        indexes = [
+            # Size filter and facet only consider sizes in stock
+            models.Index(
+                fields=['size', 'product'],
+                condition=models.Q(stock__gt=0, is_available=True),
+                name='productsize_in_stock_idx',
+            ),
+        ]
         verbose_name = 'Product Size'
         verbose_name_plural = 'Product Sizes'
     
@@ -0,0 +1,125 @@
+"""
+Full-text product search over ``Product.search_document``.
+
+PostgreSQL matches the document against a ``websearch_to_tsquery`` through
+a GIN index on ``to_tsvector('simple', search_document)``, and falls back to
+trigram word similarity (GIN ``gin_trgm_ops`` index) so that typos and
+partial brand names such as "jordn" still match. Results are ranked by
+``ts_rank`` and then similarity. Both indexes are created by migration
+0004, whose vector expression must stay what :func:`search_vector`
+compiles to.
+
+SQLite (local development and tests) uses an FTS5 table kept in sync by
+triggers, with prefix matching on every term and bm25 ranking. Other
+backends fall back to ``icontains`` on the document.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+
+FTS_TABLE = 'products_product_fts'
+SEARCH_CONFIG = 'simple'
+
+
+def search_tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_products(queryset, text):
+    """Filter ``queryset`` to products matching ``text``, best matches first."""
+    tokens = search_tokens(text)
+    if not tokens:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, ' '.join(tokens))
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, tokens)
+    for token in tokens:
+        queryset = queryset.filter(search_document__icontains=token)
+    return queryset
+
+
+def _search_postgresql(queryset, text):
+    from django.contrib.postgres.lookups import TrigramWordSimilar
+    from django.contrib.postgres.search import (
+        SearchQuery, SearchRank, SearchVectorExact, TrigramWordSimilarity,
+    )
+
+    vector = search_vector()
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(SearchVectorExact(vector, query)) | Q(TrigramWordSimilar(F('search_document'), text))
+    ).annotate(
+        search_rank=SearchRank(vector, query),
+        search_similarity=TrigramWordSimilarity(text, 'search_document'),
+    ).order_by('-search_rank', '-search_similarity', '-created_at')
+
+
+def _search_sqlite(queryset, tokens):
+    # Every term must match, each as a prefix ("jord" finds "jordan")
+    match = ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+    table = queryset.model._meta.db_table
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            [match],
+        ),
+    ).order_by('search_rank', '-created_at')
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+    # Must compile to the same expression as the index from migration 0004
+    return SearchVector('search_document', config=SEARCH_CONFIG)
+
+
+def ensure_sqlite_fts(using):
+    """
+    Create the FTS5 table and its sync triggers if missing, then rebuild it.
+
+    Runs after every migrate: SQLite migrations that alter products_product
+    rebuild the table, which drops triggers attached to it.
+    """
+    table = 'products_product'
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"search_document, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) "
+        f"VALUES ('delete', old.id, old.search_document); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_document ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) "
+        f"VALUES ('delete', old.id, old.search_document); "
+        f"INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document); END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+    with connections[using].cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by :func:`search_products` instead of ILIKE ORs."""
+
+    def filter_queryset(self, request, queryset, view):
+        text = ' '.join(self.get_search_terms(request))
+        return search_products(queryset, text)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over name, brand, category and descriptions',
+            'schema': {'type': 'string'},
+        }]
@@ -1,16 +1,29 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import Product, ProductImage, ProductSize
+from .images import placeholder, srcset_map
+from .models import Brand, Product, ProductImage, ProductSize
+
+# Description languages, as in description_<language>
+LANGUAGES = ('uz', 'ru')
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    meta = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['image_url']
+        fields = ['image_url', 'srcset', 'meta']
     
     def get_image_url(self, obj):
         return obj.get_image_url()
+    
+    def get_srcset(self, obj):
+        return srcset_map(obj.image_variants)
+    
+    def get_meta(self, obj):
+        return placeholder(obj.image_meta)
 
 
 class ProductSizeSerializer(serializers.ModelSerializer):
@@ -19,31 +32,79 @@ class ProductSizeSerializer(serializers.ModelSerializer):
         fields = ['size']
 
 
+class BrandNameField(serializers.SlugRelatedField):
+    """A product's brand by name, as the API has always taken it; names
+    not seen before create the brand."""
+    
+    def __init__(self, **kwargs):
+        super().__init__(slug_field='name', queryset=Brand.objects.all(), **kwargs)
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        name = ' '.join(data.split())
+        if not name or len(name) > Brand._meta.get_field('name').max_length:
+            self.fail('invalid')
+        # Brand.name is only unique case-sensitively: the oldest of any
+        # case variants wins, and a concurrent create of the same name is reused
+        brands = self.get_queryset().filter(name__iexact=name).order_by('pk')
+        brand = brands.first()
+        if brand is None:
+            try:
+                with transaction.atomic():
+                    brand = self.get_queryset().create(name=name)
+            except IntegrityError:
+                brand = brands.first()
+        return brand
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    brand = serializers.CharField(source='brand.name', read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     sizes = ProductSizeSerializer(many=True, read_only=True)
     description = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    # Resized WebP/JPEG copies of an uploaded image; null until built
+    image_srcset = serializers.SerializerMethodField()
+    # Width, height, dominant color and BlurHash; null until computed
+    image_meta = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'brand', 'price', 'original_price', 
-            'image', 'images', 'sizes', 'category', 'is_new', 
+            'image', 'image_srcset', 'image_meta', 'images', 'sizes', 'category', 'is_new', 
             'is_sale', 'description', 'created_at', 'updated_at'
         ]
     
+    def get_fields(self):
+        fields = super().get_fields()
+        # ?fields= / ?omit= keep only some of them, see products.views.product_fieldset
+        names = self.context.get('fields')
+        if names is not None:
+            fields = {name: field for name, field in fields.items() if name in names}
+        return fields
+    
     def get_image(self, obj):
         return obj.get_image_url()
     
+    def get_image_srcset(self, obj):
+        return srcset_map(obj.image_variants)
+    
+    def get_image_meta(self, obj):
+        return placeholder(obj.image_meta)
+    
     def get_description(self, obj):
+        # ?lang= keeps one language, in the same shape
+        lang = self.context.get('lang')
         return {
-            'uz': obj.description_uz,
-            'ru': obj.description_ru
+            language: getattr(obj, f'description_{language}')
+            for language in ([lang] if lang else LANGUAGES)
         }
 
 
 class ProductCreateSerializer(serializers.ModelSerializer):
+    brand = BrandNameField()
     images = serializers.ListField(
         child=serializers.URLField(),
         write_only=True,
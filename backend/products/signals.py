@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from .cache import invalidate_catalog
+from .images import IMAGE_FIELDS, metadata_source
+from .models import Brand, Product, ProductImage, ProductSize
+from .tasks import build_image_derivatives, compute_image_metadata, rebuild_search_documents
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+# Set while a bulk writer touches the products it changed itself, at once
+_touch_deferred = ContextVar('touch_deferred', default=False)
+
+
+@contextmanager
+def deferred_product_touch():
+    """Skip the per-row product touch of image and size signals; the
+    caller moves updated_at and invalidates the catalog afterwards."""
+    token = _touch_deferred.set(True)
+    try:
+        yield
+    finally:
+        _touch_deferred.reset(token)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def product_child_changed(sender, instance, **kwargs):
+    if _touch_deferred.get():
+        return
+    # Images and sizes are part of the product payload, so they move the
+    # product's updated_at (and with it the ETag / Last-Modified) too.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    invalidate_catalog()
+
+
+@receiver(pre_save, sender=Brand)
+def brand_saving(sender, instance, **kwargs):
+    instance.previous_name = (
+        Brand.objects.filter(pk=instance.pk).values_list('name', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Brand)
+def brand_changed(sender, instance, created, **kwargs):
+    if created or instance.previous_name == instance.name:
+        return
+    # Products carry the brand name in their payload and search document
+    Product.objects.filter(brand=instance).update(updated_at=timezone.now())
+    invalidate_catalog()
+    enqueue(rebuild_search_documents, brand_id=instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Brand)
+def image_saving(sender, instance, update_fields=None, **kwargs):
+    # Derivatives of a replaced (or removed) upload no longer apply
+    field, variants_field = IMAGE_FIELDS[sender._meta.label_lower]
+    instance.image_changed = False
+    if update_fields is not None and field not in update_fields:
+        return
+    name = getattr(instance, field).name or ''
+    instance.image_changed = name != getattr(instance, variants_field).get('source', '')
+    if instance.image_changed:
+        setattr(instance, variants_field, {})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Brand)
+def image_saved(sender, instance, **kwargs):
+    field, variants_field = IMAGE_FIELDS[sender._meta.label_lower]
+    if getattr(instance, 'image_changed', False) and getattr(instance, field):
+        enqueue(build_image_derivatives, model=sender._meta.label_lower, pk=instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def image_meta_saving(sender, instance, update_fields=None, **kwargs):
+    instance.image_source_changed = False
+    if update_fields is not None and not {'image', 'image_url'} & set(update_fields):
+        return
+    instance.image_source_changed = metadata_source(instance) != instance.image_meta.get('source', '')
+    if instance.image_source_changed:
+        instance.image_meta = {}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_meta_saved(sender, instance, **kwargs):
+    if getattr(instance, 'image_source_changed', False) and metadata_source(instance):
+        enqueue(compute_image_metadata, model=sender._meta.label_lower, pk=instance.pk)
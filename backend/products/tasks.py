@@ -0,0 +1,105 @@
+"""Background work for the catalog, run by ``manage.py run_workers``."""
+import logging
+
+from django.apps import apps
+from django.db import transaction
+
+from jobs.queue import task
+from . import images
+from .cache import invalidate_catalog
+from .models import Product, ProductImage, ProductSize
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+@task
+def rebuild_search_documents(brand_id):
+    """Re-index a brand's products after it was renamed."""
+    products = Product.objects.filter(brand_id=brand_id).select_related('brand').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        for product in batch:
+            product.search_document = product.build_search_document()
+        Product.objects.bulk_update(batch, ['search_document'])
+        last_pk = batch[-1].pk
+
+
+def copy_of(instance, **changes):
+    """An unsaved copy of ``instance`` with ``changes`` applied."""
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields if not field.primary_key
+    }
+    values.update(changes)
+    return type(instance)(**values)
+
+
+@task
+def duplicate_products(product_ids):
+    """
+    Clone products with their sizes and images as "<name> (Copy)".
+
+    Three SELECTs and three bulk INSERTs in one transaction, however many
+    products and children there are. Returns the number of clones.
+    """
+    originals = list(
+        Product.objects.filter(pk__in=product_ids).select_related('brand')
+        .prefetch_related('sizes', 'images').order_by('pk')
+    )
+    clones = []
+    for product in originals:
+        # SKUs are unique: the copy gets its own later, if any
+        clone = copy_of(product, name=f'{product.name} (Copy)', sku=None)
+        clone.brand = product.brand
+        # bulk_create skips save(), which normally builds this
+        clone.search_document = clone.build_search_document()
+        clones.append(clone)
+    with transaction.atomic():
+        clones = Product.objects.bulk_create(clones, batch_size=BATCH_SIZE)
+        pairs = list(zip(originals, clones))
+        ProductSize.objects.bulk_create([
+            copy_of(size, product_id=clone.pk) for product, clone in pairs for size in product.sizes.all()
+        ], batch_size=BATCH_SIZE)
+        ProductImage.objects.bulk_create([
+            copy_of(image, product_id=clone.pk) for product, clone in pairs for image in product.images.all()
+        ], batch_size=BATCH_SIZE)
+        # bulk_create sends no post_save signals
+        invalidate_catalog()
+    return len(clones)
+
+
+@task
+def build_image_derivatives(model, pk):
+    """Resize a newly uploaded image (see products.images)."""
+    field, _ = images.IMAGE_FIELDS[model]
+    model = apps.get_model(model)
+    name = model.objects.filter(pk=pk).values_list(field, flat=True).first()
+    if not name:
+        return
+    try:
+        variants = images.build_derivatives(name)
+    except images.SOURCE_ERRORS as exc:
+        logger.warning('No derivatives for %s %s (%s): %s', model._meta.label, pk, name, exc)
+        return
+    images.store_variants(model, {pk: variants})
+
+
+@task
+def compute_image_metadata(model, pk):
+    """Dimensions, color and BlurHash for a new image (see products.images)."""
+    model = apps.get_model(model)
+    row = model.objects.filter(pk=pk).only('image', 'image_url').first()
+    source = row and images.metadata_source(row)
+    if not source:
+        return
+    try:
+        meta = images.build_metadata(source)
+    except images.SOURCE_ERRORS as exc:
+        logger.warning('No metadata for %s %s (%s): %s', model._meta.label, pk, source, exc)
+        return
+    images.store_metadata(model, {pk: meta})
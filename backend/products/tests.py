@@ -1,3 +1,1238 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Timer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import ProtectedError, QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from jobs.models import Job
+from jobs.queue import run_batch
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from config.renderers import ORJSONParser, ORJSONRenderer
+from . import images, tasks
+from .cache import get_or_build
+from .exports import ProductExport
+from .blurhash import encode as blurhash_encode, encode83
+from .images import derivative_name
+from .importer import CatalogImporter, csv_rows, jsonl_rows
+from .models import Brand, Product, ProductImage, ProductSize
+from .rows import product_payloads, product_rows
+from .serializers import BrandNameField, ProductSerializer
+from .views import ProductViewSet, catalog_columns, catalog_queryset
+
+
+def make_product(index, **overrides):
+    data = {
+        'name': f'Sneaker {index}',
+        'brand': 'Nike',
+        'price': 1000000 + index,
+        'category': 'men',
+        'description_uz': 'Tavsif',
+        'description_ru': 'Описание',
+    }
+    data.update(overrides)
+    data['brand'], _ = Brand.objects.get_or_create(name=data['brand'])
+    product = Product.objects.create(**data)
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image_url=f'https://example.com/{index}/{n}.jpg', order=n)
+        for n in range(3)
+    ])
+    ProductSize.objects.bulk_create([
+        ProductSize(product=product, size=size, stock=5)
+        for size in range(39, 45)
+    ])
+    return product
+
+
+class ProductQueryBudgetTests(TestCase):
+    """Every read endpoint runs a fixed number of queries, whatever the catalog size."""
+
+    def assertQueryBudget(self, url, budget):
+        for count in (2, 10):
+            for index in range(Product.objects.count(), count):
+                make_product(index, is_new=True, is_sale=True)
+            cache.clear()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        # validators aggregate, COUNT(*), products, images, sizes
+        self.assertQueryBudget(reverse('product-list'), 5)
+
+    def test_retrieve(self):
+        # validators aggregate, product, images, sizes
+        product = make_product(0)
+        self.assertQueryBudget(reverse('product-detail', args=[product.pk]), 4)
+
+    def test_by_category(self):
+        self.assertQueryBudget(reverse('product-by-category') + '?category=men', 4)
+
+    def test_new_arrivals(self):
+        self.assertQueryBudget(reverse('product-new-arrivals'), 4)
+
+    def test_on_sale(self):
+        self.assertQueryBudget(reverse('product-on-sale'), 4)
+
+    def test_payload_unchanged(self):
+        product = make_product(0)
+        response = self.client.get(reverse('product-detail', args=[product.pk]))
+        self.assertEqual(response.data['brand'], 'Nike')
+        self.assertEqual(len(response.data['images']), 3)
+        self.assertEqual([s['size'] for s in response.data['sizes']], list(range(39, 45)))
+        self.assertEqual(response.data['description'], {'uz': 'Tavsif', 'ru': 'Описание'})
+
+
+class ProductFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(0)
+
+    def test_fields_narrow_payload_and_queries(self):
+        url = reverse('product-list')
+        # validators aggregate, COUNT(*), products; no images or sizes
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'fields': 'id,name,price,image'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price', 'image'})
+
+    def test_omit(self):
+        data = self.client.get(
+            reverse('product-detail', args=[self.product.pk]), {'omit': 'images,sizes,description'}
+        ).data
+        self.assertEqual(data['brand'], 'Nike')
+        self.assertNotIn('images', data)
+        self.assertNotIn('description', data)
+
+    def test_lang_keeps_one_description(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'lang': 'ru'}).data
+        self.assertEqual(data['description'], {'ru': 'Описание'})
+        self.assertFalse(any('description_uz' in query['sql'] for query in queries))
+
+    def test_invalid_params(self):
+        url = reverse('product-list')
+        self.assertEqual(self.client.get(url, {'fields': 'name,secret'}).data, {'fields': 'Unknown field(s): secret.'})
+        self.assertEqual(self.client.get(url, {'omit': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'lang': 'en'}).status_code, 400)
+
+    def test_cached_per_fieldset(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        full = self.client.get(url)
+        narrow = self.client.get(url, {'fields': 'name'})
+        self.assertEqual(narrow.json(), {'name': 'Sneaker 0'})
+        self.assertNotEqual(narrow['ETag'], full['ETag'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'fields': 'name'}).json(), {'name': 'Sneaker 0'})
+        self.assertIn('images', self.client.get(url).json())
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    """Admin changelists run a fixed number of queries, whatever the page size."""
+
+    def setUp(self):
+        self.products = [make_product(index) for index in range(30)]
+        ProductSize.objects.filter(product=self.products[0]).update(stock=0)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def assertQueryBudget(self, model, budget):
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+        for per_page in (5, 30):
+            with mock.patch.object(admin.site._registry[model], 'list_per_page', per_page):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), per_page)
+
+    def test_products(self):
+        # session, user, 2 x COUNT, products with their stock totals,
+        # 2 x date hierarchy, brand filter choices
+        self.assertQueryBudget(Product, 8)
+
+    def test_sizes(self):
+        # session, user, 2 x COUNT, sizes joined to products, size and
+        # brand filter choices
+        self.assertQueryBudget(ProductSize, 7)
+
+    def test_images(self):
+        self.assertQueryBudget(ProductImage, 6)
+
+    def test_brands(self):
+        Brand.objects.bulk_create([Brand(name=f'Brand {n}') for n in range(29)])
+        # session, user, 2 x COUNT, brands with their product counts
+        self.assertQueryBudget(Brand, 5)
+        response = self.client.get(reverse('admin:products_brand_changelist'), {'o': '-3'})
+        top = response.context['cl'].result_list[0]
+        self.assertEqual((top.name, top.products_total), ('Nike', 30))
+
+    def test_stock_totals(self):
+        # Sorted by the Stock column, ascending
+        response = self.client.get(reverse('admin:products_product_changelist'), {'o': '7'})
+        results = response.context['cl'].result_list
+        self.assertEqual((results[0].pk, results[0].sizes_stock), (self.products[0].pk, 0))
+        self.assertEqual(results[1].sizes_stock, 30)
+        self.assertContains(response, 'Out of Stock', count=1)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(0, is_sale=True)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        url = reverse('product-list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.json(), second.json())
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get(reverse('product-list'))
+        with self.assertNumQueries(5):
+            self.client.get(reverse('product-list') + '?ordering=price')
+
+    def test_product_save_invalidates(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+        self.assertEqual(self.client.get(url).json()['name'], 'Renamed')
+
+    def test_size_delete_invalidates(self):
+        url = reverse('product-on-sale')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.sizes.filter(size=39).delete()
+        sizes = [s['size'] for s in self.client.get(url).json()[0]['sizes']]
+        self.assertNotIn(39, sizes)
+
+    def test_admin_bulk_action_invalidates(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        url = reverse('product-on-sale')
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:products_product_changelist'), {
+                'action': 'remove_sale_flag',
+                '_selected_action': [self.product.pk],
+            })
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_cold_key_waits_for_concurrent_build(self):
+        cache.add('catalog:test:lock', 1)
+        Timer(0.1, cache.set, args=['catalog:test', ['built elsewhere']]).start()
+        built = []
+        self.assertEqual(get_or_build('catalog:test', lambda: built.append(1) or ['mine']), ['built elsewhere'])
+        self.assertEqual(built, [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(0, is_new=True)
+
+    def test_list_etag_round_trip(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        # max(updated_at) would not move when a product is deleted
+        self.assertNotIn('Last-Modified', response)
+        cache.clear()
+        # Cold cache: one aggregate query and no serialization
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_warm_cache_answers_304_without_queries(self):
+        url = reverse('product-new-arrivals')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_or_malformed_id_is_404(self):
+        for pk in (self.product.pk + 1000, 'abc'):
+            response = self.client.get(reverse('product-detail', args=[pk]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_list_deletion_is_not_hidden_by_if_modified_since(self):
+        url = reverse('product-list')
+        make_product(1)
+        since = http_date(timezone.now().timestamp() + 60)
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_size_change_moves_etag(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductSize.objects.create(product=self.product, size=46)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_query_params_change_etag(self):
+        url = reverse('product-list')
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.client.get(url + '?ordering=price')['ETag'],
+        )
+
+
+class ProductKeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_ordering_fields_with_ties(self):
+        # Prices repeat so that pages have to break ties on id
+        products = [make_product(index, price=1000000 + index % 3) for index in range(25)]
+        seen = self.walk(reverse('product-list') + '?pagination=cursor&ordering=-price')
+        expected = sorted(products, key=lambda p: (p.price, p.pk), reverse=True)
+        self.assertEqual(seen, [p.pk for p in expected])
+
+        seen = self.walk(reverse('product-list') + '?pagination=cursor&ordering=name')
+        expected = sorted(products, key=lambda p: (p.name, p.pk))
+        self.assertEqual(seen, [p.pk for p in expected])
+
+    def test_unknown_ordering_falls_back_to_created_at(self):
+        products = [make_product(index) for index in range(3)]
+        seen = self.walk(reverse('product-list') + '?pagination=cursor&ordering=description_uz')
+        self.assertEqual(seen, [p.pk for p in reversed(products)])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.jordan = make_product(
+            0, name='Air Jordan 1 High', description_uz='Afsonaviy basketbol krossovkasi',
+            description_ru='Легендарные баскетбольные кроссовки',
+        )
+        self.ultraboost = make_product(1, name='Ultraboost 22', brand='Adidas', category='unisex')
+        self.samba = make_product(2, name='Samba OG', brand='Adidas', category='women')
+
+    def search(self, text):
+        response = self.client.get(reverse('product-list'), {'search': text})
+        return [product['id'] for product in response.data['results']]
+
+    def test_matches_name_and_brand(self):
+        self.assertEqual(self.search('adidas samba'), [self.samba.pk])
+        self.assertCountEqual(self.search('adidas'), [self.ultraboost.pk, self.samba.pk])
+
+    def test_matches_descriptions_in_both_languages(self):
+        self.assertEqual(self.search('basketbol'), [self.jordan.pk])
+        self.assertEqual(self.search('легендарные'), [self.jordan.pk])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search('jord'), [self.jordan.pk])
+
+    def test_document_follows_edits(self):
+        self.samba.name = 'Gazelle'
+        self.samba.save()
+        self.assertEqual(self.search('samba'), [])
+        self.assertEqual(self.search('gazelle'), [self.samba.pk])
+
+    def test_deleted_products_drop_out(self):
+        self.ultraboost.delete()
+        self.assertEqual(self.search('ultraboost'), [])
+
+    def test_better_matches_rank_first(self):
+        mention = make_product(
+            3, name='Court', brand='Adidas', description_uz='Klassik poyabzal ' * 20 + 'jordan uslubida',
+        )
+        self.assertEqual(self.search('jordan'), [self.jordan.pk, mention.pk])
+
+
+class QueryPlanAssertions:
+    """Assert via EXPLAIN that a queryset is answered from an index, not a table scan."""
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+            self.assertIn('Index', plan, plan)
+        elif connection.vendor == 'sqlite':
+            table = queryset.model._meta.db_table
+            for line in plan.splitlines():
+                if f' {table} ' in f'{line} ' and ('SCAN' in line or 'SEARCH' in line):
+                    self.assertIn('USING', line, plan)
+            self.assertNotIn('TEMP B-TREE', plan, plan)
+        else:
+            self.skipTest(f'No plan assertions for {connection.vendor}')
+        if index_name:
+            self.assertIn(index_name, plan, plan)
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+class ProductQueryPlanTests(QueryPlanAssertions, TestCase):
+    """The storefront's hot queries stay on indexes at catalog scale."""
+    catalog_size = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=365)
+        created_at = Product._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        brands = Brand.objects.bulk_create([Brand(name=f'Brand {n}') for n in range(40)])
+        try:
+            Product.objects.bulk_create([
+                Product(
+                    name=f'Sneaker {n}', brand=brands[n % 40], price=500000 + n,
+                    category=['men', 'women', 'unisex'][n % 3],
+                    # Flags are rare in a real catalog
+                    is_new=n % 50 == 0, is_sale=n % 40 == 0, is_featured=n % 200 == 0,
+                    description_uz='Tavsif', description_ru='Описание',
+                    created_at=start + timedelta(minutes=n),
+                )
+                for n in range(cls.catalog_size)
+            ], batch_size=2000)
+        finally:
+            created_at.auto_now_add = True
+
+    def setUp(self):
+        self.analyze()
+
+    def view_queryset(self, action):
+        return ProductViewSet(action=action).get_queryset()
+
+    def test_list_page(self):
+        self.assertUsesIndex(self.view_queryset('list')[:20])
+
+    def test_by_category(self):
+        self.assertUsesIndex(
+            self.view_queryset('by_category').filter(category='women'),
+            'product_category_created_idx',
+        )
+
+    def test_new_arrivals(self):
+        self.assertUsesIndex(
+            self.view_queryset('new_arrivals').filter(is_new=True), 'product_new_created_idx'
+        )
+
+    def test_on_sale(self):
+        self.assertUsesIndex(
+            self.view_queryset('on_sale').filter(is_sale=True), 'product_sale_created_idx'
+        )
+
+    def test_featured(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_featured=True), 'product_featured_created_idx'
+        )
+
+    def test_keyset_page(self):
+        self.assertUsesIndex(self.view_queryset('list').order_by('-created_at', '-pk')[:21])
+        self.assertUsesIndex(self.view_queryset('list').order_by('price', 'pk')[:21])
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.air_max = make_product(0, name='Air Max', brand='Nike', price=900000, is_sale=True)
+        self.jordan = make_product(1, name='Jordan 1', brand='Nike', price=2500000, is_new=True)
+        self.samba = make_product(2, name='Samba', brand='Adidas', price=1200000, category='women')
+        # Sold out in 39 everywhere but Samba; Air Max has no size 44 at all
+        ProductSize.objects.exclude(product=self.samba).filter(size=39).update(stock=0)
+        self.air_max.sizes.filter(size=44).delete()
+
+    def ids(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return {product['id'] for product in response.data['results']}
+
+    def facets(self, **params):
+        cache.clear()
+        response = self.client.get(reverse('product-facets'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_filters(self):
+        self.assertEqual(self.ids(brand='Nike'), {self.air_max.pk, self.jordan.pk})
+        self.assertEqual(self.ids(brand='Nike,Adidas', category='women'), {self.samba.pk})
+        self.assertEqual(self.ids(size='39'), {self.samba.pk})
+        self.assertEqual(self.ids(size='44'), {self.jordan.pk, self.samba.pk})
+        self.assertEqual(self.ids(price_min='1000000', price_max='2000000'), {self.samba.pk})
+        self.assertEqual(self.ids(is_new='true'), {self.jordan.pk})
+        self.assertEqual(self.ids(is_sale='false', brand='Nike'), {self.jordan.pk})
+
+    def test_invalid_filter_values(self):
+        self.assertEqual(self.client.get(reverse('product-list'), {'price_min': 'cheap'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('product-list'), {'size': 'xl'}).status_code, 400)
+        for size in ('99999999999999999999999', str(2 ** 31)):
+            response = self.client.get(reverse('product-list'), {'size': size})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('size', response.data)
+        self.assertEqual(self.client.get(reverse('product-facets'), {'size': '-' + '9' * 30}).status_code, 400)
+        for value in ('NaN', 'sNaN', 'Infinity', '-inf'):
+            response = self.client.get(reverse('product-list'), {'price_max': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('price_max', response.data)
+
+    def test_facet_counts(self):
+        data = self.facets()
+        self.assertEqual(data['count'], 3)
+        facets = data['facets']
+        self.assertEqual(facets['brand'], [{'value': 'Adidas', 'count': 1}, {'value': 'Nike', 'count': 2}])
+        self.assertEqual(facets['category'], [{'value': 'men', 'count': 2}, {'value': 'women', 'count': 1}])
+        sizes = {row['value']: row['count'] for row in facets['size']}
+        self.assertEqual(sizes[39], 1)
+        self.assertEqual(sizes[40], 3)
+        self.assertEqual(sizes[44], 2)
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 1, 0, 1, 0])
+        self.assertEqual((facets['is_new'], facets['is_sale']), (1, 1))
+
+    def test_facets_are_disjunctive(self):
+        data = self.facets(brand='Nike', is_new='true')
+        self.assertEqual(data['count'], 1)
+        # Other brands stay visible, narrowed by the remaining filters
+        self.assertEqual(data['facets']['brand'], [{'value': 'Nike', 'count': 1}])
+        data = self.facets(brand='Nike')
+        self.assertEqual(data['facets']['brand'], [{'value': 'Adidas', 'count': 1}, {'value': 'Nike', 'count': 2}])
+        self.assertEqual(data['facets']['category'], [{'value': 'men', 'count': 2}])
+        self.assertEqual(data['facets']['is_new'], 1)
+
+    def test_facets_respect_search(self):
+        data = self.facets(search='samba')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['facets']['brand'], [{'value': 'Adidas', 'count': 1}])
+
+    def test_facet_query_budget(self):
+        for index in range(3, 13):
+            make_product(index, brand=f'Brand {index}')
+        cache.clear()
+        # validators aggregate + brand, category, size, price/flags aggregates
+        with self.assertNumQueries(5):
+            self.client.get(reverse('product-facets'), {'brand': 'Nike,Brand 4', 'size': '40,41', 'price_max': '3000000'})
+
+
+class BrandTests(TestCase):
+    def setUp(self):
+        self.product = make_product(0, name='Air Max')
+
+    def test_payload_carries_brand_name(self):
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]))
+        self.assertEqual(response.data['brand'], 'Nike')
+
+    def test_create_takes_brand_name(self):
+        data = {
+            'name': 'Gazelle', 'price': '900000.00', 'category': 'men', 'sizes': [42],
+            'description_uz': 'Tavsif', 'description_ru': 'Описание',
+        }
+        response = self.client.post(reverse('product-list'), {**data, 'brand': ' nike '}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(reverse('product-list'), {**data, 'brand': 'Adidas'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(Brand.objects.values_list('name', flat=True)), ['Adidas', 'Nike'])
+        self.assertEqual(Product.objects.filter(brand__name='Nike').count(), 2)
+        response = self.client.post(reverse('product-list'), {**data, 'brand': ' '}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_case_variants_resolve_to_the_oldest_brand(self):
+        Brand.objects.create(name='NIKE')
+        data = {
+            'name': 'Pegasus', 'brand': 'nike', 'price': '900000.00', 'category': 'men', 'sizes': [42],
+            'description_uz': 'Tavsif', 'description_ru': 'Описание',
+        }
+        response = self.client.post(reverse('product-list'), data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.get(name='Pegasus').brand, self.product.brand)
+
+    def test_concurrently_created_brand_is_reused(self):
+        Brand.objects.create(name='Puma')
+        real_first = QuerySet.first
+        lookups = []
+
+        def first(queryset):
+            # The first lookup runs before the other request's INSERT
+            lookups.append(queryset.model)
+            return None if len(lookups) == 1 else real_first(queryset)
+
+        field = BrandNameField()
+        with mock.patch.object(QuerySet, 'first', first):
+            brand = field.to_internal_value('Puma')
+        self.assertEqual(brand.name, 'Puma')
+        self.assertEqual(Brand.objects.filter(name='Puma').count(), 1)
+
+    def test_rename_reaches_payload_and_search(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        brand = self.product.brand
+        brand.name = 'Jordan Brand'
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['brand'], 'Jordan Brand')
+        run_batch()
+        self.product.refresh_from_db()
+        self.assertIn('jordan brand', self.product.search_document)
+
+    def test_brand_with_products_cannot_be_deleted(self):
+        with self.assertRaises(ProtectedError):
+            self.product.brand.delete()
+
+
+class DuplicateProductsTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(index) for index in range(3)]
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def duplicate(self, products):
+        return self.client.post(reverse('admin:products_product_changelist'), {
+            'action': 'duplicate_products',
+            '_selected_action': [product.pk for product in products],
+        })
+
+    def test_clones_products_with_children(self):
+        self.duplicate(self.products[:2])
+        copy = Product.objects.get(name='Sneaker 0 (Copy)')
+        self.assertEqual(copy.brand.name, 'Nike')
+        self.assertIn('sneaker 0 (copy)', copy.search_document)
+        self.assertEqual(sorted(copy.sizes.values_list('size', 'stock')), [(size, 5) for size in range(39, 45)])
+        self.assertEqual(
+            list(copy.images.values_list('image_url', flat=True)),
+            [f'https://example.com/0/{n}.jpg' for n in range(3)],
+        )
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(self.products[0].sizes.count(), 6)
+
+    def test_query_count_does_not_grow_with_children(self):
+        # products, sizes, images, then savepoint, three bulk INSERTs, release
+        with self.assertNumQueries(8):
+            tasks.duplicate_products([self.products[0].pk])
+        ProductSize.objects.bulk_create([
+            ProductSize(product=product, size=size, stock=1)
+            for product in self.products for size in range(45, 60)
+        ])
+        with self.assertNumQueries(8):
+            self.assertEqual(tasks.duplicate_products([product.pk for product in self.products]), 3)
+
+    def test_clone_of_a_product_with_a_sku(self):
+        Product.objects.filter(pk=self.products[0].pk).update(sku='NK-0')
+        self.assertEqual(tasks.duplicate_products([self.products[0].pk]), 1)
+        self.assertIsNone(Product.objects.get(name='Sneaker 0 (Copy)').sku)
+        self.assertEqual(Product.objects.get(sku='NK-0').pk, self.products[0].pk)
+
+    def test_large_selection_runs_in_background(self):
+        with mock.patch.object(admin.site._registry[Product], 'duplicate_inline_limit', 2):
+            self.duplicate(self.products)
+        self.assertEqual(Product.objects.count(), 3)
+        run_batch()
+        self.assertEqual(Product.objects.filter(name__endswith='(Copy)').count(), 3)
+
+
+class ImportProductsTests(TestCase):
+    HEADER = 'sku,name,brand,price,category,description_uz,description_ru,images,sizes\n'
+
+    def feed(self, *lines):
+        return self.HEADER + ''.join(f'{line}\n' for line in lines)
+
+    def run_import(self, text, batch_size=1000, dry_run=False):
+        importer = CatalogImporter(batch_size=batch_size, dry_run=dry_run)
+        for _ in importer.run(csv_rows(io.StringIO(text))):
+            pass
+        return importer.stats
+
+    def test_creates_then_updates_without_duplicates(self):
+        stats = self.run_import(self.feed(
+            'A-1,Air 1,Nike,1000000,men,Tavsif,Описание,https://x.test/1.jpg|https://x.test/2.jpg,41:3|42:2',
+            'A-2,Gel 2,asics,900000,women,Tavsif,Описание,,40',
+        ))
+        self.assertEqual((stats.created, stats.updated, stats.invalid), (2, 0, 0))
+        product = Product.objects.get(sku='A-1')
+        self.assertEqual(product.brand.name, 'Nike')
+        self.assertEqual(product.stock_quantity, 5)
+        self.assertIn('air 1', product.search_document)
+        self.assertEqual(
+            list(product.images.values_list('image_url', flat=True)),
+            ['https://x.test/1.jpg', 'https://x.test/2.jpg'],
+        )
+        self.assertEqual(list(Product.objects.get(sku='A-2').sizes.values_list('size', 'stock')), [(40, 0)])
+
+        stats = self.run_import(self.feed(
+            'A-1,Air 1 Low,NIKE,1100000,men,Tavsif,Описание,https://x.test/2.jpg,42:7|43:1',
+        ))
+        self.assertEqual((stats.created, stats.updated), (0, 1))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Brand.objects.count(), 2)
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.price, product.stock_quantity), ('Air 1 Low', 1100000, 8))
+        self.assertEqual(sorted(product.sizes.values_list('size', 'stock')), [(42, 7), (43, 1)])
+        self.assertEqual(list(product.images.values_list('image_url', flat=True)), ['https://x.test/2.jpg'])
+
+    def test_unchanged_rows_are_not_written(self):
+        line = 'A-1,Air 1,Nike,1000000,men,Tavsif,Описание,https://x.test/1.jpg,41:3'
+        self.run_import(self.feed(line))
+        updated_at = Product.objects.get(sku='A-1').updated_at
+        stats = self.run_import(self.feed(line))
+        self.assertEqual((stats.updated, stats.unchanged), (0, 1))
+        self.assertEqual(Product.objects.get(sku='A-1').updated_at, updated_at)
+
+        stats = self.run_import(self.feed(line.replace('41:3', '41:2')))
+        self.assertEqual(stats.updated, 1)
+        product = Product.objects.get(sku='A-1')
+        self.assertGreater(product.updated_at, updated_at)
+        self.assertEqual(product.stock_quantity, 2)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        stats = self.run_import(self.feed(
+            'A-1,Air 1,Nike,1000000,men,Tavsif,Описание,,',
+            'A-2,Air 2,Nike,-5,men,Tavsif,Описание,,',
+            'A-3,Air 3,Nike,1000000,kids,Tavsif,Описание,,41:x',
+        ))
+        self.assertEqual((stats.rows, stats.created, stats.invalid), (3, 1, 2))
+        self.assertEqual([line for line, message in stats.errors], [3, 4])
+        self.assertIn('price', stats.errors[0][1])
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['A-1'])
+
+    def test_jsonl(self):
+        rows = [
+            {'sku': 'J-1', 'name': 'Jordan', 'brand': 'Nike', 'price': '1500000', 'category': 'men',
+             'description_uz': '', 'description_ru': '', 'sizes': [{'size': 42, 'stock': 4}]},
+            {'sku': 'J-2'},
+        ]
+        text = '\n'.join(json.dumps(row) for row in rows) + '\n{broken\n'
+        importer = CatalogImporter()
+        for _ in importer.run(jsonl_rows(io.StringIO(text))):
+            pass
+        self.assertEqual((importer.stats.created, importer.stats.invalid), (1, 2))
+        self.assertEqual(Product.objects.get(sku='J-1').stock_quantity, 4)
+
+    def test_dry_run_saves_nothing(self):
+        stats = self.run_import(self.feed('A-1,Air 1,Puma,1000000,men,Tavsif,Описание,,41:3'), dry_run=True)
+        self.assertEqual(stats.created, 1)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Brand.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def lines(count, stock):
+            return [
+                f'S-{n},Shoe {n},Nike,1000000,men,Tavsif,Описание,https://x.test/{n}.jpg,41:{stock}|42:1'
+                for n in range(count)
+            ]
+        self.run_import(self.feed(*lines(2, 1)))
+        # savepoint, brands, products, upsert, sizes, size upsert,
+        # stock_quantity, images, release
+        with self.assertNumQueries(9):
+            self.run_import(self.feed(*lines(2, 2)))
+        self.run_import(self.feed(*lines(20, 1)))
+        with self.assertNumQueries(9):
+            self.run_import(self.feed(*lines(20, 2)))
+
+    def test_deletes_touch_products_once_per_batch(self):
+        def lines(count, images, sizes):
+            return [
+                f'S-{n},Shoe {n},Nike,1000000,men,Tavsif,Описание,{images.format(n)},{sizes}'
+                for n in range(count)
+            ]
+        for count in (2, 20):
+            self.run_import(self.feed(*lines(count, 'https://x.test/{}.jpg|https://x.test/b.jpg', '41:1|42:1')))
+            # The deletes collect their rows, but the products are touched
+            # in one UPDATE, not once per deleted size or image
+            with self.assertNumQueries(13):
+                self.run_import(self.feed(*lines(count, 'https://x.test/{}.jpg', '41:1')))
+        self.assertEqual(ProductSize.objects.count(), 20)
+        self.assertEqual(ProductImage.objects.count(), 20)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as file:
+            file.write(self.feed('A-1,Air 1,Nike,1000000,men,Tavsif,Описание,,41:3'))
+            file.flush()
+            out = io.StringIO()
+            call_command('import_products', file.name, '--batch-size', '10', stdout=out)
+        self.assertIn('1 rows', out.getvalue())
+        self.assertIn('1 created', out.getvalue())
+        self.assertTrue(Product.objects.filter(sku='A-1').exists())
+
+
+class ProductExportTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(index, sku=f'S-{index}') for index in range(3)]
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def export(self, file_format, params=None):
+        response = self.client.get(reverse('product-export', args=[file_format]), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        records = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual([record['sku'] for record in records], ['S-0', 'S-1', 'S-2'])
+        self.assertEqual(records[0]['brand'], 'Nike')
+        self.assertEqual(records[0]['price'], '1000000.00')
+        self.assertEqual(records[0]['sizes'][0], {'size': 39, 'stock': 5, 'is_available': True})
+        self.assertEqual(records[0]['images'], [f'https://example.com/0/{n}.jpg' for n in range(3)])
+
+    def test_csv_uses_import_formats(self):
+        rows = list(csv.DictReader(self.export('csv').splitlines()))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['sizes'], '39:5|40:5|41:5|42:5|43:5|44:5')
+        self.assertEqual(rows[0]['images'].split('|')[0], 'https://example.com/0/0.jpg')
+
+    def test_created_at_range(self):
+        Product.objects.filter(pk=self.products[0].pk).update(created_at=timezone.now() - timedelta(days=30))
+        records = self.export('ndjson', {'created_before': (timezone.now() - timedelta(days=1)).date()})
+        self.assertEqual([json.loads(line)['sku'] for line in records.splitlines()], ['S-0'])
+
+    def test_query_count_grows_with_chunks_not_products(self):
+        # products, then images and sizes for each chunk of two
+        with self.assertNumQueries(5):
+            self.assertEqual(len(list(ProductExport(chunk_size=2).lines('ndjson'))), 3)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('product-export', args=['csv'])).status_code, 403)
+
+
+def make_upload(name, size=(1000, 600), mode='RGB', image_format='JPEG', color='red'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def test_upload_queues_derivatives(self):
+        product = make_product(0, image=make_upload('shoe.jpg'))
+        self.assertEqual(product.image_variants, {})
+        self.assertIsNone(self.client.get(reverse('product-detail', args=[product.pk])).data['image_srcset'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_batch()
+        product.refresh_from_db()
+        digest = product.image_variants['digest']
+        self.assertEqual(product.image_variants['widths'], [200, 400, 800])
+        for width in (200, 400, 800):
+            with default_storage.open(derivative_name(digest, width, 'webp')) as file:
+                self.assertEqual(Image.open(file).size, (width, width * 600 // 1000))
+            self.assertTrue(default_storage.exists(derivative_name(digest, width, 'jpeg')))
+
+        srcset = self.client.get(reverse('product-detail', args=[product.pk])).data['image_srcset']
+        self.assertEqual(srcset['webp'].split(', ')[0], f'/media/derivatives/{digest[:2]}/{digest}/200.webp 200w')
+        self.assertTrue(srcset['jpeg'].endswith('/800.jpg 800w'))
+        self.assertIn('/200.jpg', product.image_preview())
+
+    def test_small_images_are_not_upscaled(self):
+        image = ProductImage.objects.create(
+            product=make_product(0), image=make_upload('logo.png', (300, 300), 'RGBA', 'PNG')
+        )
+        run_batch()
+        image.refresh_from_db()
+        self.assertEqual(image.image_variants['widths'], [200])
+        with default_storage.open(derivative_name(image.image_variants['digest'], 200, 'jpeg')) as file:
+            self.assertEqual(Image.open(file).mode, 'RGB')
+
+    def test_replacing_the_upload_clears_variants(self):
+        product = make_product(0, image=make_upload('shoe.jpg'))
+        run_batch()
+        product.refresh_from_db()
+        product.image = make_upload('other.jpg', (900, 900))
+        product.save()
+        self.assertEqual(product.image_variants, {})
+        run_batch()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        # Edits that leave the image alone queue nothing
+        product.name = 'Renamed'
+        product.save()
+        self.assertFalse(Job.objects.exists())
+
+    def test_unreadable_upload_is_not_retried(self):
+        product = make_product(0, image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        with self.assertLogs('products.tasks', 'WARNING'):
+            run_batch()
+        self.assertFalse(Job.objects.exists())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+
+    def test_backfill_command(self):
+        upload = make_upload('shoe.jpg')
+        products = [make_product(index) for index in range(2)]
+        Product.objects.filter(pk=products[0].pk).update(image=default_storage.save('products/a.jpg', upload))
+        brand = products[0].brand
+        Brand.objects.filter(pk=brand.pk).update(logo=default_storage.save('brands/nike.png', upload))
+        out = io.StringIO()
+        call_command('build_image_derivatives', '--processes', '1', stdout=out)
+        self.assertIn('2 images', out.getvalue())
+        products[0].refresh_from_db()
+        brand.refresh_from_db()
+        # Same content: the files are shared
+        self.assertEqual(products[0].image_variants['digest'], brand.logo_variants['digest'])
+        call_command('build_image_derivatives', '--processes', '1', stdout=out)
+        self.assertIn('Nothing to build', out.getvalue())
+
+
+STUB_IMAGES = {}
+STUB_FETCHES = []
+
+
+def stub_fetch(url):
+    """IMAGE_FETCHER for tests: serves STUB_IMAGES instead of the network."""
+    STUB_FETCHES.append(url)
+    if url not in STUB_IMAGES:
+        raise OSError(f'404 {url}')
+    return STUB_IMAGES[url]
+
+
+@override_settings(IMAGE_FETCHER='products.tests.stub_fetch')
+class ImageMetadataTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        STUB_IMAGES.clear()
+        STUB_FETCHES.clear()
+        STUB_IMAGES['https://cdn.test/blue.png'] = make_upload('blue.png', (400, 500), image_format='PNG', color='blue').read()
+        cache.clear()
+
+    def test_blurhash_of_a_solid_color(self):
+        value = blurhash_encode(Image.new('RGB', (32, 20), (255, 0, 0)))
+        # 4x3 components: size flag, maximum, DC and 11 AC pairs
+        self.assertEqual(len(value), 28)
+        self.assertEqual(value[2:6], encode83(0xff0000, 4))
+
+    def test_upload(self):
+        product = make_product(0, image=make_upload('shoe.jpg'))
+        run_batch()
+        product.refresh_from_db()
+        meta = product.image_meta
+        self.assertEqual((meta['width'], meta['height'], meta['color']), (1000, 600, '#fe0000'))
+        self.assertEqual(len(meta['blurhash']), 28)
+        data = self.client.get(reverse('product-detail', args=[product.pk])).data
+        self.assertEqual(data['image_meta'], {name: meta[name] for name in ('width', 'height', 'color', 'blurhash')})
+
+    def test_exif_rotation_swaps_dimensions(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new('RGB', (800, 200), 'red').save(buffer, 'JPEG', exif=exif)
+        product = make_product(0, image=SimpleUploadedFile('rotated.jpg', buffer.getvalue()))
+        run_batch()
+        product.refresh_from_db()
+        self.assertEqual((product.image_meta['width'], product.image_meta['height']), (200, 800))
+
+    def test_image_urls_use_the_fetcher(self):
+        product = make_product(0, image_url='https://cdn.test/blue.png')
+        image = ProductImage.objects.create(product=product, image_url='https://cdn.test/blue.png', order=9)
+        ProductImage.objects.create(product=product, image_url='https://cdn.test/missing.png', order=10)
+        with self.assertLogs('products.tasks', 'WARNING'):
+            run_batch()
+        self.assertFalse(Job.objects.exists())
+        image.refresh_from_db()
+        self.assertEqual(image.image_meta['color'], '#0000ff')
+        self.assertEqual(STUB_FETCHES.count('https://cdn.test/blue.png'), 2)
+        images = self.client.get(reverse('product-detail', args=[product.pk])).data['images']
+        self.assertEqual(images[-2]['meta']['width'], 400)
+        self.assertIsNone(images[-1]['meta'])
+
+    def test_command_reads_each_source_once(self):
+        products = [make_product(index) for index in range(3)]
+        ProductImage.objects.filter(product__in=products).update(image_url='https://cdn.test/blue.png')
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compute_image_metadata', '--processes', '1', stdout=out)
+        self.assertIn('1 images', out.getvalue())
+        self.assertEqual(STUB_FETCHES, ['https://cdn.test/blue.png'])
+        self.assertFalse(ProductImage.objects.filter(image_meta={}).exists())
+        call_command('compute_image_metadata', '--processes', '1', stdout=out)
+        self.assertIn('Nothing to compute', out.getvalue())
+
+    def test_imported_url_change_drops_stale_metadata(self):
+        STUB_IMAGES['https://cdn.test/red.png'] = make_upload('red.png', (300, 100), image_format='PNG').read()
+        product = make_product(0, sku='S-0', image_url='https://cdn.test/blue.png')
+        ProductImage.objects.all().delete()
+        run_batch()
+        row = {'sku': 'S-0', 'name': product.name, 'brand': 'Nike', 'price': str(product.price), 'category': 'men',
+               'description_uz': 'Tavsif', 'description_ru': 'Описание', 'image_url': 'https://cdn.test/red.png'}
+        importer = CatalogImporter()
+        for _ in importer.run(jsonl_rows(io.StringIO(json.dumps(row)))):
+            pass
+        self.assertIsNone(self.client.get(reverse('product-detail', args=[product.pk])).data['image_meta'])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compute_image_metadata', '--processes', '1', stdout=io.StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.image_meta['source'], 'https://cdn.test/red.png')
+        self.assertEqual(product.image_meta['width'], 300)
+
+
+class FetchTestHandler(BaseHTTPRequestHandler):
+    redirects = {'/to-private': 'http://10.0.0.1/shoe.png', '/to-ftp': 'ftp://example.com/shoe.png'}
+
+    def do_GET(self):
+        if self.path in self.redirects:
+            self.send_response(302)
+            self.send_header('Location', self.redirects[self.path])
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'image')
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchUrlTests(TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FetchTestHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base = f'http://127.0.0.1:{server.server_port}'
+
+    def allow_loopback(self):
+        return mock.patch.object(images, 'is_public_address', lambda ip: ip.is_loopback or ip.is_global)
+
+    def test_only_http_urls(self):
+        for url in ('file:///etc/passwd', 'ftp://example.com/shoe.png', 'gopher://example.com/'):
+            with self.assertRaises(OSError):
+                images.fetch_url(url)
+
+    def test_non_public_hosts_are_refused(self):
+        with self.assertRaisesRegex(OSError, 'non-public'):
+            images.fetch_url(f'{self.base}/shoe.png')
+        with mock.patch('socket.getaddrinfo', return_value=[(2, 1, 6, '', ('169.254.169.254', 80))]):
+            with self.assertRaisesRegex(OSError, 'non-public'):
+                images.fetch_url('http://metadata.test/latest/')
+        with self.allow_loopback():
+            self.assertEqual(images.fetch_url(f'{self.base}/shoe.png'), b'image')
+
+    def test_redirects_are_checked(self):
+        with self.allow_loopback():
+            with self.assertRaisesRegex(OSError, 'non-public'):
+                images.fetch_url(f'{self.base}/to-private')
+            with self.assertRaisesRegex(OSError, 'not an http'):
+                images.fetch_url(f'{self.base}/to-ftp')
+
+
+class ImageUrlTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def test_url_is_stored_on_save(self):
+        product = make_product(0, image=make_upload('shoe.jpg'), image_url='https://cdn.test/shoe.jpg')
+        self.assertEqual(product.image_file_url, f'/media/{product.image.name}')
+        self.assertEqual(product.get_image_url(), product.image_file_url)
+        product.image = None
+        product.save(update_fields=['image'])
+        product.refresh_from_db()
+        self.assertEqual(product.image_file_url, '')
+        self.assertEqual(product.get_image_url(), 'https://cdn.test/shoe.jpg')
+
+    def test_serializing_asks_storage_for_no_urls(self):
+        product = make_product(0, image=make_upload('shoe.jpg'))
+        ProductImage.objects.create(product=product, image=make_upload('side.jpg'), order=9)
+        run_batch()
+        with mock.patch.object(FileSystemStorage, 'url') as url:
+            data = self.client.get(reverse('product-list')).data['results'][0]
+        url.assert_not_called()
+        self.assertEqual(data['image'], f'/media/{product.image.name}')
+        self.assertTrue(data['images'][-1]['image_url'].startswith('/media/products/gallery/side'))
+        self.assertTrue(data['images'][-1]['srcset']['jpeg'].startswith('/media/derivatives/'))
+
+    def test_refresh_command(self):
+        product = make_product(0, image=make_upload('shoe.jpg'))
+        run_batch()
+        product.refresh_from_db()
+        updated_at = product.updated_at
+        with override_settings(MEDIA_URL='https://cdn.test/media/'):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('refresh_image_urls', stdout=io.StringIO())
+            product.refresh_from_db()
+            self.assertEqual(product.image_file_url, f'https://cdn.test/media/{product.image.name}')
+            self.assertTrue(product.image_variants['thumbnail'].startswith('https://cdn.test/media/derivatives/'))
+            self.assertTrue(product.image_variants['srcset']['webp'].startswith('https://cdn.test/media/derivatives/'))
+            # Validators move, so conditional requests get the new URLs
+            self.assertGreater(product.updated_at, updated_at)
+            out = io.StringIO()
+            call_command('refresh_image_urls', stdout=out)
+        self.assertIn('Products: 0 refreshed', out.getvalue())
+
+    def test_url_is_resolved_under_the_stored_name(self):
+        make_product(0, image=make_upload('shoe.jpg'))
+        product = make_product(1, image=make_upload('shoe.jpg'))
+        # The second upload is renamed by the storage; the URL follows it
+        self.assertNotEqual(product.image.name, 'products/shoe.jpg')
+        self.assertEqual(product.image_file_url, f'/media/{product.image.name}')
+        self.assertEqual(Product.objects.get(pk=product.pk).image_file_url, product.image_file_url)
+
+
+@override_settings(IMAGE_FETCHER='products.tests.stub_fetch')
+class FastListSerializationTests(TestCase):
+    """products.rows and ORJSONRenderer give the same bytes as
+    ProductSerializer and JSONRenderer."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        STUB_IMAGES['https://cdn.test/2.png'] = make_upload('2.png', image_format='PNG').read()
+        make_product(0, image=make_upload('shoe.jpg'), original_price=1500000, is_sale=True)
+        make_product(1, name='Кроссовки “Air”', description_uz='Line\u2028separator', is_new=True)
+        product = make_product(2, brand='Adidas', image_url='https://cdn.test/2.png')
+        ProductImage.objects.create(product=product, image=make_upload('side.png', (300, 200), image_format='PNG'), order=5)
+        run_batch()
+        for index in range(3, 25):
+            make_product(index, category='women')
+
+    def assertSameResponses(self, url, params=None):
+        responses = []
+        for fast in (True, False):
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                responses.append(self.client.get(url, params))
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[0].content, responses[1].content)
+        return responses[0]
+
+    def test_payloads_match_the_serializer(self):
+        for fields, lang in ((None, None), ({'name', 'images', 'price'}, None), (None, 'ru')):
+            expected = ProductSerializer(
+                catalog_queryset(None, fields, lang), many=True, context={'fields': fields, 'lang': lang}
+            ).data
+            rows = product_rows(Product.objects.all(), catalog_columns(fields, lang))
+            self.assertEqual(product_payloads(rows, fields, lang), expected)
+
+    def test_list_endpoints(self):
+        self.assertSameResponses(reverse('product-list'))
+        self.assertSameResponses(reverse('product-list'), {'page': 2, 'ordering': 'price'})
+        self.assertSameResponses(reverse('product-list'), {'fields': 'id,name,image_srcset', 'lang': 'uz'})
+        self.assertSameResponses(reverse('product-list'), {'search': 'sneaker'})
+        self.assertSameResponses(reverse('product-by-category'), {'category': 'men'})
+        self.assertSameResponses(reverse('product-on-sale'))
+        with override_settings(TIME_ZONE='Asia/Tashkent'):
+            self.assertSameResponses(reverse('product-new-arrivals'))
+
+    def test_keyset_pages(self):
+        url, params = reverse('product-list'), {'pagination': 'cursor', 'ordering': 'name'}
+        while url:
+            data = self.assertSameResponses(url, params).json()
+            url, params = data['next'], None
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'when': timezone.now(), 'price': Decimal('12.50'), 'lazy': gettext_lazy('Product'),
+            'text': 'Кроссовки \u2028 \u2029 "quoted"', 'numbers': [1, 2.5, 10 ** 30], 1: None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(ORJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+
+    def test_renderer_decimals_beyond_plain_floats(self):
+        for value in ('1E+16', '12345678901234567', '0.00001', '-0.00000123', '0.0001', '0', '2000000.00'):
+            data = {'subtotal': Decimal(value), 'values': [Decimal(value)]}
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), value)
+        for value in ('NaN', 'Infinity', '-Infinity'):
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'subtotal': Decimal(value)})
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'subtotal': Decimal(value)})
+
+    def test_renderer_plain_floats(self):
+        data = [0.0, 0.1 + 0.2, 2000000.0, 123456789012345.6, 0.0001, -9999999999999998.0]
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # Not checked, as documented in config.renderers
+        self.assertEqual(ORJSONRenderer().render([1e16, float('nan')]), b'[1e16,null]')
+
+    def test_parser(self):
+        body = '{"name": "Кроссовки", "sizes": [40, 41]}'.encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), {'name': 'Кроссовки', 'sizes': [40, 41]})
+        for invalid in (b'{"name": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(invalid))
+
+
+class AsyncProductViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [make_product(index, brand='Nike' if index % 2 else 'Adidas') for index in range(25)]
+
+    def assertSameAsSync(self, sync_name, async_name, params=None, args=None):
+        expected = self.client.get(reverse(sync_name, args=args), params)
+        response = self.client.get(reverse(async_name, args=args), params)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Only the paths in next/previous links differ
+        self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content)
+
+    def test_list_matches_sync_endpoint(self):
+        self.assertSameAsSync('product-list', 'async-product-list')
+        self.assertSameAsSync('product-list', 'async-product-list', {'page': 2})
+        self.assertSameAsSync('product-list', 'async-product-list', {'brand': 'Nike', 'size': '42'})
+        self.assertSameAsSync('product-list', 'async-product-list', {'search': 'sneaker 7'})
+
+    def test_detail_matches_sync_endpoint(self):
+        pk = self.products[3].pk
+        self.assertSameAsSync('product-detail', 'async-product-detail', args=[pk])
+        self.assertSameAsSync('product-detail', 'async-product-detail', args=[999999])
+
+    def test_errors(self):
+        response = self.client.get(reverse('async-product-list'), {'page': 9})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('async-product-list'), {'price_min': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(reverse('async-product-list')).status_code, 405)
+
+    def test_list_query_count(self):
+        # COUNT, page, images, sizes
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('async-product-list'))
+        self.assertEqual(len(response.json()['results']), 20)
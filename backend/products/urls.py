@@ -1,10 +1,16 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet
+from . import async_views
+from .views import ProductViewSet, product_export
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 
 urlpatterns = [
+    # Ahead of the router, whose detail route would take 'export' for a pk
+    re_path(r'^products/export\.(?P<file_format>ndjson|csv)$', product_export, name='product-export'),
     path('', include(router.urls)),
+    # Async (ASGI) variants of the read endpoints
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
 ]
@@ -1,38 +1,200 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import viewsets, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .models import Product
-from .serializers import ProductSerializer, ProductCreateSerializer
+from .cache import cached_catalog_response
+from .exports import ProductExport
+from .models import Product, ProductImage, ProductSize
+from .rows import product_payloads, product_rows
+from .filters import ProductFilter, ProductFilterBackend
+from .search import ProductSearchFilter
+from .serializers import LANGUAGES, ProductSerializer, ProductCreateSerializer
+
+
+# Columns read by ProductSerializer; everything else stays in the database.
+PRODUCT_LIST_FIELDS = [
+    'id', 'name', 'brand__name', 'price', 'original_price', 'image_file_url', 'image_url', 'image_variants',
+    'image_meta', 'category', 'is_new', 'is_sale', 'description_uz', 'description_ru',
+    'created_at', 'updated_at',
+]
+
+
+# The same, per ProductSerializer field ('images' and 'sizes' are prefetched)
+FIELD_COLUMNS = {
+    'id': ['id'],
+    'name': ['name'],
+    'brand': ['brand__name'],
+    'price': ['price'],
+    'original_price': ['original_price'],
+    'image': ['image_file_url', 'image_url'],
+    'image_srcset': ['image_variants'],
+    'image_meta': ['image_meta'],
+    'images': [],
+    'sizes': [],
+    'category': ['category'],
+    'is_new': ['is_new'],
+    'is_sale': ['is_sale'],
+    'description': ['description_uz', 'description_ru'],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at'],
+}
+# Always loaded: keyset pagination reads the last row's ordering column
+ORDERING_FIELDS = ['price', 'created_at', 'name']
+
+
+def catalog_columns(fields=None, lang=None):
+    """Product columns ProductSerializer reads for ``fields`` (serializer
+    field names, None for all) in ``lang`` (None for both)."""
+    if fields is None and lang is None:
+        return PRODUCT_LIST_FIELDS
+    columns = {'id', *ORDERING_FIELDS}
+    for name in FIELD_COLUMNS if fields is None else fields:
+        columns.update(FIELD_COLUMNS[name])
+    if lang:
+        columns -= {f'description_{language}' for language in LANGUAGES if language != lang}
+    return sorted(columns)
+
+
+def catalog_queryset(queryset=None, fields=None, lang=None):
+    """Products ready for ProductSerializer: list columns and brand name,
+    plus prefetched images and sizes. Given ``fields`` (serializer field
+    names) or ``lang``, only what those need is read."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    columns = catalog_columns(fields, lang)
+    if fields is None or 'brand' in fields:
+        queryset = queryset.select_related('brand')
+    # Images and sizes are loaded in one query each, whatever the page size
+    prefetches = []
+    if fields is None or 'images' in fields:
+        prefetches.append(Prefetch(
+            'images',
+            queryset=ProductImage.objects.only(
+                'id', 'product_id', 'image_file_url', 'image_url', 'image_variants', 'image_meta', 'order',
+            ),
+        ))
+    if fields is None or 'sizes' in fields:
+        prefetches.append(Prefetch(
+            'sizes',
+            queryset=ProductSize.objects.only('id', 'product_id', 'size'),
+        ))
+    return queryset.only(*columns).prefetch_related(*prefetches)
+
+
+def product_fieldset(query_params):
+    """(fields, lang) asked for with ?fields= / ?omit= (comma-separated
+    ProductSerializer fields) and ?lang=; None where not given."""
+    fields = None
+    requested = ProductFilter.get_list(query_params, 'fields')
+    omitted = ProductFilter.get_list(query_params, 'omit')
+    for param, names in (('fields', requested), ('omit', omitted)):
+        unknown = [name for name in names if name not in FIELD_COLUMNS]
+        if unknown:
+            raise ValidationError({param: f'Unknown field(s): {", ".join(unknown)}.'})
+    if requested or omitted:
+        fields = {name for name in requested or FIELD_COLUMNS if name not in omitted}
+    lang = query_params.get('lang') or None
+    if lang is not None and lang not in LANGUAGES:
+        raise ValidationError({'lang': f'"{lang}" is not one of {", ".join(LANGUAGES)}.'})
+    return fields, lang
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'brand', 'category']
-    ordering_fields = ['price', 'created_at', 'name']
+    filter_backends = [ProductFilterBackend, ProductSearchFilter, filters.OrderingFilter]
+    ordering_fields = ORDERING_FIELDS
+    
+    def get_fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return None, None
+        return product_fieldset(request.query_params)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return queryset
+        return catalog_queryset(queryset, *self.get_fieldset())
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['lang'] = self.get_fieldset()
+        return context
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return ProductCreateSerializer
         return ProductSerializer
     
+    def cached_response(self, queryset, build, with_last_modified=False):
+        return cached_catalog_response(self.request, queryset, build, with_last_modified)
+    
+    def serialize_list(self, queryset, paginate=True):
+        """Response data of a product list: a page of it when ``paginate``.
+        Built from values() rows by products.rows unless
+        FAST_LIST_SERIALIZATION is off."""
+        fields, lang = self.get_fieldset()
+        fast = settings.FAST_LIST_SERIALIZATION
+        if fast:
+            queryset = product_rows(queryset, catalog_columns(fields, lang))
+        page = self.paginate_queryset(queryset) if paginate else None
+        rows = queryset if page is None else page
+        data = product_payloads(rows, fields, lang) if fast else self.get_serializer(rows, many=True).data
+        return data if page is None else self.get_paginated_response(data).data
+    
+    def cached_list(self, queryset):
+        return self.cached_response(queryset, lambda: self.serialize_list(queryset, paginate=False))
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.cached_response(queryset, lambda: self.serialize_list(queryset))
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            queryset = self.get_queryset().filter(pk=kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            # Not an id at all: the 404 get_object_or_404 would give
+            raise NotFound('No Product matches the given query.')
+        return self.cached_response(
+            queryset,
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data,
+            with_last_modified=True,
+        )
+    
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         category = request.query_params.get('category', None)
         if category:
-            products = self.queryset.filter(category=category)
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
+            return self.cached_list(self.get_queryset().filter(category=category))
         return Response({'error': 'Category parameter is required'}, status=400)
     
     @action(detail=False, methods=['get'])
     def new_arrivals(self, request):
-        products = self.queryset.filter(is_new=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return self.cached_list(self.get_queryset().filter(is_new=True))
     
     @action(detail=False, methods=['get'])
     def on_sale(self, request):
-        products = self.queryset.filter(is_sale=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return self.cached_list(self.get_queryset().filter(is_sale=True))
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per brand, category, size in stock, price bucket and flag for the current filters."""
+        queryset = Product.objects.all()
+        if request.query_params.get(ProductSearchFilter.search_param):
+            matches = ProductSearchFilter().filter_queryset(request, queryset, self)
+            queryset = queryset.filter(pk__in=matches.values('pk'))
+        product_filter = ProductFilter(request.query_params)
+        # Counts depend on products outside the filtered set, so validate
+        # against the whole (searched) catalog.
+        return self.cached_response(queryset, lambda: product_filter.facets(queryset))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def product_export(request, file_format):
+    """The whole catalog (or ``?created_after=`` / ``?created_before=`` a
+    date) as NDJSON or CSV, streamed a chunk of products at a time."""
+    return ProductExport.from_query_params(request.query_params).response(file_format)